@@ -1,67 +1,474 @@
-from flask import Flask, request, jsonify, render_template
-from datetime import datetime
+import base64
+import json
+import logging
+import os
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+from utils import ai_response, quiz_generator, voice_input, voice_output
+from utils.concurrency import Overloaded, llm_limiter
+from utils.lazy_import import FAST_STARTUP, preload
+from utils.llm_client import LLMError
+from utils.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from utils.metrics import registry, stage_timer
+from utils.progress import summarize_progress
+from utils.quiz_pool import quiz_pool
+from utils.quiz_prefetch import QUIZ_TICKET_WAIT, quiz_tickets
+from utils.review_scheduler import review_scheduler
+from utils.session_store import decode_cursor, get_session_store
+from utils.static_assets import PrecompressedAsset
+
+logger = logging.getLogger(__name__)
+
+_JSON_TIMER = stage_timer("json_serialize")
+VOICE_CHUNK_BYTES = 32 * 1024  # Read size for streamed /voice_ask uploads
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider that records serialization time for every jsonify()."""
+
+    def dumps(self, obj, **kwargs):
+        with _JSON_TIMER.time():
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__, template_folder="templates")
+app.json = TimedJSONProvider(app)
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    # Streaming responses are timed to the first byte; the body is still being produced
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    registry.histogram("http_request_duration_seconds", "Time to handle a request, by route.",
+                       route=route).observe(time.perf_counter() - g.request_start)
+    registry.counter("http_requests_total", "Requests handled, by route and status.",
+                     route=route, status=str(response.status_code)).inc()
+    return response
+
+# Session history lives in a persistent store shared by all workers (see utils/session_store.py)
+session_store = get_session_store()
 
-# Sample in-memory session data (you can later connect this to a DB)
-session_history = []
+# The page has no per-request content, so it is rendered once and served precompressed with an ETag
+index_page = PrecompressedAsset("index", lambda: render_template('index.html'),
+                                source_path=os.path.join(app.root_path, app.template_folder, 'index.html'))
+
+if not FAST_STARTUP:
+    # Pay for the heavy imports and the page build now rather than on the first requests
+    preload()
+    with app.app_context():
+        index_page.build()
 
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return index_page.respond(request)
+
+def _parse_bool_arg(name):
+    """Reads an optional true/false query parameter."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.route('/metrics')
+def metrics():
+    """Exposes latency histograms and counters in the Prometheus text format."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/history')
 def history():
-    return jsonify(session_history)
+    """
+    Returns session history one page at a time.
+
+    Query parameters:
+        limit: page size (default 20, max 500).
+        after: cursor (a page's next_cursor); returns older-to-newer entries after it.
+        before: cursor (a page's next_cursor); returns newer-to-older entries before it (default order).
+        since / until: inclusive ISO timestamp range.
+        has_quiz: true/false to keep only sessions with or without a quiz attempt.
+        user_id: only this user's sessions.
+        format: "ndjson" streams every matching entry as newline-delimited JSON for exports.
+    """
+    filters = {
+        "after": request.args.get('after'),
+        "before": request.args.get('before'),
+        "since": request.args.get('since'),
+        "until": request.args.get('until'),
+        "has_quiz": _parse_bool_arg('has_quiz'),
+        "user_id": request.args.get('user_id'),
+        "newest_first": request.args.get('after') is None,
+    }
+    try:
+        for cursor in (filters["after"], filters["before"]):
+            if cursor:
+                decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+
+        def generate():
+            for entry in session_store.iter_sessions(limit=limit, **filters):
+                yield json.dumps(entry) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify(session_store.query_sessions(limit=limit, **filters))
+
+@app.route('/history/search')
+def history_search():
+    """
+    Full-text search over past questions and answers, best match first (BM25).
+
+    Query parameters:
+        q: words to search for (required); the last word also matches as a prefix.
+        user_id: only this user's sessions.
+        limit: page size (default 20, max 100).
+        offset: pass the previous page's next_offset to get the next page.
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({"error": "q is required."}), 400
+    results = session_store.search_sessions(query, user_id=request.args.get('user_id'),
+                                            limit=request.args.get('limit', default=20, type=int),
+                                            offset=request.args.get('offset', default=0, type=int))
+    return jsonify(dict(results, query=query))
+
+@app.route('/analytics')
+def analytics():
+    """
+    Returns question volume and quiz accuracy over the whole history.
+
+    Query parameters:
+        group_by: "day" (default), "topic" or "user".
+        since / until: inclusive ISO date range.
+        user_id: only this user's sessions.
+        limit: maximum number of groups.
+    """
+    group_by = request.args.get('group_by', 'day')
+    try:
+        groups = session_store.analytics(group_by, request.args.get('since'), request.args.get('until'),
+                                         request.args.get('user_id'), request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"group_by": group_by, "groups": groups})
+
+@app.route('/progress')
+def progress():
+    """
+    Returns a user's progress dashboard from precomputed aggregates (no history scan).
+
+    Query parameters:
+        user_id: Firebase uid of the user (required).
+        topics: maximum number of topics to return, most recently studied first (default 20).
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    summary = summarize_progress(user_id, session_store.get_progress(user_id))
+    summary["topics"] = summary["topics"][:request.args.get('topics', default=20, type=int)]
+    return jsonify(summary)
+
+@app.errorhandler(Overloaded)
+def overloaded(error):
+    # Fail fast under overload instead of queueing without bound
+    response = jsonify({"error": f"Server is busy, please retry shortly. ({error})"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def _simulated_answer(question):
+    # Simulated AI response, used when no OpenAI key is configured
+    return f"Air is a mixture of gases like nitrogen and oxygen. You asked: '{question}'"
+
+def _simulated_quiz():
+    # Simulated quiz question and answer, used when no OpenAI key is configured
+    return {
+        "question": f"What is the main component of air?",
+        "options": ["Nitrogen", "Oxygen", "Carbon Dioxide", "Hydrogen"],
+        "answer": "Nitrogen"
+    }
+
+def _make_quiz(topic, priority=PRIORITY_INTERACTIVE):
+    """Generates a quiz for the topic, or the simulated quiz when no OpenAI key is configured."""
+    if quiz_generator.is_configured():
+        return quiz_generator.generate_quiz(topic, priority=priority)
+    return _simulated_quiz()
+
+def _prefetch_quiz(data, answer):
+    """
+    Starts quiz generation for a finished answer if the client asked for it; returns the ticket.
+
+    The quiz is speculative, so it is admitted at background priority: it waits behind
+    interactive calls and leaves them the reserved share of the rate-limit budget.
+    """
+    if not data.get('prefetch_quiz') or not answer:
+        return None
+    return quiz_tickets.submit(_make_quiz, answer, PRIORITY_BACKGROUND)
+
+def _sse_event(payload, event=None):
+    """Formats one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+def _stream_ask_ai(data, question, transcript=None):
+    """
+    Relays answer deltas to the browser as server-sent events.
+
+    The caller must already hold an llm_limiter slot; it is released when the stream ends.
+    Starts with a "transcript" event for voice questions, then emits {"delta": ...} events, then a "done" event with the full answer, which is also
+    logged to history, and a quiz_ticket when prefetch_quiz was requested. "simulated" is true
+    when no OpenAI key is configured and the answer is the canned one. Upstream failures end
+    the stream with an "error" event.
+    """
+    user_id = data.get('user_id')
+    use_cache = data.get('use_cache', True)
+    released = []
+
+    def release_slot():
+        # Runs from the generator and from response close; only the first call releases
+        if not released:
+            released.append(True)
+            llm_limiter.release()
+
+    def generate():
+        parts = []
+        try:
+            if transcript is not None:
+                yield _sse_event({"transcript": transcript}, event="transcript")
+            simulated = not ai_response.is_configured()
+            if not simulated:
+                deltas = ai_response.stream_ai_response(question, use_cache=use_cache)
+            else:
+                words = _simulated_answer(question).split(" ")
+                deltas = (word if i == 0 else " " + word for i, word in enumerate(words))
+            for delta in deltas:
+                parts.append(delta)
+                yield _sse_event({"delta": delta})
+            answer = "".join(parts)
+            entry = session_store.log_session(question, answer, user_id=user_id)
+            yield _sse_event({"answer": answer, "quiz_ticket": _prefetch_quiz(data, answer),
+                              "session": entry["timestamp"], "simulated": simulated}, event="done")
+        except LLMError as e:
+            yield _sse_event({"error": f"Error communicating with OpenAI API: {e}"}, event="error")
+        except Overloaded as e:
+            yield _sse_event({"error": f"Server is busy, please retry shortly. ({e})"}, event="error")
+        finally:
+            release_slot()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(release_slot)  # Also covers clients that disconnect before the first event
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+def _wants_stream(data):
+    return bool(data.get('stream')) or request.args.get('stream') == 'true'
+
+def _finish_ask_ai(data, question, answer, simulated=False, **extra):
+    entry = session_store.log_session(question, answer, user_id=data.get('user_id'))
+    return jsonify({"answer": answer, "quiz_ticket": _prefetch_quiz(data, answer), "session": entry["timestamp"],
+                    "simulated": simulated, **extra})
+
+def _answer(data, question, **extra):
+    """Answers a question on the calling thread (JSON, or SSE when streaming was requested)."""
+    if _wants_stream(data):
+        llm_limiter.acquire()
+        return _stream_ask_ai(data, question, **extra)
+    if not ai_response.is_configured():
+        return _finish_ask_ai(data, question, _simulated_answer(question), simulated=True, **extra)
+    with llm_limiter.slot():
+        answer = ai_response.get_ai_response(question, use_cache=data.get('use_cache', True))
+    return _finish_ask_ai(data, question, answer, **extra)
 
 @app.route('/ask_ai', methods=['POST'])
 def ask_ai():
     data = request.get_json()
-    question = data.get('question', '')
-    
-    # Simulated AI response
-    answer = f"Air is a mixture of gases like nitrogen and oxygen. You asked: '{question}'"
-
-    session = {
-        "timestamp": datetime.now().isoformat(),
-        "question": question,
-        "answer": answer
-    }
-    session_history.append(session)
+    return _answer(data, data.get('question', ''))
+
+def _quiz_from_pool(data, topic):
+    """Counts the topic towards pre-generation and returns a stocked quiz if there is one."""
+    if not data.get('use_cache', True):
+        return None
+    quiz_pool.start()  # Started lazily so forked workers each run their own refill thread
+    quiz_pool.record_request(topic)
+    return quiz_pool.take(topic)
 
-    return jsonify({"answer": answer})
+def _prefetched_quiz(future):
+    """Returns a successful prefetched quiz, or None so the caller generates one itself."""
+    if future is None or future.cancelled():
+        return None
+    try:
+        quiz = future.result()
+    except Exception as e:
+        logger.warning("Prefetched quiz failed, generating it now: %s", e)
+        return None
+    return None if "error" in quiz else quiz
 
 @app.route('/generate_quiz', methods=['POST'])
 def generate_quiz():
     data = request.get_json()
     topic = data.get('topic_or_answer', '')
 
-    # Simulated quiz question and answer (based on the topic)
-    quiz = {
-        "question": f"What is the main component of air?",
-        "options": ["Nitrogen", "Oxygen", "Carbon Dioxide", "Hydrogen"],
-        "answer": "Nitrogen"
+    future = quiz_tickets.claim(data['quiz_ticket']) if data.get('quiz_ticket') else None
+    if future is not None:
+        try:
+            future.result(timeout=QUIZ_TICKET_WAIT)
+        except (FutureTimeoutError, CancelledError):
+            future.cancel()
+        except Exception:
+            pass  # Logged by _prefetched_quiz
+        quiz = _prefetched_quiz(future) if future.done() else None
+        if quiz is not None:
+            return jsonify(quiz)
+    if not quiz_generator.is_configured():
+        return jsonify(_simulated_quiz())
+    quiz = _quiz_from_pool(data, topic)
+    if quiz is not None:
+        return jsonify(quiz)
+    with llm_limiter.slot():
+        quiz = quiz_generator.generate_quiz(topic, use_cache=data.get('use_cache', True))
+    return jsonify(quiz)
+
+@app.route('/quiz_ticket/<ticket>', methods=['DELETE'])
+def cancel_quiz_ticket(ticket):
+    """Cancels a prefetched quiz the client will not ask for."""
+    if quiz_tickets.cancel(ticket):
+        return jsonify({"message": "Quiz ticket cancelled."})
+    return jsonify({"error": "Unknown or expired quiz ticket."}), 404
+
+@app.route('/generate_quiz_batch', methods=['POST'])
+def generate_quiz_batch():
+    """
+    Generates several quiz questions for one topic in a single upstream completion.
+
+    JSON body: {"topic_or_answer": str, "count": int (1-20, default 5)}.
+    Returns {"questions": [...]}, or {"error": ...} with status 502 if none could be generated.
+    """
+    data = request.get_json()
+    topic = data.get('topic_or_answer', '')
+    count = max(1, min(int(data.get('count', 5)), quiz_generator.MAX_BATCH_SIZE))
+
+    if not quiz_generator.is_configured():
+        return jsonify({"questions": [_simulated_quiz() for _ in range(count)]})
+    with llm_limiter.slot():
+        result = quiz_generator.generate_quiz_batch(topic, count)
+    if "error" in result:
+        return jsonify(result), 502
+    return jsonify(result)
+
+@app.route('/voice_ask', methods=['POST'])
+def voice_ask():
+    """
+    Answers a spoken question uploaded as a (chunked) request body.
+
+    Body: 16-bit mono PCM, raw (rate from ?sample_rate=, default 16 kHz) or as a WAV file.
+    Audio is transcribed incrementally while it uploads; the transcript then goes through the
+    same answer path as /ask_ai. Query options: user_id, prefetch_quiz=true, stream=true.
+    Returns {"transcript", "answer", "quiz_ticket"} (or an SSE stream starting with a
+    "transcript" event), or 400 if the audio is unsupported or contains no speech.
+    """
+    data = {
+        "user_id": request.args.get('user_id'),
+        "prefetch_quiz": request.args.get('prefetch_quiz') == 'true',
     }
+    sample_rate = request.args.get('sample_rate', type=int)
+    try:
+        transcriber = voice_input.StreamingTranscriber(sample_rate=sample_rate)
+        while True:
+            chunk = request.stream.read(VOICE_CHUNK_BYTES)
+            if not chunk:
+                break
+            transcriber.feed(chunk)
+        transcript = transcriber.finish()
+    except voice_input.AudioFormatError as e:
+        return jsonify({"error": str(e)}), 400
+    if not transcript:
+        return jsonify({"error": "No speech detected."}), 400
+    return _answer(data, transcript, transcript=transcript)
 
-    return jsonify(quiz)
+@app.route('/speak', methods=['POST'])
+def speak():
+    """
+    Streams synthesized speech for a text, one server-sent event per sentence.
+
+    JSON body: {"text": str, "engine": "pyttsx3" | "omnidimension" (optional), "voice": str (optional)}.
+    Each event carries {"index", "sentence", "audio" (base64)} as soon as that sentence is
+    ready, so playback can start before the whole answer is rendered; a "done" event ends
+    the stream. Repeated sentences come from the on-disk audio cache.
+    """
+    data = request.get_json()
+    text = data.get('text', '')
+    engine_type = data.get('engine', voice_output.TTS_ENGINE)
+    voice = data.get('voice')
+    if engine_type not in voice_output.SUPPORTED_ENGINES:
+        return jsonify({"error": f"Unsupported engine type: {engine_type}"}), 400
+
+    def generate():
+        count = 0
+        try:
+            for count, (sentence, audio) in enumerate(voice_output.stream_text_to_audio(text, engine_type, voice), 1):
+                yield _sse_event({"index": count - 1, "sentence": sentence,
+                                  "audio": base64.b64encode(audio).decode("ascii")})
+        except Exception as e:
+            yield _sse_event({"error": f"Speech synthesis failed: {e}"}, event="error")
+            return
+        yield _sse_event({"sentences": count}, event="done")
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/log_quiz_attempt', methods=['POST'])
 def log_quiz_attempt():
+    """
+    Records a graded quiz attempt for the question it was generated from.
+
+    JSON body: {"question": str, "quiz_attempt": {...}, "user_id": str, "session": str}, where
+    session is the timestamp /ask_ai returned for the answered question. The answer itself is
+    already in history, so the attempt is logged without it and counts only as an attempt.
+    """
     data = request.get_json()
     question = data.get('question')
-    answer = data.get('answer')
-    quiz_attempt = data.get('quiz_attempt')
+    quiz_attempt = dict(data.get('quiz_attempt') or {})
+    if data.get('session'):
+        quiz_attempt['session'] = data['session']
+
+    reviews = _reviews()  # Seeded before logging so this attempt is not counted twice
 
     # Add to session history
-    session = {
-        "timestamp": datetime.now().isoformat(),
-        "question": question,
-        "answer": answer,
-        "quiz_attempt": quiz_attempt
-    }
-    session_history.append(session)
+    entry = session_store.log_session(question, None, quiz_attempt, user_id=data.get('user_id'))
+    reviews.record_attempts([entry])
 
     return jsonify({"message": "Quiz attempt logged successfully."})
 
+def _reviews():
+    """The review scheduler, seeded from the logged quiz attempts on first use."""
+    review_scheduler.bootstrap(lambda: session_store.iter_sessions(has_quiz=True))
+    return review_scheduler
+
+@app.route('/due_reviews')
+def due_reviews():
+    """
+    Returns the quiz questions a user should review next (SM-2 spaced repetition).
+
+    Query parameters:
+        user_id: Firebase uid of the user (required).
+        limit: maximum number of items, most overdue first (default 10, max 100).
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    limit = max(1, min(request.args.get('limit', default=10, type=int), 100))
+    return jsonify({"user_id": user_id, "reviews": _reviews().due_reviews(user_id, limit)})
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True)
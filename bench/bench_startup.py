@@ -0,0 +1,97 @@
+# bench_startup.py
+# Cold-start benchmark: how long a fresh worker takes to import the app and answer its first
+# request, in fast-startup mode (heavy modules imported on first use) and eager mode, plus the
+# steady-state cost of serving / precompressed versus rendering the template per request.
+#
+# Usage (from the repository root):
+#   python -m bench.bench_startup --runs 20
+#   python -m bench.bench_startup --runs 50 --samples 2000
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.common import format_summary, summarize, time_calls
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in each fresh interpreter; prints its own timings as JSON
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+assert response.status_code == 200
+print(json.dumps({"import_s": imported - start, "first_request_s": time.perf_counter() - imported,
+                  "heavy_loaded": sorted(m for m in ("requests", "pyttsx3", "faster_whisper")
+                                         if m in sys.modules)}))
+"""
+
+def _spawn(mode_env: dict, scratch: str) -> dict:
+    """Starts one interpreter like a new worker would and returns its timings."""
+    env = dict(os.environ, PYTHONPATH=ROOT, SESSION_DB_PATH=os.path.join(scratch, "sessions.db"),
+               SEARCH_DB_PATH=os.path.join(scratch, "search.db"), **mode_env)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", _PROBE], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["spawn_s"] = time.perf_counter() - start
+    return result
+
+def run_cold_start(runs: int):
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    try:
+        modes = {"fast startup (FAST_STARTUP=1)": {"FAST_STARTUP": "1"},
+                 "eager imports (FAST_STARTUP=0)": {"FAST_STARTUP": "0"}}
+        _spawn(modes["fast startup (FAST_STARTUP=1)"], scratch)  # Warm the OS cache and bytecode files
+        for name, mode_env in modes.items():
+            results = [_spawn(mode_env, scratch) for _ in range(runs)]
+            print(f"\n[{name}] heavy modules loaded at startup: {', '.join(results[0]['heavy_loaded']) or 'none'}")
+            print(format_summary("worker spawn to first response", summarize([r["spawn_s"] for r in results])))
+            print(format_summary("import app", summarize([r["import_s"] for r in results])))
+            print(format_summary("first / request", summarize([r["first_request_s"] for r in results])))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def run_index(samples: int):
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    os.environ.setdefault("SESSION_DB_PATH", os.path.join(scratch, "sessions.db"))
+    try:
+        from flask import render_template
+
+        import app
+
+        # The previous route, for comparison; rules must be added before the first request
+        app.app.add_url_rule("/bench-render-template", "bench_render_template",
+                             lambda: render_template("index.html"))
+        client = app.app.test_client()
+        gzip_headers = {"Accept-Encoding": "gzip"}
+        etag = client.get("/", headers=gzip_headers).headers["ETag"]
+        print("\n[/ per request] variants: "
+              + ", ".join(f"{encoding} {size:,} bytes" for encoding, size in app.index_page.get_stats().items()))
+
+        print(format_summary("GET / render_template (previous)", summarize(time_calls(
+            lambda: client.get("/bench-render-template"), samples))))
+        print(format_summary("GET / precompressed (identity)", summarize(time_calls(
+            lambda: client.get("/"), samples))))
+        print(format_summary("GET / precompressed (gzip)", summarize(time_calls(
+            lambda: client.get("/", headers=gzip_headers), samples))))
+        print(format_summary("GET / revalidation (304)", summarize(time_calls(
+            lambda: client.get("/", headers=dict(gzip_headers, **{"If-None-Match": etag})), samples))))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark worker cold start and / latency.")
+    parser.add_argument("--runs", type=int, default=20, help="Fresh interpreters started per mode.")
+    parser.add_argument("--samples", type=int, default=1000, help="Requests per / measurement.")
+    args = parser.parse_args()
+
+    run_cold_start(args.runs)
+    run_index(args.samples)
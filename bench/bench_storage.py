@@ -0,0 +1,134 @@
+# bench_storage.py
+# Microbenchmarks for session logging, /history queries, search, analytics and serialization.
+#
+# Usage (from the repository root):
+#   python -m bench.bench_storage --sessions 10000 100000
+#   python -m bench.bench_storage --sessions 1000000 --backends sqlite
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.common import format_summary, summarize, time_calls
+from utils import tracker
+from utils.session_store import SQLiteSessionStore, TrackerSessionStore, WriteBehindSessionStore
+
+def _synthetic_sessions(count: int, start: datetime):
+    """Yields realistic-looking session entries with increasing timestamps."""
+    for i in range(count):
+        quiz = {}
+        if i % 3 == 0:
+            quiz = {"quiz_question": f"Question {i}?", "selected_option": "A",
+                    "correct_answer": "A" if i % 2 else "B", "is_correct": bool(i % 2)}
+        yield {
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            "question": f"Explain topic number {i % 500} in simple terms.",
+            "answer": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            "quiz_attempt": quiz,
+            "user_id": f"user-{i % 100}"
+        }
+
+def _prefill(store, count: int, batch: int = 5000):
+    start = datetime(2025, 1, 1)
+    entries = []
+    for entry in _synthetic_sessions(count, start):
+        entries.append(entry)
+        if len(entries) == batch:
+            store.append_sessions(entries)
+            entries = []
+    if entries:
+        store.append_sessions(entries)
+    return (start + timedelta(seconds=count // 2)).isoformat()
+
+def _point_tracker_at(directory: str):
+    """Redirects utils/tracker.py to a scratch directory (the real history is left untouched)."""
+    with tracker._lock:
+        tracker._close_writer_locked()
+    tracker.DATA_DIR = directory
+    tracker.LOG_DIR = os.path.join(directory, "history")
+    tracker.HISTORY_FILE = os.path.join(directory, "history.json")
+    tracker._migrated = False
+    tracker._sharded = False
+
+def run(backend: str, sessions: int, samples: int, full_read: bool):
+    scratch = tempfile.mkdtemp(prefix="bench-storage-")
+    try:
+        if backend == "file":
+            _point_tracker_at(scratch)
+            store = TrackerSessionStore()
+        else:
+            store = SQLiteSessionStore(db_path=os.path.join(scratch, "sessions.db"))
+
+        start = time.perf_counter()
+        middle = _prefill(store, sessions)
+        prefill = time.perf_counter() - start
+        print(f"\n[{backend}] {sessions} sessions prefilled in {prefill:.2f}s "
+              f"({sessions / prefill:,.0f} sessions/s)")
+
+        print(format_summary("log_session (append one)", summarize(time_calls(
+            lambda: store.log_session("Benchmark question?", "Benchmark answer.", user_id="bench"), samples))))
+        queued = WriteBehindSessionStore(store, os.path.join(scratch, "spool"))
+        print(format_summary("log_session (write-behind queue)", summarize(time_calls(
+            lambda: queued.log_session("Benchmark question?", "Benchmark answer.", user_id="bench"), samples))))
+        start = time.perf_counter()
+        queued.queue.close()
+        print(f"write-behind queue drained in {time.perf_counter() - start:.3f}s "
+              f"({queued.queue.get_stats()['commits']} group commits)")
+        print(format_summary("history newest page (limit=20)", summarize(time_calls(
+            lambda: store.query_sessions(limit=20, newest_first=True), samples))))
+        print(format_summary("history cursor page (after=middle)", summarize(time_calls(
+            lambda: store.query_sessions(limit=20, after=middle), samples))))
+        print(format_summary("history user + has_quiz page", summarize(time_calls(
+            lambda: store.query_sessions(limit=20, user_id="user-7", has_quiz=True, newest_first=True), samples))))
+
+        print(format_summary("search rare word (0.2% match)", summarize(time_calls(
+            lambda: store.search_sessions("137"), samples))))
+        print(format_summary("search rare word, page 5", summarize(time_calls(
+            lambda: store.search_sessions("137", offset=80), samples))))
+        print(format_summary("search rare + common word", summarize(time_calls(
+            lambda: store.search_sessions("number 137"), samples))))
+        print(format_summary("search user + rare word", summarize(time_calls(
+            lambda: store.search_sessions("137", user_id="user-37"), samples))))
+        print(format_summary("search common word (100% match)", summarize(time_calls(
+            lambda: store.search_sessions("lorem"), max(3, samples // 20)))))
+
+        print(format_summary("analytics by day", summarize(time_calls(
+            lambda: store.analytics("day"), max(3, samples // 20)))))
+        if backend == "file":
+            start = time.perf_counter()
+            compacted = tracker.compact_segments()
+            print(f"compacted {compacted} segments into columnar archives in {time.perf_counter() - start:.2f}s")
+            print(format_summary("analytics by day (archives)", summarize(time_calls(
+                lambda: store.analytics("day"), max(3, samples // 20)))))
+            print(format_summary("analytics by topic, one user", summarize(time_calls(
+                lambda: store.analytics("topic", user_id="user-7"), max(3, samples // 20)))))
+
+        page = store.query_sessions(limit=20, newest_first=True)
+        print(format_summary("serialize one page (json.dumps)", summarize(time_calls(
+            lambda: json.dumps(page), samples))))
+
+        if full_read:
+            print(format_summary("get_all_sessions (full scan)", summarize(time_calls(
+                store.get_all_sessions, 3))))
+            history = store.get_all_sessions()
+            print(format_summary("serialize full history (json.dumps)", summarize(time_calls(
+                lambda: json.dumps(history), 3)), extra=f"{len(json.dumps(history)) / 1e6:.1f} MB"))
+    finally:
+        if backend == "file":
+            tracker.clear_all_sessions()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark session logging and history queries.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10000], help="History sizes to test.")
+    parser.add_argument("--samples", type=int, default=200, help="Calls per measurement.")
+    parser.add_argument("--backends", nargs="+", default=["file", "sqlite"], choices=["file", "sqlite"])
+    parser.add_argument("--no-full-read", action="store_true", help="Skip the full-history scan and dump.")
+    args = parser.parse_args()
+
+    for size in args.sessions:
+        for name in args.backends:
+            run(name, size, args.samples, not args.no_full_read)
@@ -0,0 +1,42 @@
+# common.py
+# Shared helpers for the benchmark scripts in bench/.
+import math
+import time
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Returns the q-quantile (0-1) of an already sorted list using nearest-rank."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: list) -> dict:
+    """Summarizes latencies in seconds as count, mean, p50/p95/p99 and max (milliseconds)."""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": 1000 * sum(values) / len(values),
+        "p50_ms": 1000 * percentile(values, 0.50),
+        "p95_ms": 1000 * percentile(values, 0.95),
+        "p99_ms": 1000 * percentile(values, 0.99),
+        "max_ms": 1000 * values[-1],
+    }
+
+def format_summary(name: str, summary: dict, extra: str = "") -> str:
+    """Formats a summarize() result as one aligned report line."""
+    if not summary.get("count"):
+        return f"{name:<36} no samples"
+    return (f"{name:<36} n={summary['count']:<7} mean={summary['mean_ms']:9.3f}ms "
+            f"p50={summary['p50_ms']:9.3f}ms p95={summary['p95_ms']:9.3f}ms "
+            f"p99={summary['p99_ms']:9.3f}ms max={summary['max_ms']:9.3f}ms {extra}").rstrip()
+
+def time_calls(fn, repeat: int) -> list:
+    """Calls fn() repeat times and returns the per-call latencies in seconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
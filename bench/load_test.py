@@ -0,0 +1,154 @@
+# load_test.py
+# Closed-loop HTTP load generator for the Flask routes.
+#
+# Each worker thread sends one request, waits for the full response, then sends the next,
+# so throughput and tail latency reflect the server at the chosen concurrency.
+#
+# Usage (from the repository root):
+#   # Start the app in-process against the local mock LLM (0.5s time to first token)
+#   python -m bench.load_test --spawn --mock-latency 0.5 --concurrency 1 8 32 --duration 20
+#   # Or target an already running server
+#   python -m bench.load_test --url http://127.0.0.1:5000 --scenario history --concurrency 16
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from bench.common import format_summary, summarize
+
+# Request bodies for each scenario: (method, path, json body, query params, stream response)
+SCENARIOS = {
+    "ask_ai": ("POST", "/ask_ai", {"question": "What is photosynthesis?", "use_cache": False}, None, False),
+    "ask_ai_cached": ("POST", "/ask_ai", {"question": "What is photosynthesis?"}, None, False),
+    "ask_ai_stream": ("POST", "/ask_ai", {"question": "What is photosynthesis?", "stream": True,
+                                          "use_cache": False}, None, True),
+    "generate_quiz": ("POST", "/generate_quiz", {"topic_or_answer": "Photosynthesis", "use_cache": False}, None, False),
+    "history": ("GET", "/history", None, {"limit": 20}, False),
+}
+
+def spawn_server(mock_options: dict, data_dir: str):
+    """
+    Starts the mock LLM and the Flask app (threaded werkzeug server) in this process.
+
+    The app is pointed at the mock through the same environment variables used in
+    production, and at a scratch data directory so the real history is left untouched.
+
+    Returns:
+        tuple: (base_url, shutdown) where shutdown() stops both servers.
+    """
+    from werkzeug.serving import make_server
+    from utils.mock_llm_server import start_mock_server
+
+    mock, mock_url = start_mock_server(**mock_options)
+    os.environ.update({
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_API_ENDPOINT": mock_url,
+        "OPENAI_API_KEY_QUIZ": "bench-key",
+        "OPENAI_QUIZ_ENDPOINT": mock_url,
+        "SESSION_DB_PATH": os.path.join(data_dir, "sessions.db"),
+        "MAX_CONCURRENT_LLM_REQUESTS": os.environ.get("MAX_CONCURRENT_LLM_REQUESTS", "256"),
+        "LLM_REQUEST_QUEUE_DEPTH": os.environ.get("LLM_REQUEST_QUEUE_DEPTH", "1024"),
+        "LLM_RPM": os.environ.get("LLM_RPM", "0"),  # Measure the server, not the provider budget
+        "LLM_TPM": os.environ.get("LLM_TPM", "0"),
+    })
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # No access log line per request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def shutdown():
+        server.shutdown()
+        mock.shutdown()
+    return f"http://127.0.0.1:{server.server_port}", shutdown
+
+def _send(session, base_url: str, scenario: tuple, timeout: float) -> int:
+    method, path, body, params, stream = scenario
+    response = session.request(method, base_url + path, json=body, params=params, timeout=timeout, stream=stream)
+    with response:
+        if stream:
+            for _ in response.iter_content(chunk_size=None):
+                pass
+        else:
+            response.content
+    return response.status_code
+
+def run_load(base_url: str, scenario: str, concurrency: int, duration: float, timeout: float = 60.0) -> dict:
+    """
+    Drives one scenario with a fixed number of closed-loop workers for a fixed time.
+
+    Returns:
+        dict: summarize() of successful latencies plus throughput and a status/error histogram.
+    """
+    spec = SCENARIOS[scenario]
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local_latencies, local_statuses = [], Counter()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = _send(session, base_url, spec, timeout)
+            except requests.RequestException as e:
+                local_statuses[type(e).__name__] += 1
+                continue
+            local_statuses[status] += 1
+            if status == 200:
+                local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies)
+    result["throughput"] = len(latencies) / elapsed
+    result["statuses"] = dict(statuses)
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Closed-loop load test for the Flask routes.")
+    parser.add_argument("--url", help="Base URL of a running server (default: spawn one in-process).")
+    parser.add_argument("--spawn", action="store_true", help="Run the app in-process against the mock LLM.")
+    parser.add_argument("--scenario", nargs="+", default=["ask_ai", "ask_ai_stream", "generate_quiz", "history"],
+                        choices=sorted(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario and concurrency level.")
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="Mock time to first token in seconds.")
+    parser.add_argument("--mock-token-latency", type=float, default=0.0, help="Mock delay between streamed tokens.")
+    parser.add_argument("--mock-rate-limit-ratio", type=float, default=0.0, help="Fraction of mock calls answered 429.")
+    args = parser.parse_args()
+
+    shutdown = None
+    base_url = args.url
+    if base_url is None or args.spawn:
+        data_dir = tempfile.mkdtemp(prefix="bench-load-")
+        base_url, shutdown = spawn_server({"latency": args.mock_latency, "token_latency": args.mock_token_latency,
+                                           "rate_limit_ratio": args.mock_rate_limit_ratio}, data_dir)
+        print(f"Serving the app at {base_url} (mock latency {args.mock_latency}s, data in {data_dir})")
+
+    try:
+        for scenario in args.scenario:
+            for concurrency in args.concurrency:
+                result = run_load(base_url, scenario, concurrency, args.duration)
+                errors = {k: v for k, v in result["statuses"].items() if k != 200}
+                extra = f"{result['throughput']:8.1f} req/s" + (f" errors={errors}" if errors else "")
+                print(format_summary(f"{scenario} c={concurrency}", result, extra=extra))
+    finally:
+        if shutdown is not None:
+            shutdown()
@@ -0,0 +1,84 @@
+# conftest.py
+# Shared fixtures for the test suite. Every storage path is pointed at a scratch directory
+# before the app modules read their settings, so running the tests never touches data/.
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix="vibethon-tests-")
+atexit.register(shutil.rmtree, SCRATCH, True)  # Registered first, so it runs after the write-behind drain
+os.environ.update({
+    "SESSION_DB_PATH": os.path.join(SCRATCH, "sessions.db"),
+    "SEARCH_DB_PATH": os.path.join(SCRATCH, "search.db"),
+    "REVIEW_DB": os.path.join(SCRATCH, "reviews", "reviews.db"),
+    "TTS_CACHE_DIR": os.path.join(SCRATCH, "tts_cache"),
+    "QUIZ_POOL_DB": os.path.join(SCRATCH, "quiz_pool.db"),
+    "QUIZ_TICKET_DB": os.path.join(SCRATCH, "quiz_tickets.db"),
+    "LLM_BUDGET_STATE": os.path.join(SCRATCH, "llm-budget.json"),
+    "LLM_RPM": "0",  # The app's shared budget is unlimited; scheduler tests build their own
+    "LLM_TPM": "0",
+    "LLM_BACKOFF_BASE": "0.01",
+})
+
+from utils import tracker  # noqa: E402  (after the environment is set)
+
+def point_tracker_at(directory: str):
+    """Redirects utils/tracker.py to a directory."""
+    with tracker._lock:
+        tracker._close_writer_locked()
+    tracker.DATA_DIR = directory
+    tracker.LOG_DIR = os.path.join(directory, "history")
+    tracker.HISTORY_FILE = os.path.join(directory, "history.json")
+    tracker._migrated = False
+    tracker._sharded = False
+
+point_tracker_at(SCRATCH)
+
+@pytest.fixture
+def mock_llm():
+    """Starts mock LLM servers: mock_llm(**options) returns (config, url) and they stop after the test."""
+    from utils.mock_llm_server import start_mock_server
+
+    servers = []
+
+    def start(**options):
+        server, url = start_mock_server(**options)
+        servers.append(server)
+        return server.config, url
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def llm_app(mock_llm, monkeypatch):
+    """
+    Returns a function that points the answer and quiz modules at a fresh mock LLM.
+
+    llm_app(**mock_options) returns (app module, mock config).
+    """
+    import app
+    from utils import ai_response, quiz_generator
+
+    def configure(**options):
+        config, url = mock_llm(**options)
+        monkeypatch.setattr(ai_response, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(ai_response, "OPENAI_API_ENDPOINT", url)
+        monkeypatch.setattr(quiz_generator, "OPENAI_API_KEY_QUIZ", "test-key")
+        monkeypatch.setattr(quiz_generator, "OPENAI_QUIZ_ENDPOINT", url)
+        return app, config
+    return configure
+
+@pytest.fixture
+def tracker_dir(tmp_path):
+    """Points utils/tracker.py at an empty directory for one test."""
+    point_tracker_at(str(tmp_path))
+    yield str(tmp_path)
+    point_tracker_at(SCRATCH)
@@ -0,0 +1,109 @@
+# test_app.py
+# Route-level tests through Flask's test client, with the LLM modules pointed at the mock server.
+import gzip
+import json
+
+import pytest
+
+def _events(body: bytes) -> list:
+    """Parses a server-sent event stream into (event name, payload) pairs."""
+    events = []
+    for block in body.decode("utf-8").split("\n\n"):
+        if not block:
+            continue
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+@pytest.fixture
+def client(llm_app):
+    app, config = llm_app()
+    return app.app.test_client()
+
+def test_ask_ai_returns_and_logs_the_answer(client):
+    response = client.post("/ask_ai", json={"question": "What is a cell?", "user_id": "app-ask", "use_cache": False})
+    assert response.status_code == 200
+    assert response.get_json()["answer"] == "Mock answer: What is a cell?"
+    history = client.get("/history", query_string={"user_id": "app-ask"}).get_json()
+    assert [entry["question"] for entry in history["sessions"]] == ["What is a cell?"]
+
+def test_ask_ai_stream_framing(client):
+    response = client.post("/ask_ai", json={"question": "What is a cell?", "stream": True, "use_cache": False})
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    events = _events(response.data)
+    deltas = [payload["delta"] for name, payload in events[:-1]]
+    assert all(name == "message" for name, _ in events[:-1])
+    name, done = events[-1]
+    assert name == "done"
+    assert "".join(deltas) == done["answer"] == "Mock answer: What is a cell?"
+    assert done["simulated"] is False
+
+def test_ask_ai_stream_reports_upstream_errors(llm_app):
+    app, _ = llm_app(fail_first=100)
+    response = app.app.test_client().post("/ask_ai", json={"question": "Will this fail?", "stream": True,
+                                                           "use_cache": False})
+    assert response.status_code == 200
+    name, payload = _events(response.data)[-1]
+    assert name == "error" and "429" in payload["error"]
+
+def test_history_ndjson_export(client):
+    for i in range(3):
+        client.post("/log_quiz_attempt", json={"question": f"Export {i}", "answer": "A", "user_id": "app-export"})
+    response = client.get("/history", query_string={"user_id": "app-export", "format": "ndjson"})
+    assert [json.loads(line)["question"] for line in response.data.splitlines()] == [
+        "Export 2", "Export 1", "Export 0"]
+
+def test_generate_quiz_batch(client):
+    response = client.post("/generate_quiz_batch", json={"topic_or_answer": "Air", "count": 3})
+    assert len(response.get_json()["questions"]) == 3
+
+def test_home_page_is_precompressed_and_revalidated(client):
+    plain = client.get("/")
+    zipped = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == plain.data
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+    assert "Accept-Encoding" in zipped.headers["Vary"]
+    cached = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["ETag"]})
+    assert cached.status_code == 304 and cached.data == b""
+
+def test_metrics_endpoint(client):
+    client.get("/")
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'http_requests_total{route="/",status="200"}' in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+
+def test_quiz_attempts_feed_due_reviews(client):
+    attempt = {"quiz_question": "What is the powerhouse of the cell?", "selected_option": "Nucleus",
+               "correct_answer": "Mitochondria", "is_correct": False}
+    client.post("/log_quiz_attempt", json={"question": "Cells", "answer": "A", "quiz_attempt": attempt,
+                                           "user_id": "app-review"})
+    assert client.get("/due_reviews").status_code == 400
+    reviews = client.get("/due_reviews", query_string={"user_id": "app-review"}).get_json()["reviews"]
+    assert reviews == []  # Due again after REVIEW_LAPSE_DELAY
+    progress = client.get("/progress", query_string={"user_id": "app-review"}).get_json()
+    assert progress["totals"]["attempts"] == 1 and progress["totals"]["accuracy"] == 0
+
+def test_quiz_attempt_refers_to_the_answered_session(client):
+    answered = client.post("/ask_ai", json={"question": "What is ATP?", "user_id": "app-attempt"}).get_json()
+    attempt = {"quiz_question": "ATP stores?", "selected_option": "Energy", "correct_answer": "Energy",
+               "is_correct": True}
+    client.post("/log_quiz_attempt", json={"question": "What is ATP?", "session": answered["session"],
+                                           "quiz_attempt": attempt, "user_id": "app-attempt"})
+    history = client.get("/history", query_string={"user_id": "app-attempt"}).get_json()["sessions"]
+    assert [entry["answer"] for entry in history] == [None, answered["answer"]]  # The answer is logged once
+    assert history[0]["quiz_attempt"]["session"] == answered["session"]
+    totals = client.get("/progress", query_string={"user_id": "app-attempt"}).get_json()["totals"]
+    assert (totals["questions"], totals["attempts"]) == (1, 1)
+
+def test_history_rejects_a_malformed_cursor(client):
+    assert client.get("/history", query_string={"before": "2026-01-01T00:00:00~x"}).status_code == 400
+
+def test_ask_ai_flags_the_canned_answer_without_a_key(client, monkeypatch):
+    from utils import ai_response
+    monkeypatch.setattr(ai_response, "OPENAI_API_KEY", None)
+    answer = client.post("/ask_ai", json={"question": "What is air?"}).get_json()
+    assert answer["simulated"] is True
+    name, done = _events(client.post("/ask_ai", json={"question": "What is air?", "stream": True}).data)[-1]
+    assert name == "done" and done["simulated"] is True
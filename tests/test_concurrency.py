@@ -0,0 +1,69 @@
+# test_concurrency.py
+import asyncio
+import threading
+
+import pytest
+
+from utils.concurrency import ConcurrencyLimiter, Overloaded
+
+def test_full_queue_is_rejected_immediately():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=5)
+    limiter.acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    limiter.release()
+    assert limiter.get_stats() == {"active": 0, "waiting": 0, "rejected": 1}
+
+def test_queued_request_times_out():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    limiter.acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    assert limiter.get_stats()["waiting"] == 0
+
+def test_release_hands_the_slot_to_a_waiter():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=5)
+    limiter.acquire()
+    entered = threading.Event()
+
+    def wait_for_slot():
+        with limiter.slot():
+            entered.set()
+
+    thread = threading.Thread(target=wait_for_slot)
+    thread.start()
+    assert not entered.wait(0.05)
+    limiter.release()
+    assert entered.wait(5)
+    thread.join(5)
+    assert limiter.get_stats()["active"] == 0
+
+def test_async_slot():
+    limiter = ConcurrencyLimiter(max_concurrent=2, max_queue=4, queue_timeout=5)
+    peak = []
+
+    async def call():
+        async with limiter.async_slot():
+            peak.append(limiter.get_stats()["active"])
+            await asyncio.sleep(0.02)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+    assert max(peak) <= 2
+    assert limiter.get_stats() == {"active": 0, "waiting": 0, "rejected": 0}
+
+def test_cancelled_async_acquire_gives_its_slot_back():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=4, queue_timeout=5)
+    limiter.acquire()
+
+    async def main():
+        waiter = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()  # The abandoned waiter thread takes this slot and must hand it back
+    asyncio.run(main())  # Returns once the waiter thread has finished
+    assert limiter.get_stats() == {"active": 0, "waiting": 0, "rejected": 0}
@@ -0,0 +1,29 @@
+# test_history_archive.py
+from utils import history_archive
+
+ENTRIES = [
+    {"timestamp": "2026-01-01T09:00:00", "question": "What is ATP?", "answer": "Energy.", "quiz_attempt": {},
+     "user_id": "u1"},
+    {"timestamp": "2026-01-01T09:05:00", "question": "What is ATP?", "answer": "Energy.",
+     "quiz_attempt": {"is_correct": True}, "user_id": "u1"},
+    {"timestamp": "2026-01-02T09:00:00", "question": "What is DNA?", "answer": "Genes.",
+     "quiz_attempt": {"is_correct": False}, "user_id": "u2", "source": "voice"},
+]
+
+def test_archive_round_trip(tmp_path):
+    path = str(tmp_path / "segment.col")
+    header = history_archive.write_archive(path, ENTRIES)
+    assert header["rows"] == 3
+    assert history_archive.read_header(path)["last_timestamp"] == "2026-01-02T09:00:00"
+    assert history_archive.read_entries(path) == ENTRIES
+
+def test_analytics_groups(tmp_path):
+    path = str(tmp_path / "segment.col")
+    history_archive.write_archive(path, ENTRIES)
+    columns = [history_archive.ArchiveReader(path).columns()]
+    by_day = history_archive.analytics(columns, "day")
+    assert [(g["key"], g["questions"], g["attempts"], g["correct"]) for g in by_day] == [
+        ("2026-01-01", 1, 1, 1), ("2026-01-02", 0, 1, 0)]
+    by_user = history_archive.analytics([history_archive.build_columns(ENTRIES)], "user", user_id="u2")
+    assert [g["key"] for g in by_user] == ["u2"]
+    assert history_archive.analytics(columns, "day", since="2026-01-02")[0]["key"] == "2026-01-02"
@@ -0,0 +1,24 @@
+# test_lazy_import.py
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+from utils import lazy_import
+
+def test_optional_import_remembers_missing_modules():
+    assert lazy_import.optional_import("json") is json
+    assert lazy_import.optional_import("no_such_module_for_tests") is None
+    assert "no_such_module_for_tests" in lazy_import._missing
+    assert lazy_import.preload(("json", "no_such_module_for_tests")) == {"json": True, "no_such_module_for_tests": False}
+
+def test_fast_startup_defers_heavy_modules(tmp_path):
+    probe = ("import json, sys; import app; "
+             "print(json.dumps(sorted(m for m in ('requests', 'pyttsx3', 'faster_whisper') "
+             "if m in sys.modules)))")
+    env = dict(os.environ, PYTHONPATH=ROOT, FAST_STARTUP="1", SESSION_DB_PATH=str(tmp_path / "sessions.db"),
+               SEARCH_DB_PATH=str(tmp_path / "search.db"), REVIEW_DB=str(tmp_path / "reviews.db"))
+    output = subprocess.run([sys.executable, "-c", probe], cwd=str(tmp_path), env=env, check=True,
+                            capture_output=True, text=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
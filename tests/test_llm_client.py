@@ -0,0 +1,59 @@
+# test_llm_client.py
+import time
+
+import pytest
+
+from utils import llm_client
+from utils.llm_client import LLMClient, LLMError
+from utils.llm_scheduler import LLMScheduler, estimate_tokens
+
+PAYLOAD = {"model": "test-model", "messages": [{"role": "user", "content": "What is osmosis?"}], "max_tokens": 50}
+TPM = 100000
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A private budget for the client under test, so admissions can be counted."""
+    scheduler = LLMScheduler(rpm=1000, tpm=TPM)
+    scheduler._budget_locked("test-model").tokens.rate = 1e-9  # No refill, so refunds show exactly
+    monkeypatch.setattr(llm_client, "llm_scheduler", scheduler)
+    return scheduler
+
+@pytest.fixture
+def client():
+    client = LLMClient(max_retries=3, backoff_base=0.01)
+    yield client
+    client.close()
+
+def test_429_is_retried_and_every_attempt_is_admitted(mock_llm, scheduler, client):
+    config, url = mock_llm(fail_first=2, retry_after=0.1)
+    start = time.monotonic()
+    response = client.chat_completion(PAYLOAD, "test-key", url)
+    assert response["choices"][0]["message"]["content"].startswith("Mock answer:")
+    assert config.requests == 3
+    assert time.monotonic() - start >= 0.2  # Waited out Retry-After on both 429s
+    stats = scheduler.get_stats()
+    assert stats["interactive"] == 3
+    # The two rejected attempts were refunded; the successful one was settled from usage
+    assert stats["tokens_available"]["test-model"] == pytest.approx(TPM - response["usage"]["total_tokens"], abs=2)
+
+def test_connection_errors_are_raised_and_refunded(scheduler, client):
+    with pytest.raises(LLMError):
+        client.chat_completion(PAYLOAD, "test-key", "http://127.0.0.1:9/v1/chat/completions")
+    assert scheduler.get_stats()["interactive"] == client.max_retries + 1
+    assert scheduler.get_stats()["tokens_available"]["test-model"] == pytest.approx(TPM, abs=2)
+
+def test_retries_are_exhausted(mock_llm, scheduler, client):
+    config, url = mock_llm(fail_first=10)
+    with pytest.raises(LLMError) as error:
+        client.chat_completion(PAYLOAD, "test-key", url)
+    assert error.value.status_code == 429
+    assert config.requests == client.max_retries + 1
+    assert scheduler.get_stats()["tokens_available"]["test-model"] == pytest.approx(TPM, abs=2)
+
+def test_stream_yields_deltas_and_settles_usage(mock_llm, scheduler, client):
+    config, url = mock_llm(fail_first=1)
+    text = "".join(client.stream_chat_completion(PAYLOAD, "test-key", url))
+    assert text == "Mock answer: What is osmosis?"
+    assert config.requests == 2
+    available = scheduler.get_stats()["tokens_available"]["test-model"]
+    assert TPM - estimate_tokens(PAYLOAD) < available < TPM - 1  # Settled from the final usage chunk
@@ -0,0 +1,49 @@
+# test_llm_pool.py
+import time
+
+import pytest
+
+from utils.llm_client import LLMClient, LLMError, _parse_retry_after
+
+PAYLOAD = {"model": "test-model", "messages": [{"role": "user", "content": "What is osmosis?"}], "max_tokens": 50}
+
+@pytest.fixture
+def client():
+    client = LLMClient(max_retries=2, backoff_base=0.01)
+    yield client
+    client.close()
+
+def test_calls_share_one_pooled_session(mock_llm, client):
+    _, url = mock_llm()
+    for _ in range(3):
+        response = client.chat_completion(PAYLOAD, "test-key", url)
+        assert response["choices"][0]["message"]["content"] == "Mock answer: What is osmosis?"
+    session = client._get_session()
+    assert client._get_session() is session
+    assert session.get_adapter(url)._pool_maxsize == client.pool_size
+
+def test_429_waits_for_retry_after(mock_llm, client):
+    config, url = mock_llm(fail_first=1, retry_after=0.2)
+    start = time.monotonic()
+    client.chat_completion(PAYLOAD, "test-key", url)
+    assert time.monotonic() - start >= 0.2
+    assert config.requests == 2
+
+def test_retries_give_up_with_the_last_status(mock_llm, client):
+    config, url = mock_llm(fail_first=10)
+    with pytest.raises(LLMError) as error:
+        client.chat_completion(PAYLOAD, "test-key", url)
+    assert error.value.status_code == 429
+    assert config.requests == client.max_retries + 1
+
+def test_stream_yields_the_answer_in_deltas(mock_llm, client):
+    _, url = mock_llm()
+    deltas = list(client.stream_chat_completion(PAYLOAD, "test-key", url))
+    assert len(deltas) > 1
+    assert "".join(deltas) == "Mock answer: What is osmosis?"
+
+def test_retry_after_header_parsing():
+    assert _parse_retry_after("2.5") == 2.5
+    assert _parse_retry_after("-1") == 0.0
+    assert _parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0.0
+    assert _parse_retry_after("soon") is None
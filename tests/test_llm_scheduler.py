@@ -0,0 +1,109 @@
+# test_llm_scheduler.py
+import threading
+import time
+
+import pytest
+
+from utils.concurrency import Overloaded
+from utils.llm_scheduler import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, LLMScheduler, TokenBucket,
+                                 estimate_tokens)
+
+PAYLOAD = {"model": "test-model", "messages": [{"role": "user", "content": "x" * 40}], "max_tokens": 100}
+
+def test_estimate_tokens_counts_prompt_and_max_tokens():
+    assert estimate_tokens(PAYLOAD) == 40 // 4 + 4 + 3 + 100
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(60)  # One per second
+    now = time.monotonic()
+    bucket.refill(now)
+    bucket.level = 0
+    assert bucket.wait_time(2, now) == pytest.approx(2)
+    assert bucket.wait_time(2, now + 1) == pytest.approx(1)
+    assert bucket.wait_time(1, now, reserve=0.5) == pytest.approx(31)
+
+def test_admit_takes_budget_and_settle_refunds_unused_tokens():
+    scheduler = LLMScheduler(rpm=0, tpm=10000)
+    _, reservation = scheduler.admit(PAYLOAD)
+    reserved = estimate_tokens(PAYLOAD)
+    assert scheduler.get_stats()["tokens_available"]["test-model"] == pytest.approx(10000 - reserved, abs=1)
+    reservation.settle({"total_tokens": 20})
+    assert scheduler.get_stats()["tokens_available"]["test-model"] == pytest.approx(10000 - 20, abs=1)
+
+def test_release_refunds_a_failed_attempt():
+    scheduler = LLMScheduler(rpm=0, tpm=10000)
+    _, reservation = scheduler.admit(PAYLOAD)
+    reservation.release()
+    reservation.release()  # Only refunded once
+    assert scheduler.get_stats()["tokens_available"]["test-model"] == pytest.approx(10000, abs=1)
+
+def test_call_over_budget_is_shed():
+    scheduler = LLMScheduler(rpm=1, tpm=0, max_wait=0.1)
+    scheduler.admit(PAYLOAD)
+    with pytest.raises(Overloaded):
+        scheduler.admit(PAYLOAD)
+    assert scheduler.get_stats()["shed"] == 1
+
+def test_interactive_call_degrades_to_the_fallback_model():
+    scheduler = LLMScheduler(rpm=1, tpm=0, fallback_model="cheap-model", fallback_rpm=10, max_wait=0.1)
+    scheduler.admit(PAYLOAD)
+    payload, reservation = scheduler.admit(PAYLOAD)
+    assert payload["model"] == reservation.model == "cheap-model"
+    assert scheduler.get_stats()["degraded"] == 1
+
+def test_background_calls_leave_the_reserve_untouched():
+    scheduler = LLMScheduler(rpm=10, tpm=0, background_max_wait=0.1, background_reserve=0.5)
+    for _ in range(5):
+        scheduler.admit(PAYLOAD, PRIORITY_BACKGROUND)
+    with pytest.raises(Overloaded):
+        scheduler.admit(PAYLOAD, PRIORITY_BACKGROUND)
+    scheduler.admit(PAYLOAD, PRIORITY_INTERACTIVE)
+
+def test_processes_sharing_a_state_file_draw_on_one_budget(tmp_path):
+    path = str(tmp_path / "llm-budget.json")
+    first, second = (LLMScheduler(rpm=2, tpm=10000, max_wait=0.1, state_path=path) for _ in range(2))
+    first.admit(PAYLOAD)
+    _, reservation = second.admit(PAYLOAD)
+    with pytest.raises(Overloaded):
+        first.admit(PAYLOAD)  # Both requests of the minute are spent, one by each "worker"
+    reserved = estimate_tokens(PAYLOAD)
+    assert first.get_stats()["tokens_available"]["test-model"] == pytest.approx(10000 - 2 * reserved, abs=1)
+    reservation.release()
+    assert first.get_stats()["tokens_available"]["test-model"] == pytest.approx(10000 - reserved, abs=1)
+
+def test_backoff_is_shared_through_the_state_file(tmp_path):
+    path = str(tmp_path / "llm-budget.json")
+    first = LLMScheduler(rpm=0, tpm=0, max_wait=5, state_path=path)
+    LLMScheduler(rpm=0, tpm=0, state_path=path).backoff("test-model", 0.2)
+    start = time.monotonic()
+    first.admit(PAYLOAD)
+    assert time.monotonic() - start >= 0.19
+
+def test_backoff_pauses_the_model():
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_wait=5)
+    scheduler.backoff("test-model", 0.2)
+    start = time.monotonic()
+    scheduler.admit(PAYLOAD)
+    assert time.monotonic() - start >= 0.19
+
+def test_queued_calls_are_admitted_in_priority_order():
+    scheduler = LLMScheduler(rpm=600, tpm=0, max_wait=10, background_max_wait=10, background_reserve=0)
+    for _ in range(600):
+        scheduler.admit(PAYLOAD)  # Empty the bucket; one request refills every 0.1 s
+    order = []
+
+    def call(name, priority):
+        scheduler.admit(PAYLOAD, priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=call, args=("background", PRIORITY_BACKGROUND))]
+    threads[0].start()
+    time.sleep(0.02)
+    for i in range(3):
+        threads.append(threading.Thread(target=call, args=(f"interactive-{i}", PRIORITY_INTERACTIVE)))
+        threads[-1].start()
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive-0", "interactive-1", "interactive-2", "background"]
+    assert scheduler.get_stats()["queued"] == 0
@@ -0,0 +1,28 @@
+# test_metrics.py
+import pytest
+
+from utils.metrics import Histogram, MetricsRegistry, stats_collector
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram(buckets=(1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.count == 4 and histogram.sum == 6.5
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.99) == pytest.approx(2 + 2 * 0.96)
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.", route="/").inc(2)
+    with registry.histogram("latency_seconds", "Latency.", route="/").time():
+        pass
+    registry.register_collector("cache_events_total", "counter", "Cache events.",
+                                stats_collector(lambda: {"hits": 3, "misses": 1}, ("hits", "misses")))
+    registry.register_collector("broken", "gauge", "Fails.", lambda: 1 / 0)
+    text = registry.render()
+    assert 'requests_total{route="/"} 2' in text
+    assert 'latency_seconds_bucket{route="/",le="+Inf"} 1' in text
+    assert 'latency_seconds_quantile{route="/",quantile="0.5"}' in text
+    assert 'cache_events_total{kind="hits"} 3' in text
+    assert "broken" not in text
+    assert registry.counter("requests_total", "Requests.", route="/").value == 2  # Same child
@@ -0,0 +1,30 @@
+# test_progress.py
+from utils.progress import apply_session, empty_progress, summarize_progress, topic_of
+
+def _session(timestamp, question="What is ATP?", correct=None, topic=None):
+    entry = {"timestamp": timestamp, "question": question}
+    if correct is not None:
+        entry["quiz_attempt"] = {"is_correct": correct, **({"topic": topic} if topic else {})}
+    return entry
+
+def test_topic_prefers_the_quiz_topic():
+    assert topic_of(_session("2026-01-01T00:00:00", "What is ATP?")) == "what is atp"
+    assert topic_of(_session("2026-01-01T00:00:00", correct=True, topic="Energy")) == "energy"
+
+def test_streaks_and_accuracy():
+    progress = empty_progress()
+    for timestamp, correct in [("2026-01-01T09:00:00", None), ("2026-01-01T09:01:00", True),
+                               ("2026-01-02T09:00:00", True), ("2026-01-04T09:00:00", False),
+                               ("2026-01-05T09:00:00", True)]:
+        apply_session(progress, _session(timestamp, correct=correct))
+    totals = summarize_progress("u1", progress)["totals"]
+    assert (totals["questions"], totals["attempts"], totals["correct"]) == (1, 4, 3)
+    assert (totals["streak"], totals["best_streak"]) == (1, 2)
+    assert totals["accuracy"] == 0.75
+    assert (totals["active_days"], totals["day_streak"]) == (4, 2)
+
+def test_topics_are_listed_most_recent_first():
+    progress = empty_progress()
+    apply_session(progress, _session("2026-01-01T00:00:00", "Old topic"))
+    apply_session(progress, _session("2026-01-02T00:00:00", "New topic"))
+    assert [t["topic"] for t in summarize_progress("u1", progress)["topics"]] == ["new topic", "old topic"]
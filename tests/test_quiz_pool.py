@@ -0,0 +1,55 @@
+# test_quiz_pool.py
+import fcntl
+
+import pytest
+
+from utils import quiz_pool
+from utils.llm_scheduler import PRIORITY_BACKGROUND
+from utils.quiz_pool import QuizPool
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def batch(topic, count, priority):
+        calls.append((topic, count, priority))
+        return {"questions": [{"question": f"{topic} #{i}"} for i in range(count)]}
+
+    monkeypatch.setattr(quiz_pool.quiz_generator, "generate_quiz_batch", batch)
+    return calls
+
+def test_popular_topics_are_refilled_in_background_priority(calls, tmp_path):
+    pool = QuizPool(target=3, top_topics=1, seed_topics=[], db_path=str(tmp_path / "pool.db"))
+    pool.record_request("Photosynthesis")
+    pool.record_request("photosynthesis?")
+    pool.record_request("Gravity")
+    assert pool.take("Photosynthesis") is None
+
+    pool.refill()
+    assert calls == [("Photosynthesis", 3, PRIORITY_BACKGROUND)]
+    assert pool.take("PHOTOSYNTHESIS") == {"question": "Photosynthesis #0"}
+    assert pool.get_stats() == {"hits": 1, "misses": 1, "generated": 3, "stocked": 2, "topics": 1}
+
+    pool.refill()  # Only the missing quiz is requested
+    assert calls[-1] == ("Photosynthesis", 1, PRIORITY_BACKGROUND)
+
+def test_workers_share_popularity_and_stock(calls, tmp_path):
+    path = str(tmp_path / "pool.db")
+    first, second = (QuizPool(target=2, top_topics=1, seed_topics=[], db_path=path) for _ in range(2))
+    first.record_request("Gravity")
+    second.record_request("Osmosis")
+    second.record_request("Osmosis")
+    second.refill()  # Only flushes second's counts, but those already make Osmosis the top topic
+    first.refill()
+    assert calls == [("Osmosis", 2, PRIORITY_BACKGROUND)]  # Stocked once, not once per worker
+    assert first.take("osmosis") == {"question": "Osmosis #0"}
+    assert second.get_stats()["stocked"] == 1
+
+def test_refill_is_skipped_while_another_worker_runs_it(calls, tmp_path):
+    pool = QuizPool(target=2, top_topics=1, seed_topics=["Osmosis"], db_path=str(tmp_path / "pool.db"))
+    with open(pool.db_path + ".refill.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        pool.refill()
+    assert calls == []
+    pool.refill()
+    assert len(calls) == 1
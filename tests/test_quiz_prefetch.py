@@ -0,0 +1,65 @@
+# test_quiz_prefetch.py
+import json
+
+from utils.llm_scheduler import llm_scheduler
+from utils.quiz_prefetch import QuizTickets
+
+def test_claim_returns_the_future_once():
+    tickets = QuizTickets(max_workers=1)
+    ticket = tickets.submit(lambda topic: {"question": topic}, "Osmosis")
+    future = tickets.claim(ticket)
+    assert future.result(timeout=5) == {"question": "Osmosis"}
+    assert tickets.claim(ticket) is None
+    assert tickets.get_stats()["redeemed"] == 1
+
+def test_expired_tickets_are_dropped():
+    tickets = QuizTickets(max_workers=1, ttl=0)
+    ticket = tickets.submit(lambda: {})
+    assert tickets.claim(ticket) is None
+    assert tickets.get_stats()["expired"] == 1
+
+def test_ticket_issued_by_one_worker_is_redeemed_by_another(tmp_path):
+    path = str(tmp_path / "tickets.db")
+    issuer, redeemer = QuizTickets(max_workers=1, db_path=path), QuizTickets(max_workers=1, db_path=path)
+    ticket = issuer.submit(lambda topic: {"question": topic}, "Osmosis")
+    assert redeemer.claim(ticket).result(timeout=5) == {"question": "Osmosis"}
+    assert issuer.claim(ticket) is None  # Each ticket is redeemed once, wherever it was issued
+    assert redeemer.claim(ticket) is None
+
+def test_ticket_cancelled_by_another_worker_cannot_be_claimed(tmp_path):
+    path = str(tmp_path / "tickets.db")
+    issuer, other = QuizTickets(max_workers=1, db_path=path), QuizTickets(max_workers=1, db_path=path)
+    ticket = issuer.submit(lambda: {})
+    assert other.cancel(ticket)
+    assert issuer.claim(ticket) is None
+
+def test_prefetch_runs_at_background_priority(llm_app):
+    app, config = llm_app()
+    before = llm_scheduler.get_stats()["background"]
+    ticket = app._prefetch_quiz({"prefetch_quiz": True}, "Osmosis moves water across a membrane.")
+    assert app.quiz_tickets.claim(ticket).result(timeout=5)["answer"] == "Nitrogen"
+    assert llm_scheduler.get_stats()["background"] == before + 1
+
+def test_failed_prefetch_falls_back_to_generating(llm_app):
+    app, config = llm_app()
+
+    def fail(topic):
+        raise ConnectionError("upstream went away")
+    ticket = app.quiz_tickets.submit(fail, "Photosynthesis")
+
+    response = app.app.test_client().post("/generate_quiz", json={
+        "topic_or_answer": "Photosynthesis", "quiz_ticket": ticket, "use_cache": False})
+    assert response.status_code == 200
+    assert response.get_json()["answer"] == "Nitrogen"
+    assert config.requests == 1
+
+def test_streamed_answer_carries_a_redeemable_ticket(llm_app):
+    app, config = llm_app()
+    client = app.app.test_client()
+    response = client.post("/ask_ai", json={"question": "What is a cell?", "stream": True, "use_cache": False,
+                                            "prefetch_quiz": True})
+    done = json.loads(response.data.decode("utf-8").rsplit("data: ", 1)[1])
+    assert done["quiz_ticket"]
+    quiz = client.post("/generate_quiz", json={"topic_or_answer": done["answer"], "quiz_ticket": done["quiz_ticket"]})
+    assert quiz.get_json()["answer"] == "Nitrogen"
+    assert config.requests == 2  # The answer and the prefetched quiz; redeeming made no call
@@ -0,0 +1,70 @@
+# test_response_cache.py
+import time
+
+import pytest
+
+from utils.response_cache import ResponseCache, canonical_tokens, normalize_prompt
+
+# Prompts that share most of their words but ask something different
+DIFFERENT_QUESTIONS = [
+    ("Describe the causes of the French Revolution and explain why it happened",
+     "Describe the causes of the French Revolution and explain why it failed"),
+    ("How do plants store glucose in the leaves", "How do plants store glucose in the roots"),
+    ("What is the difference between mitosis and meiosis", "What is the difference between meiosis and mitosis"),
+]
+
+def test_normalize_prompt():
+    assert normalize_prompt("  What is   Photosynthesis? ") == "what is photosynthesis"
+
+def test_canonical_tokens_drop_filler_words_and_plurals():
+    assert canonical_tokens("please explain the enzymes") == ("explain", "enzyme")
+    assert canonical_tokens("the process of diffusion") == ("process", "of", "diffusion")
+
+def test_exact_hit_after_normalization():
+    cache = ResponseCache()
+    cache.put("What is photosynthesis?", "answer", namespace="answer")
+    assert cache.get("what is  photosynthesis", namespace="answer") == "answer"
+    assert cache.get("What is photosynthesis?", namespace="quiz") is None
+    assert cache.get_stats()["exact_hits"] == 1
+
+def test_canonical_hit_for_the_same_question():
+    cache = ResponseCache()
+    cache.put("Explain the process of photosynthesis in plants", "answer")
+    assert cache.get("Please explain the process of photosynthesis in a plant") == "answer"
+    assert cache.get_stats()["canonical_hits"] == 1
+
+def test_canonical_tier_can_be_disabled():
+    cache = ResponseCache(canonical=False)
+    cache.put("Explain the process of photosynthesis in plants", "answer")
+    assert cache.get("Please explain the process of photosynthesis in a plant") is None
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS + [(b, a) for a, b in DIFFERENT_QUESTIONS])
+def test_different_questions_never_share_an_answer(cached, asked):
+    cache = ResponseCache()
+    cache.put(cached, "answer to the cached question")
+    assert cache.get(asked) is None
+    assert cache.get_stats()["canonical_hits"] == 0
+
+def test_evicted_entries_leave_the_canonical_index():
+    cache = ResponseCache(max_bytes=400)
+    cache.put("Explain the enzymes", "x" * 200)
+    cache.put("Describe the atoms", "y" * 200)
+    assert cache.get("Please explain enzymes") is None
+    assert cache._canonical.keys() == {(cache._scope("default", "", 0.0), ("describe", "atom"))}
+
+def test_entries_expire():
+    cache = ResponseCache(ttl=0.05)
+    cache.put("What is osmosis?", "answer")
+    time.sleep(0.1)
+    assert cache.get("What is osmosis?") is None
+    assert cache.get_stats()["expirations"] == 1
+
+def test_size_bound_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=600)
+    cache.put("first question about cells", "x" * 200)
+    cache.put("second question about atoms", "y" * 200)
+    cache.get("first question about cells")
+    cache.put("third question about stars", "z" * 200)
+    assert cache.get("first question about cells") == "x" * 200
+    assert cache.get("second question about atoms") is None
+    assert cache.get_stats()["evictions"] >= 1
@@ -0,0 +1,86 @@
+# test_review_scheduler.py
+import pytest
+
+from utils.review_scheduler import (DAY_SECONDS, INITIAL_EASE, LAPSE_DELAY, MIN_EASE, ReviewScheduler, sm2)
+
+NOW = 1_700_000_000.0
+
+def _attempt(question: str, correct: bool, timestamp: str, user_id: str = "u1") -> dict:
+    return {"user_id": user_id, "question": "q", "timestamp": timestamp,
+            "quiz_attempt": {"quiz_question": question, "is_correct": correct, "options": ["a", "b"],
+                             "correct_answer": "a"}}
+
+def test_sm2_intervals_grow_1_6_then_by_ease():
+    state = sm2({}, 4, NOW)
+    assert (state["repetitions"], state["interval_days"]) == (1, 1)
+    assert state["due"] == NOW + DAY_SECONDS
+    state = sm2(state, 4, NOW)
+    assert state["interval_days"] == 6
+    state = sm2(state, 4, NOW)
+    assert state["interval_days"] == round(6 * state["ease"])
+    assert state["ease"] == pytest.approx(INITIAL_EASE)  # Quality 4 leaves the ease unchanged
+
+def test_sm2_lapse_restarts_the_item_and_lowers_ease():
+    state = sm2(sm2({}, 4, NOW), 4, NOW)
+    state = sm2(state, 1, NOW)
+    assert (state["repetitions"], state["interval_days"], state["lapses"]) == (0, 0, 1)
+    assert state["due"] == NOW + LAPSE_DELAY
+    assert state["ease"] < INITIAL_EASE
+
+def test_sm2_ease_never_drops_below_minimum():
+    state = {}
+    for _ in range(20):
+        state = sm2(state, 0, NOW)
+    assert state["ease"] == MIN_EASE
+
+def test_due_reviews_most_overdue_first(tmp_path):
+    scheduler = ReviewScheduler(str(tmp_path / "reviews.db"))
+    scheduler.record_attempts([
+        _attempt("What is ATP?", True, "2026-01-01T10:00:00"),
+        _attempt("What is DNA?", False, "2026-01-01T12:00:00"),
+        _attempt("What is RNA?", True, "2026-01-03T10:00:00"),
+        _attempt("What is ATP?", True, "2026-01-01T10:00:00", user_id="u2"),
+    ])
+    due = scheduler.due_reviews("u1", now=NOW * 2)
+    assert [item["quiz_question"] for item in due] == ["What is DNA?", "What is ATP?", "What is RNA?"]
+    assert scheduler.due_reviews("u1", limit=1, now=NOW * 2)[0]["quiz_question"] == "What is DNA?"
+    assert scheduler.due_reviews("u1", now=0) == []
+
+def test_repeated_attempts_update_one_item(tmp_path):
+    scheduler = ReviewScheduler(str(tmp_path / "reviews.db"))
+    scheduler.record_attempts([_attempt("What is ATP?", True, "2026-01-01T10:00:00")])
+    scheduler.record_attempts([_attempt("what is ATP", True, "2026-01-02T10:00:00")])
+    (item,) = scheduler.due_reviews("u1", now=NOW * 2)
+    assert (item["repetitions"], item["interval_days"]) == (2, 6)
+
+def test_items_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "reviews.db")
+    ReviewScheduler(path).record_attempts([_attempt("What is ATP?", False, "2026-01-01T10:00:00")])
+    assert len(ReviewScheduler(path).due_reviews("u1", now=NOW * 2)) == 1
+
+def test_bootstrap_replays_history_once(tmp_path):
+    scheduler = ReviewScheduler(str(tmp_path / "reviews.db"))
+    calls = []
+
+    def sessions():
+        calls.append(1)
+        return [_attempt("What is ATP?", True, "2026-01-01T10:00:00")]
+
+    scheduler.bootstrap(sessions)
+    scheduler.bootstrap(sessions)
+    assert calls == [1]
+    assert len(scheduler.due_reviews("u1", now=NOW * 2)) == 1
+
+def test_clear_lets_bootstrap_replay_again(tmp_path):
+    scheduler = ReviewScheduler(str(tmp_path / "reviews.db"))
+    scheduler.bootstrap(lambda: [_attempt("What is ATP?", True, "2026-01-01T10:00:00")])
+    scheduler.clear()
+    assert scheduler.due_reviews("u1", now=NOW * 2) == []
+    scheduler.bootstrap(lambda: [_attempt("What is DNA?", True, "2026-01-01T10:00:00")])
+    assert [item["quiz_question"] for item in scheduler.due_reviews("u1", now=NOW * 2)] == ["What is DNA?"]
+
+def test_due_reviews_read_the_user_due_index(tmp_path):
+    scheduler = ReviewScheduler(str(tmp_path / "reviews.db"))
+    plan = scheduler._db().execute("EXPLAIN QUERY PLAN SELECT state FROM review_items WHERE user_id = ? "
+                                   "AND due <= ? ORDER BY due, item LIMIT ?", ("u1", NOW, 10)).fetchall()
+    assert "idx_review_items_user_due" in " ".join(row[-1] for row in plan)
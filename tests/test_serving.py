@@ -0,0 +1,58 @@
+# test_serving.py
+# Concurrency check: /ask_ai calls served by a threaded WSGI server overlap their upstream
+# waits instead of queueing behind one another.
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+from utils.concurrency import ConcurrencyLimiter
+
+MOCK_LATENCY = 0.5
+CONCURRENT_REQUESTS = 16
+
+@pytest.fixture
+def serve():
+    """serve(wsgi_app) runs the app on a threaded werkzeug server and returns its base URL."""
+    servers = []
+
+    def start(wsgi_app):
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, wsgi_app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+    yield start
+    for server in servers:
+        server.shutdown()
+
+def test_concurrent_ask_ai_calls_overlap(llm_app, serve):
+    app, config = llm_app(latency=MOCK_LATENCY)
+    base_url = serve(app.app)
+
+    def ask(i):
+        response = requests.post(base_url + "/ask_ai", json={"question": f"Overlap check {i}?", "use_cache": False},
+                                 timeout=30)
+        return response.status_code, response.json().get("answer", "")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CONCURRENT_REQUESTS) as pool:
+        results = list(pool.map(ask, range(CONCURRENT_REQUESTS)))
+    elapsed = time.perf_counter() - start
+
+    assert [status for status, _ in results] == [200] * CONCURRENT_REQUESTS
+    assert all(answer.startswith("Mock answer:") for _, answer in results)
+    assert config.requests == CONCURRENT_REQUESTS
+    # Serialized calls would take CONCURRENT_REQUESTS * MOCK_LATENCY (8 s); overlapping ones about one latency
+    assert elapsed < 4 * MOCK_LATENCY
+
+def test_overload_is_answered_with_503(llm_app, monkeypatch):
+    app, _ = llm_app()
+    monkeypatch.setattr(app, "llm_limiter", ConcurrencyLimiter(max_concurrent=0, max_queue=0))
+    response = app.app.test_client().post("/ask_ai", json={"question": "Busy?", "use_cache": False})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
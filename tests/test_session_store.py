@@ -0,0 +1,133 @@
+# test_session_store.py
+import sqlite3
+
+import pytest
+
+from utils import history_archive, search_index
+from utils.session_store import SQLiteSessionStore, TrackerSessionStore, WriteBehindSessionStore
+
+def _entries():
+    entries = []
+    for i in range(25):
+        quiz = {"quiz_question": f"Quiz {i}", "is_correct": i % 3 != 0} if i % 2 else {}
+        entries.append({"timestamp": f"2026-01-{1 + i // 10:02d}T10:{i:02d}:00", "question": f"Question {i} about cells",
+                        "answer": f"Answer {i} mentions mitochondria" if i % 5 == 0 else f"Answer {i}",
+                        "quiz_attempt": quiz, "user_id": "u1" if i % 4 else "u2"})
+    return entries
+
+@pytest.fixture(params=["sqlite", "file", "sqlite+write-behind", "file+write-behind"])
+def store(request, tmp_path, tracker_dir, monkeypatch):
+    if request.param.startswith("sqlite"):
+        store = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    else:
+        monkeypatch.setattr(search_index, "SEARCH_DB_PATH", None)  # Index next to this test's log
+        store = TrackerSessionStore()
+    if request.param.endswith("write-behind"):
+        store = WriteBehindSessionStore(store, str(tmp_path / "spool"))
+    store.append_sessions(_entries())
+    yield store
+    if isinstance(store, WriteBehindSessionStore):
+        store.queue.close()
+
+def test_cursor_pagination_newest_first(store):
+    seen, cursor = [], None
+    while True:
+        page = store.query_sessions(limit=10, before=cursor, newest_first=True)
+        seen.extend(entry["question"] for entry in page["sessions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"Question {i} about cells" for i in reversed(range(25))]
+
+def test_cursor_pagination_oldest_first(store):
+    first = store.query_sessions(limit=10)
+    second = store.query_sessions(limit=10, after=first["next_cursor"])
+    assert [e["question"] for e in first["sessions"] + second["sessions"]] == \
+        [f"Question {i} about cells" for i in range(20)]
+
+def test_cursor_keeps_sessions_sharing_a_timestamp(store):
+    store.clear_all_sessions()
+    store.append_sessions([{"timestamp": "2025-12-31T23:00:00", "question": "old", "answer": "A", "quiz_attempt": {}}]
+                          + [{"timestamp": "2026-01-01T10:00:00.000001", "question": f"Q{i}", "answer": "A",
+                              "quiz_attempt": {}} for i in range(3)])
+    for newest_first, cursor_key, expected in ((True, "before", ["Q2", "Q1", "Q0", "old"]),
+                                               (False, "after", ["old", "Q0", "Q1", "Q2"])):
+        seen, cursor = [], None
+        while True:
+            page = store.query_sessions(limit=2, newest_first=newest_first, **{cursor_key: cursor})
+            seen.extend(entry["question"] for entry in page["sessions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == expected
+
+def test_filters(store):
+    quizzes = list(store.iter_sessions(has_quiz=True))
+    assert [e["quiz_attempt"]["quiz_question"] for e in quizzes] == [f"Quiz {i}" for i in range(1, 25, 2)]
+    assert all(e["user_id"] == "u2" for e in store.iter_sessions(user_id="u2"))
+    assert len(list(store.iter_sessions(user_id="u2"))) == 7
+    in_range = list(store.iter_sessions(since="2026-01-02T00:00:00", until="2026-01-02T23:59:59"))
+    assert [e["question"] for e in in_range] == [f"Question {i} about cells" for i in range(10, 20)]
+
+def test_search(store):
+    results = store.search_sessions("mitochondri", limit=2)
+    assert len(results["results"]) == 2 and results["next_offset"] == 2
+    rest = store.search_sessions("mitochondri", limit=10, offset=2)["results"]
+    found = {e["question"] for e in results["results"] + rest}
+    assert found == {f"Question {i} about cells" for i in range(0, 25, 5)}
+    assert store.search_sessions("mitochondria", user_id="u2")["results"][0]["user_id"] == "u2"
+
+def test_search_matches_the_user_id_exactly(store):
+    store.clear_all_sessions()
+    store.append_sessions([{"timestamp": f"2026-02-01T10:00:0{i}", "question": "Osmosis", "answer": "Water",
+                            "quiz_attempt": {}, "user_id": user_id}
+                           for i, user_id in enumerate(["Alice", "alice", "user-1", "user 1", "user-1-b"])])
+    for user_id in ("Alice", "alice", "user-1", "user 1"):
+        results = store.search_sessions("osmosis", user_id=user_id)["results"]
+        assert [e["user_id"] for e in results] == [user_id]
+
+def test_user_search_ranks_that_users_newest_matches(store, monkeypatch):
+    monkeypatch.setattr("utils.session_store.SEARCH_MAX_CANDIDATES", 2)
+    monkeypatch.setattr(search_index, "SEARCH_MAX_CANDIDATES", 2)
+    # u1's newer matches must not take the candidate slots before the user filter applies
+    assert {e["user_id"] for e in store.search_sessions("mitochondria", user_id="u2")["results"]} == {"u2"}
+
+def test_sqlite_index_with_a_tokenized_user_id_is_rebuilt(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(db_path=path).append_sessions(_entries())
+    conn = sqlite3.connect(path)
+    conn.executescript("DROP TRIGGER sessions_fts_insert; DROP TABLE sessions_fts;"
+                       "CREATE VIRTUAL TABLE sessions_fts USING fts5(question, answer, user_id, content = 'sessions', "
+                       "content_rowid = 'id');")
+    conn.close()
+    store = SQLiteSessionStore(db_path=path)
+    assert len(store.search_sessions("mitochondria", user_id="u2")["results"]) == 2
+    store.log_session("Osmosis?", "Water moves.", user_id="u2")  # The trigger was recreated too
+    assert store.search_sessions("osmosis", user_id="u2")["results"][0]["question"] == "Osmosis?"
+
+def test_analytics_by_day(store):
+    groups = store.analytics("day")
+    assert [(g["key"], g["questions"], g["attempts"]) for g in groups] == [
+        ("2026-01-01", 5, 5), ("2026-01-02", 5, 5), ("2026-01-03", 3, 2)]
+    with pytest.raises(ValueError):
+        store.analytics("week")
+
+@pytest.mark.parametrize("group_by", ["day", "topic", "user"])
+def test_analytics_match_the_column_path(store, group_by):
+    # SQLite groups in SQL; every store must count exactly what the columnar path counts
+    expected = history_archive.analytics([history_archive.build_columns(_entries())], group_by)
+    assert store.analytics(group_by) == expected
+    filtered = history_archive.analytics([history_archive.build_columns(_entries())], group_by,
+                                         since="2026-01-02", until="2026-01-02T00:00:00", user_id="u1")
+    assert store.analytics(group_by, since="2026-01-02", until="2026-01-02T00:00:00", user_id="u1") == filtered
+    assert store.analytics(group_by, limit=1) == expected[:1]
+
+def test_progress_is_kept_up_to_date(store):
+    totals = store.get_progress("u2")["totals"]
+    assert (totals["questions"], totals["attempts"]) == (7, 0)
+    store.log_session("Another question", "Another answer", user_id="u2")
+    assert store.get_progress("u2")["totals"]["questions"] == 8
+
+def test_clear(store):
+    store.clear_all_sessions()
+    assert store.get_all_sessions() == []
@@ -0,0 +1,76 @@
+# test_single_flight.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+def test_concurrent_identical_calls_run_once():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch(x):
+        calls.append(x)
+        release.wait(5)
+        return x * 2
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flights.do, ("test", 1), fetch, 21) for _ in range(8)]
+        while flights.get_stats()["namespaces"].get("test", {}).get("coalesced", 0) < 7:
+            time.sleep(0.005)
+        release.set()
+        assert [future.result(5) for future in futures] == [42] * 8
+    assert calls == [21]
+    assert flights.get_stats() == {"namespaces": {"test": {"leaders": 1, "coalesced": 7}}, "in_flight": 0}
+
+def test_leader_exception_reaches_every_caller():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(flights.do, ("test",), fail) for _ in range(2)]
+        while flights.get_stats()["namespaces"].get("test", {}).get("coalesced", 0) < 1:
+            time.sleep(0.005)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(5)
+
+def test_cancelled_async_leader_does_not_fail_waiters():
+    flights = SingleFlight()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.create_task(flights.ado(("test",), fetch))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(flights.ado(("test",), fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == "done"
+    assert len(runs) == 2
+
+@pytest.mark.parametrize("use_cache, expected_requests", [(True, 1), (False, 6)])
+def test_only_cached_answers_are_coalesced(llm_app, use_cache, expected_requests):
+    from utils import ai_response
+
+    _, config = llm_app(latency=0.2)
+    question = f"What is single flight ({use_cache})?"
+    with ThreadPoolExecutor(6) as pool:
+        answers = list(pool.map(lambda _: ai_response.get_ai_response(question, use_cache=use_cache), range(6)))
+    assert all(answer.startswith("Mock answer:") for answer in answers)
+    assert config.requests == expected_requests
@@ -0,0 +1,121 @@
+# test_tracker.py
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from utils import tracker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _entry(i: int, user_id: str = None) -> dict:
+    return {"timestamp": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}", "question": f"Q{i}", "answer": "A" * 50,
+            "quiz_attempt": {}, "user_id": user_id}
+
+def test_appends_rotate_segments_and_read_back_in_order(tracker_dir, monkeypatch):
+    monkeypatch.setattr(tracker, "SEGMENT_MAX_BYTES", 1024)
+    for i in range(60):
+        tracker.append_sessions([_entry(i)])
+    assert len(tracker._list_segments()) > 3
+    assert [e["question"] for e in tracker.get_all_sessions()] == [f"Q{i}" for i in range(60)]
+    # Whole segments before start are skipped; entries are filtered by the caller
+    newest = [e for e in tracker.iter_sessions(start="2026-01-01T00:00:50", reverse=True)
+              if e["timestamp"] >= "2026-01-01T00:00:50"]
+    assert [e["question"] for e in newest] == [f"Q{i}" for i in reversed(range(50, 60))]
+
+def test_compacted_segments_read_the_same(tracker_dir, monkeypatch):
+    monkeypatch.setattr(tracker, "SEGMENT_MAX_BYTES", 1024)
+    tracker.append_sessions([_entry(i, user_id="u1") for i in range(10)])
+    for i in range(10, 40):
+        tracker.append_sessions([_entry(i)])
+    before = tracker.get_all_sessions()
+    assert tracker.compact_segments() > 0
+    assert any(path.endswith(".col") for path in tracker._list_stored_segments())
+    assert tracker.get_all_sessions() == before
+    assert len(list(tracker.iter_user_sessions("u1"))) == 10
+
+def test_column_cache_keeps_only_the_newest_segments(tracker_dir, monkeypatch):
+    monkeypatch.setattr(tracker, "SEGMENT_MAX_BYTES", 1024)
+    monkeypatch.setattr(tracker, "_column_cache", type(tracker._column_cache)())
+    for i in range(60):
+        tracker.append_sessions([_entry(i)])
+    assert sum(len(columns.flags) for columns in tracker.iter_columns()) == 60
+    assert list(tracker._column_cache) == tracker._list_segments()[-tracker.COLUMN_CACHE_SEGMENTS:]
+    assert sum(len(columns.flags) for columns in tracker.iter_columns()) == 60  # Evicted ones re-encoded
+
+def test_legacy_history_is_migrated(tracker_dir):
+    with open(tracker.HISTORY_FILE, "w", encoding="utf-8") as f:
+        json.dump([_entry(1), _entry(2)], f, indent=4)
+    assert [e["question"] for e in tracker.get_all_sessions()] == ["Q1", "Q2"]
+    assert os.path.exists(tracker.HISTORY_FILE + ".migrated")
+
+def test_pending_appends_are_synced_by_the_deadline(tracker_dir, monkeypatch):
+    monkeypatch.setattr(tracker, "FSYNC_INTERVAL", 0.1)
+    if tracker._writer["timer"] is not None:  # Left by an earlier test with the default interval
+        tracker._writer["timer"].cancel()
+        tracker._writer["timer"].join()
+    tracker._writer["last_sync"] = time.monotonic()  # As if a sync just happened
+    tracker.append_sessions([_entry(1)])
+    assert tracker._writer["pending"] == 1
+    time.sleep(0.3)
+    assert tracker._writer["pending"] == 0
+
+def test_concurrent_processes_lose_no_appends(tracker_dir):
+    script = f"""
+import sys
+sys.path.insert(0, {ROOT!r})
+from utils import tracker
+tracker.DATA_DIR = {tracker_dir!r}
+tracker.LOG_DIR = tracker.DATA_DIR + "/history"
+tracker.HISTORY_FILE = tracker.DATA_DIR + "/history.json"
+tracker.SEGMENT_MAX_BYTES = 4096
+for i in range(100):
+    tracker.append_sessions([{{"timestamp": "2026-01-01T00:00:00", "question": f"{{sys.argv[1]}}-{{i}}"}}])
+"""
+    workers = [subprocess.Popen([sys.executable, "-c", script, str(n)]) for n in range(3)]
+    assert [worker.wait(60) for worker in workers] == [0, 0, 0]
+    questions = [e["question"] for e in tracker.get_all_sessions()]
+    assert len(questions) == 300
+    assert len(set(questions)) == 300
+
+def _restart_after_losing_shard_writes(snapshot: str):
+    """Puts back the users directory as it was at snapshot time, as if later writes never reached the disk."""
+    shutil.rmtree(tracker._user_dir())
+    shutil.copytree(snapshot, tracker._user_dir())
+    tracker._sharded = False  # A new process reconciles on first use
+
+def test_user_shards_catch_up_with_the_log_after_a_crash(tracker_dir):
+    tracker.append_sessions([_entry(i, user_id="u1") for i in range(3)])
+    tracker.flush()  # Checkpoint: the shards are durable up to here
+    snapshot = os.path.join(tracker_dir, "users-at-checkpoint")
+    shutil.copytree(tracker._user_dir(), snapshot)
+    tracker.append_sessions([_entry(i, user_id="u1") for i in range(3, 5)])
+    tracker.flush()
+
+    _restart_after_losing_shard_writes(snapshot)
+    shard = tracker._user_shard_base("u1") + tracker.SEGMENT_SUFFIX
+    with open(shard, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(_entry(3, user_id="u1")) + "\n")  # Shard line whose progress write was lost
+    assert tracker.get_user_progress("u1")["totals"]["questions"] == 5
+    assert [e["question"] for e in tracker.iter_user_sessions("u1")] == [f"Q{i}" for i in range(5)]
+    tracker._sharded = False
+    assert tracker.get_user_progress("u1")["totals"]["questions"] == 5  # Replaying again changes nothing
+
+def test_shard_missing_counted_lines_is_rebuilt(tracker_dir):
+    tracker.append_sessions([_entry(i, user_id="u1") for i in range(3)])
+    tracker.flush()
+    shard = tracker._user_shard_base("u1") + tracker.SEGMENT_SUFFIX
+    size = os.path.getsize(shard)
+    tracker.append_sessions([_entry(3, user_id="u1")])
+    os.truncate(shard, size)  # The new line was lost but the progress file that counts it was not
+    tracker._sharded = False
+    assert tracker.get_user_progress("u1")["totals"]["questions"] == 4
+    assert [e["question"] for e in tracker.iter_user_sessions("u1")] == [f"Q{i}" for i in range(4)]
+
+def test_clear_all_sessions(tracker_dir):
+    tracker.append_sessions([_entry(1, user_id="u1")])
+    tracker.clear_all_sessions()
+    assert tracker.get_all_sessions() == []
+    assert tracker.get_user_progress("u1")["totals"]["questions"] == 0
@@ -0,0 +1,90 @@
+# test_voice_input.py
+import io
+import struct
+import wave
+
+import pytest
+
+from utils import voice_input
+from utils.voice_input import AudioFormatError, StreamingTranscriber
+
+RATE = 16000
+
+class RecordingBackend:
+    """Transcribes each segment as its length in milliseconds."""
+
+    def __init__(self):
+        self.segments = []
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        self.segments.append(pcm)
+        return f"{len(pcm) * 1000 // (2 * sample_rate)}ms"
+
+def _tone(ms: int, amplitude: int = 3000) -> bytes:
+    samples = RATE * ms // 1000
+    return struct.pack(f"<{samples}h", *([amplitude, -amplitude] * (samples // 2)))
+
+def _silence(ms: int) -> bytes:
+    return b"\0\0" * (RATE * ms // 1000)
+
+def _chunks(data: bytes, size: int = 1000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def test_utterances_are_split_on_silence():
+    backend = RecordingBackend()
+    audio = _silence(300) + _tone(600) + _silence(900) + _tone(300) + _silence(300)
+    transcript = voice_input.transcribe_stream(_chunks(audio), backend=backend, sample_rate=RATE)
+    assert len(backend.segments) == 2
+    assert transcript.count("ms") == 2
+
+def test_silence_gives_an_empty_transcript():
+    backend = RecordingBackend()
+    assert voice_input.transcribe_stream(_chunks(_silence(2000)), backend=backend, sample_rate=RATE) == ""
+    assert backend.segments == []
+
+def test_wav_header_sets_the_sample_rate():
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(8000)
+        writer.writeframes(_tone(500))
+    transcriber = StreamingTranscriber(backend=RecordingBackend())
+    for chunk in _chunks(out.getvalue(), 7):  # The header arrives in pieces
+        transcriber.feed(chunk)
+    transcriber.finish()
+    assert transcriber.sample_rate == 8000
+
+def test_unsupported_wav_is_rejected():
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(2)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(_silence(100) * 2)
+    with pytest.raises(AudioFormatError):
+        StreamingTranscriber(backend=RecordingBackend()).feed(out.getvalue())
+
+def test_overlong_recording_is_rejected(monkeypatch):
+    monkeypatch.setattr(voice_input, "VOICE_MAX_SECONDS", 1)
+    transcriber = StreamingTranscriber(backend=RecordingBackend(), sample_rate=RATE)
+    with pytest.raises(AudioFormatError):
+        transcriber.feed(_silence(1500))
+
+def test_voice_ask_transcribes_an_upload(llm_app):
+    app, _ = llm_app()
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(_tone(500))
+    response = app.app.test_client().post("/voice_ask", data=io.BytesIO(out.getvalue()), content_type="audio/wav")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["transcript"] and body["answer"].startswith("Mock answer:")
+
+def test_voice_ask_rejects_silence(llm_app):
+    app, _ = llm_app()
+    response = app.app.test_client().post("/voice_ask", data=_silence(1000), query_string={"sample_rate": RATE})
+    assert response.status_code == 400
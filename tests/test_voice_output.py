@@ -0,0 +1,70 @@
+# test_voice_output.py
+import io
+import json
+import os
+import wave
+
+import pytest
+
+from utils import voice_output
+
+def _wav(frames: bytes, rate: int = 16000) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(frames)
+    return out.getvalue()
+
+def test_split_sentences():
+    assert voice_output.split_sentences("One. Two!  Three?") == ["One.", "Two!", "Three?"]
+
+def test_join_wav_merges_frames_under_one_header():
+    joined = voice_output.join_wav([_wav(b"\x01\x00" * 100), _wav(b"\x02\x00" * 50)])
+    assert joined.count(b"RIFF") == 1
+    with wave.open(io.BytesIO(joined), "rb") as reader:
+        assert reader.getnframes() == 150
+        assert reader.readframes(150) == b"\x01\x00" * 100 + b"\x02\x00" * 50
+
+def test_join_wav_rejects_mixed_formats():
+    with pytest.raises(ValueError):
+        voice_output.join_wav([_wav(b"\x00\x00", 16000), _wav(b"\x00\x00", 22050)])
+
+def test_convert_text_to_audio_writes_one_wav(tmp_path, monkeypatch):
+    monkeypatch.setitem(voice_output._ENGINES, "test", lambda text, voice=None: _wav(b"\x03\x00" * len(text)))
+    monkeypatch.setattr(voice_output, "audio_cache", voice_output.AudioCache(str(tmp_path / "cache")))
+    output = tmp_path / "answer.wav"
+    voice_output.convert_text_to_audio("First sentence. Second one.", engine_type="test", output_file=str(output))
+    with wave.open(str(output), "rb") as reader:
+        assert reader.getnframes() == len("First sentence.") + len("Second one.")
+
+def test_sentences_are_cached(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setitem(voice_output._ENGINES, "test", lambda text, voice=None: calls.append(text) or b"audio")
+    monkeypatch.setattr(voice_output, "audio_cache", voice_output.AudioCache(str(tmp_path / "cache")))
+    for _ in range(2):
+        assert [audio for _, audio in voice_output.stream_text_to_audio("Hi. Bye.", "test")] == [b"audio", b"audio"]
+    assert sorted(calls) == ["Bye.", "Hi."]
+
+def test_workers_sharing_a_cache_directory_stay_within_the_bound(tmp_path):
+    first, second = (voice_output.AudioCache(str(tmp_path / "cache"), max_bytes=300) for _ in range(2))
+    first.put("a", b"x" * 100)
+    second.put("b", b"x" * 100)
+    os.utime(first._path("a"), (1, 1))
+    os.utime(first._path("b"), (2, 2))
+    assert first.get("a") == b"x" * 100  # Now the most recently used for both workers
+    first.put("c", b"x" * 100)
+    second.put("d", b"x" * 100)  # Second never saw "a" or "c" stored, but counts them
+    assert sorted(os.listdir(tmp_path / "cache")) == [".lock", "a.wav", "c.wav", "d.wav"]
+    assert second.get_stats()["bytes"] == 300
+    assert first.get("b") is None
+
+def test_speak_streams_one_event_per_sentence(llm_app):
+    app, _ = llm_app()
+    response = app.app.test_client().post("/speak", json={"text": "First sentence. Second one!",
+                                                          "engine": "omnidimension"})
+    events = [block.split("\n") for block in response.get_data(as_text=True).split("\n\n") if block]
+    assert [json.loads(lines[-1][len("data: "):]).get("sentence") for lines in events[:-1]] == [
+        "First sentence.", "Second one!"]
+    assert events[-1] == ["event: done", 'data: {"sentences": 2}']
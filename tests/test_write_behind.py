@@ -0,0 +1,119 @@
+# test_write_behind.py
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from utils.write_behind import SPOOL_SUFFIX, WriteBehindQueue, fcntl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(fcntl is None, reason="spool files need fcntl")
+
+def _entry(i: int) -> dict:
+    return {"timestamp": f"2026-01-01T00:00:{i:02d}", "question": f"Q{i}", "answer": f"A{i}"}
+
+class Sink:
+    def __init__(self):
+        self.committed = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, entries):
+        with self.lock:
+            self.calls += 1
+            self.committed.extend(entries)
+
+    def contains(self, entry):
+        return entry in self.committed
+
+def test_submits_are_committed_in_groups(tmp_path):
+    sink = Sink()
+    queue = WriteBehindQueue(sink, str(tmp_path), batch=1000, delay=0.2)
+    for i in range(50):
+        queue.submit([_entry(i)])
+    assert queue.flush(5)
+    assert sink.committed == [_entry(i) for i in range(50)]
+    assert sink.calls < 5
+    assert os.listdir(tmp_path) == []  # Spools are deleted once committed
+    queue.close()
+
+def test_failed_commit_is_retried(tmp_path):
+    sink = Sink()
+    failures = [RuntimeError("disk full")]
+
+    def flaky(entries):
+        if failures:
+            raise failures.pop()
+        sink(entries)
+
+    queue = WriteBehindQueue(flaky, str(tmp_path), delay=0.01)
+    queue.submit([_entry(1)])
+    assert queue.flush(5)
+    assert sink.committed == [_entry(1)]
+    assert queue.get_stats()["errors"] == 1
+    queue.close()
+
+def test_full_queue_writes_through(tmp_path):
+    sink = Sink()
+    release = threading.Event()
+
+    def slow(entries):
+        release.wait(5)
+        sink(entries)
+
+    queue = WriteBehindQueue(slow, str(tmp_path), batch=1, delay=0, max_pending=1, max_wait=0.05)
+    queue.submit([_entry(1)])  # Being committed
+    queue.submit([_entry(2)])  # Pending
+    threading.Timer(0.5, release.set).start()
+    queue.submit([_entry(3)])  # No room within max_wait
+    assert queue.get_stats()["write_through"] == 1
+    assert queue.flush(5)
+    assert sorted(e["question"] for e in sink.committed) == ["Q1", "Q2", "Q3"]
+    queue.close()
+
+def _write_orphan_spool(spool_dir, entries, torn: bool = False):
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, f"99999-1{SPOOL_SUFFIX}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        if torn:
+            f.write('{"timestamp": "2026-01-01T00:01')
+    return path
+
+def test_replay_commits_orphaned_spools_and_skips_committed_entries(tmp_path):
+    sink = Sink()
+    sink.committed = [_entry(1), _entry(3)]  # Committed just before the owner died
+    path = _write_orphan_spool(str(tmp_path), [_entry(i) for i in range(1, 5)], torn=True)
+    queue = WriteBehindQueue(sink, str(tmp_path), contains=sink.contains)
+    assert queue.replay() == 2
+    assert sink.committed == [_entry(1), _entry(3), _entry(2), _entry(4)]
+    assert not os.path.exists(path)
+    queue.close()
+
+def test_replay_leaves_live_spools_alone(tmp_path):
+    owner = WriteBehindQueue(Sink(), str(tmp_path), delay=60)
+    owner.submit([_entry(1)])
+    sink = Sink()
+    assert WriteBehindQueue(sink, str(tmp_path)).replay() == 0
+    assert sink.committed == []
+    owner.close()
+
+def test_crashed_worker_loses_nothing(tmp_path):
+    # A worker that dies (os._exit skips the atexit drain) before its group commit
+    script = f"""
+import os, sys
+sys.path.insert(0, {ROOT!r})
+from utils.write_behind import WriteBehindQueue
+queue = WriteBehindQueue(lambda entries: None, {str(tmp_path)!r}, delay=60)
+for i in range(20):
+    queue.submit([{{"question": f"Q{{i}}"}}])
+os._exit(1)
+"""
+    subprocess.run([sys.executable, "-c", script], check=False)
+    sink = Sink()
+    assert WriteBehindQueue(sink, str(tmp_path)).replay() == 20
+    assert [e["question"] for e in sink.committed] == [f"Q{i}" for i in range(20)]
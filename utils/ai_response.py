@@ -1,15 +1,91 @@
 # ai_response.py
-import requests
 import json
 import os
 
+from utils.concurrency import Overloaded
+from utils.llm_client import LLMError, get_llm_client
+from utils.response_cache import normalize_prompt, response_cache
+from utils.single_flight import llm_flights
+
 # Placeholder for your OpenAI API Key
 # It's recommended to load this from environment variables in a production setup
 
 API_KEY = os.getenv("API_KEY")
-OPENAI_API_ENDPOINT = "https://api.openai.com/v1/chat/completions"
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or API_KEY
+OPENAI_API_ENDPOINT = os.getenv("OPENAI_API_ENDPOINT", "https://api.openai.com/v1/chat/completions")
+
+SYSTEM_PROMPT = "You are Exam Whisperer, an AI assistant specialized in explaining educational topics concisely and accurately."
+MISSING_KEY_ERROR = "Error: OpenAI API Key is not set. Please set the OPENAI_API_KEY environment variable or update it in ai_response.py."
+
+def is_configured() -> bool:
+    """Returns True if an OpenAI API key is available for answers."""
+    return bool(OPENAI_API_KEY) and OPENAI_API_KEY != "***"
+
+def _build_payload(prompt: str, model: str, temperature: float) -> dict:
+    """Builds the chat completions request body for a question."""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": temperature,
+        "max_tokens": 500 # Adjust as needed based on expected response length
+    }
+
+def _extract_answer(response_data: dict):
+    """Returns the assistant message from a completion response, or None if it is malformed."""
+    if response_data and 'choices' in response_data and len(response_data['choices']) > 0:
+        return response_data['choices'][0]['message']['content']
+    return None
+
+def stream_ai_response(prompt: str, model: str = "gpt-3.5-turbo", temperature: float = 0.7, use_cache: bool = True):
+    """
+    Streams the AI's response to a prompt as text deltas.
+
+    A cached answer is yielded in one piece. A freshly streamed answer is cached once the
+    stream completes, so later identical questions are served without an upstream call.
+
+    Args:
+        prompt (str): The user's question or input.
+        model (str): The OpenAI model to use.
+        temperature (float): Controls randomness. Lower values are more deterministic.
+        use_cache (bool): Serve and store the answer through the response cache.
+
+    Yields:
+        str: Successive pieces of the answer.
 
-def get_ai_response(prompt: str, model: str = "gpt-3.5-turbo", temperature: float = 0.7) -> str:
+    Raises:
+        LLMError: If the key is missing or the upstream stream fails.
+    """
+    if use_cache:
+        cached = response_cache.get(prompt, model, temperature, namespace="answer")
+        if cached is not None:
+            yield cached
+            return
+
+    if not is_configured():
+        raise LLMError(MISSING_KEY_ERROR)
+
+    parts = []
+    for delta in get_llm_client().stream_chat_completion(
+            _build_payload(prompt, model, temperature), OPENAI_API_KEY, OPENAI_API_ENDPOINT):
+        parts.append(delta)
+        yield delta
+    if use_cache and parts:
+        response_cache.put(prompt, "".join(parts), model, temperature, namespace="answer")
+
+def _handle_response(prompt: str, model: str, temperature: float, use_cache: bool, response_data: dict) -> str:
+    """Extracts the answer from a completion and caches it."""
+    # Extract the AI's message
+    answer = _extract_answer(response_data)
+    if answer is None:
+        return "Error: Unexpected response format from OpenAI API."
+    if use_cache:
+        response_cache.put(prompt, answer, model, temperature, namespace="answer")
+    return answer
+
+def get_ai_response(prompt: str, model: str = "gpt-3.5-turbo", temperature: float = 0.7, use_cache: bool = True) -> str:
     """
     Sends a text prompt to the OpenAI API and returns the AI's response.
 
@@ -17,41 +93,39 @@ def get_ai_response(prompt: str, model: str = "gpt-3.5-turbo", temperature: floa
         prompt (str): The user's question or input.
         model (str): The OpenAI model to use (e.g., "gpt-3.5-turbo", "gpt-4").
         temperature (float): Controls randomness. Lower values are more deterministic.
+        use_cache (bool): Serve repeated or reworded (same canonical words) prompts from the response cache.
+                          Pass False to force a fresh completion.
 
     Returns:
         str: The AI's generated text response, or an error message.
     """
-    if not OPENAI_API_KEY or OPENAI_API_KEY == "***":
-        return "Error: OpenAI API Key is not set. Please set the OPENAI_API_KEY environment variable or update it in ai_response.py."
+    if use_cache:
+        cached = response_cache.get(prompt, model, temperature, namespace="answer")
+        if cached is not None:
+            return cached
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "You are Exam Whisperer, an AI assistant specialized in explaining educational topics concisely and accurately."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": temperature,
-        "max_tokens": 500 # Adjust as needed based on expected response length
-    }
+    if not is_configured():
+        return MISSING_KEY_ERROR
+
+    if not use_cache:
+        return _fetch_answer(prompt, model, temperature, use_cache)  # A fresh completion of its own
+    # Concurrent identical questions share one upstream call
+    return llm_flights.do(_flight_key(prompt, model, temperature), _fetch_answer, prompt, model, temperature, use_cache)
 
+def _flight_key(prompt: str, model: str, temperature: float) -> tuple:
+    return ("answer", normalize_prompt(prompt), model, temperature)
+
+def _fetch_answer(prompt: str, model: str, temperature: float, use_cache: bool) -> str:
+    """Requests a completion for the prompt and returns the answer or an error message."""
     try:
-        response = requests.post(OPENAI_API_ENDPOINT, headers=headers, data=json.dumps(payload))
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        
-        response_data = response.json()
-        
-        # Extract the AI's message
-        if response_data and 'choices' in response_data and len(response_data['choices']) > 0:
-            return response_data['choices'][0]['message']['content']
-        else:
-            return "Error: Unexpected response format from OpenAI API."
-
-    except requests.exceptions.RequestException as e:
+        # Pooled keep-alive client with timeouts and retries on 429/5xx
+        response_data = get_llm_client().chat_completion(
+            _build_payload(prompt, model, temperature), OPENAI_API_KEY, OPENAI_API_ENDPOINT)
+        return _handle_response(prompt, model, temperature, use_cache, response_data)
+
+    except Overloaded:
+        raise  # Rate-limit budget exhausted; the route answers 503
+    except LLMError as e:
         return f"Error communicating with OpenAI API: {e}"
     except json.JSONDecodeError:
         return "Error: Could not decode JSON response from OpenAI API."
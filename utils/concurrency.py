@@ -0,0 +1,129 @@
+# concurrency.py
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from utils.metrics import registry, stats_collector
+
+# Limits for routes that call the upstream LLM, overridable from the environment
+MAX_CONCURRENT_LLM_REQUESTS = int(os.environ.get("MAX_CONCURRENT_LLM_REQUESTS", 16))
+LLM_REQUEST_QUEUE_DEPTH = int(os.environ.get("LLM_REQUEST_QUEUE_DEPTH", 64))
+LLM_REQUEST_QUEUE_TIMEOUT = float(os.environ.get("LLM_REQUEST_QUEUE_TIMEOUT", 10))
+
+class Overloaded(Exception):
+    """Raised when the request queue is full or a queued request waited too long."""
+
+class ConcurrencyLimiter:
+    """
+    Caps in-flight upstream calls and bounds the queue of requests waiting for a slot.
+
+    When every slot is busy, up to max_queue requests wait (at most queue_timeout seconds);
+    anything beyond that is rejected immediately with Overloaded so the route can answer
+    503 instead of letting latency grow without bound. The limiter uses threading
+    primitives, so threads and asyncio tasks on any event loop share the same slots.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_LLM_REQUESTS, max_queue: int = LLM_REQUEST_QUEUE_DEPTH,
+                 queue_timeout: float = LLM_REQUEST_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def _try_enter_locked(self) -> bool:
+        if self.active < self.max_concurrent:
+            self.active += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Takes a slot, waiting in the bounded queue if necessary."""
+        with self._cond:
+            if self._try_enter_locked():
+                return
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded("Request queue is full.")
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self._try_enter_locked():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise Overloaded("Timed out waiting for a free slot.")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def _release_locked(self):
+        self.active -= 1
+        self._cond.notify()
+
+    def release(self):
+        """Frees a slot and wakes one queued request."""
+        with self._cond:
+            self._release_locked()
+
+    @contextmanager
+    def slot(self):
+        """Holds a slot for the duration of a with-block."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire_async(self):
+        """
+        Like acquire(), but waits in a worker thread so the event loop is not blocked.
+
+        Safe to cancel: a slot the thread takes after the caller was cancelled is given back.
+        """
+        with self._cond:
+            if self._try_enter_locked():
+                return
+        state = {"acquired": False, "abandoned": False}
+
+        def wait():
+            self.acquire()
+            with self._cond:
+                if state["abandoned"]:
+                    self._release_locked()
+                else:
+                    state["acquired"] = True
+
+        try:
+            await asyncio.to_thread(wait)
+        except asyncio.CancelledError:
+            with self._cond:
+                state["abandoned"] = True
+                if state["acquired"]:  # Taken just before the cancellation reached us
+                    self._release_locked()
+            raise
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Holds a slot for the duration of an async with-block without blocking the event loop."""
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> dict:
+        """Returns the current number of active and queued requests and total rejections."""
+        with self._cond:
+            return {"active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+# Shared by the LLM-bound Flask routes
+llm_limiter = ConcurrencyLimiter()
+registry.register_collector("llm_limiter_requests", "gauge", "Upstream-bound requests active or queued.",
+                            stats_collector(llm_limiter.get_stats, ("active", "waiting"), label="state"))
+registry.register_collector("llm_limiter_rejected_total", "counter", "Requests rejected with 503 by the limiter.",
+                            lambda: {(): llm_limiter.get_stats()["rejected"]})
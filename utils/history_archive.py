@@ -0,0 +1,329 @@
+# history_archive.py
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from itertools import compress
+from operator import and_
+
+from utils.progress import topic_of
+
+try:
+    import numpy as np  # Optional: vectorized aggregation; the stdlib path gives the same results
+except ImportError:
+    np = None
+
+# Compressed columnar archive of sessions; utils/tracker.py rolls sealed log segments into these files.
+#
+# Layout: magic, header length (uint32), JSON header, then column blocks aligned to 8 bytes.
+# Analytics columns are fixed-width little-endian arrays read in place through mmap:
+#   day, topic, user  uint32 ids into the header's "days", "topics" and "users" dictionaries
+#   flags             uint8, FLAG_QUIZ | FLAG_CORRECT
+#   line_end          uint64 byte offset where the entry ended in the original JSON Lines segment
+# Text columns (timestamp, question, answer, quiz_attempt, extra) are zlib-compressed JSON arrays,
+# only decompressed when full entries are read back.
+ARCHIVE_MAGIC = b"SESSARC1"
+ARCHIVE_SUFFIX = ".col"
+ARCHIVE_COMPRESS_LEVEL = int(os.environ.get("ARCHIVE_COMPRESS_LEVEL", 6))
+FLAG_QUIZ = 1
+FLAG_CORRECT = 2
+GROUP_BY = ("day", "topic", "user")
+
+_FIXED_COLUMNS = (("day", "I"), ("topic", "I"), ("user", "I"), ("flags", "B"), ("line_end", "Q"))
+_TEXT_COLUMNS = ("timestamp", "question", "answer", "quiz_attempt", "extra")
+_ENTRY_KEYS = {"timestamp", "question", "answer", "quiz_attempt", "user_id"}
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+class Columns:
+    """Analytics columns of a batch of sessions plus the dictionaries their ids point into."""
+
+    def __init__(self, dictionaries: dict, day, topic, user, flags):
+        self.dictionaries = dictionaries  # "days"/"topics"/"users" -> list of values
+        self.day, self.topic, self.user, self.flags = day, topic, user, flags
+
+class ColumnBuilder:
+    """Encodes session entries into columns, one row per entry."""
+
+    def __init__(self, keep_text: bool = False):
+        self.keep_text = keep_text
+        self.dictionaries = {"days": [], "topics": [], "users": []}
+        self._ids = {"days": {}, "topics": {}, "users": {}}
+        self.arrays = {name: array(code) for name, code in _FIXED_COLUMNS}
+        self.text = {name: [] for name in _TEXT_COLUMNS}
+        self.first_timestamp = self.last_timestamp = None
+
+    def _id(self, dictionary: str, value) -> int:
+        ids = self._ids[dictionary]
+        if value not in ids:
+            ids[value] = len(ids)
+            self.dictionaries[dictionary].append(value)
+        return ids[value]
+
+    def add(self, entry: dict, line_end: int = 0):
+        timestamp = entry.get("timestamp") or ""
+        quiz_attempt = entry.get("quiz_attempt") or {}
+        flags = (FLAG_QUIZ if quiz_attempt else 0) | (FLAG_CORRECT if quiz_attempt.get("is_correct") else 0)
+        self.arrays["day"].append(self._id("days", timestamp[:10]))
+        self.arrays["topic"].append(self._id("topics", topic_of(entry)))
+        self.arrays["user"].append(self._id("users", entry.get("user_id")))
+        self.arrays["flags"].append(flags)
+        self.arrays["line_end"].append(line_end)
+        if timestamp:
+            self.first_timestamp = min(self.first_timestamp or timestamp, timestamp)
+            self.last_timestamp = max(self.last_timestamp or timestamp, timestamp)
+        if self.keep_text:
+            self.text["timestamp"].append(entry.get("timestamp"))
+            self.text["question"].append(entry.get("question"))
+            self.text["answer"].append(entry.get("answer"))
+            self.text["quiz_attempt"].append(quiz_attempt)
+            extra = {key: value for key, value in entry.items() if key not in _ENTRY_KEYS}
+            self.text["extra"].append(extra or None)
+
+    def columns(self) -> Columns:
+        """Returns a snapshot of the analytics columns; the builder can keep growing afterwards."""
+        a = self.arrays
+        dictionaries = {name: list(values) for name, values in self.dictionaries.items()}
+        return Columns(dictionaries, a["day"][:], a["topic"][:], a["user"][:], a["flags"][:])
+
+def build_columns(entries) -> Columns:
+    """Encodes an iterable of session entries into in-memory analytics columns (text is not kept)."""
+    builder = ColumnBuilder()
+    for entry in entries:
+        builder.add(entry)
+    return builder.columns()
+
+def write_archive(path: str, entries, line_ends=None, source_bytes: int = 0) -> dict:
+    """
+    Writes sessions to a columnar archive file, atomically (temporary file + rename).
+
+    Args:
+        path (str): Destination path.
+        entries: Session entries, oldest first.
+        line_ends (list, optional): Byte offset where each entry ended in its JSON Lines segment.
+        source_bytes (int): Size of that segment, so log positions inside it stay valid.
+
+    Returns:
+        dict: The archive header.
+    """
+    builder = ColumnBuilder(keep_text=True)
+    for i, entry in enumerate(entries):
+        builder.add(entry, line_ends[i] if line_ends else 0)
+
+    blocks, layout, offset = [], {}, 0
+    for name, _ in _FIXED_COLUMNS:
+        values = builder.arrays[name]
+        if not _LITTLE_ENDIAN:
+            values = array(values.typecode, values)
+            values.byteswap()
+        blocks.append(values.tobytes())
+    for name in _TEXT_COLUMNS:
+        blocks.append(zlib.compress(json.dumps(builder.text[name], ensure_ascii=False).encode("utf-8"),
+                                    ARCHIVE_COMPRESS_LEVEL))
+    for name, block in zip([name for name, _ in _FIXED_COLUMNS] + list(_TEXT_COLUMNS), blocks):
+        layout[name] = [offset, len(block)]
+        offset += len(block) + (-len(block)) % 8
+
+    header = dict(builder.dictionaries, rows=len(builder.arrays["flags"]), columns=layout,
+                  first_timestamp=builder.first_timestamp, last_timestamp=builder.last_timestamp,
+                  source_bytes=source_bytes)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    prefix = ARCHIVE_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix + b"\0" * ((-len(prefix)) % 8))
+        for block in blocks:
+            f.write(block + b"\0" * ((-len(block)) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return header
+
+def read_header(path: str) -> dict:
+    """Reads only the header of an archive (row count, dictionaries, timestamp bounds)."""
+    with open(path, 'rb') as f:
+        magic, length = f.read(len(ARCHIVE_MAGIC)), struct.unpack("<I", f.read(4))[0]
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a session archive.")
+        return json.loads(f.read(length))
+
+class ArchiveReader:
+    """
+    Memory-mapped view of one archive.
+
+    Fixed-width columns are returned as memoryviews over the mapping, so analytics touch only
+    the pages of the columns they use; text columns are decompressed on demand.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a session archive.")
+        length = struct.unpack_from("<I", self._map, len(ARCHIVE_MAGIC))[0]
+        start = len(ARCHIVE_MAGIC) + 4
+        self.header = json.loads(self._map[start:start + length])
+        self._data_start = start + length + (-(start + length)) % 8
+
+    def _block(self, name: str) -> memoryview:
+        offset, length = self.header["columns"][name]
+        start = self._data_start + offset
+        return memoryview(self._map)[start:start + length]
+
+    def column(self, name: str):
+        """Returns a fixed-width column as a sequence of ints (zero-copy on little-endian hosts)."""
+        code = dict(_FIXED_COLUMNS)[name]
+        if _LITTLE_ENDIAN:
+            return self._block(name).cast(code)
+        values = array(code, self._block(name).tobytes())
+        values.byteswap()
+        return values
+
+    def text(self, name: str) -> list:
+        return json.loads(zlib.decompress(self._block(name)))
+
+    def columns(self) -> Columns:
+        dictionaries = {key: self.header[key] for key in ("days", "topics", "users")}
+        return Columns(dictionaries, self.column("day"), self.column("topic"), self.column("user"),
+                       self.column("flags"))
+
+    def entries(self) -> list:
+        """Rebuilds the session entries, oldest first."""
+        users = self.header["users"]
+        rows = zip(self.text("timestamp"), self.text("question"), self.text("answer"),
+                   self.text("quiz_attempt"), self.column("user"), self.text("extra"))
+        entries = []
+        for timestamp, question, answer, quiz_attempt, user, extra in rows:
+            entry = {"timestamp": timestamp, "question": question, "answer": answer,
+                     "quiz_attempt": quiz_attempt, "user_id": users[user]}
+            if extra:
+                entry.update(extra)
+            entries.append(entry)
+        return entries
+
+def read_entries(path: str) -> list:
+    """Returns every session stored in an archive, oldest first."""
+    return ArchiveReader(path).entries()
+
+def _count(columns: Columns, group_by: str, days: set, user_id) -> dict:
+    """Counts rows per (group id, flags), restricted to the allowed day ids and user."""
+    keys = getattr(columns, group_by)
+    users = columns.dictionaries["users"]
+    if user_id is not None and user_id not in users:
+        return {}
+    day_filter = days is not None and len(days) < len(columns.dictionaries["days"])
+
+    if np is not None:
+        combined = np.frombuffer(keys, dtype=np.uint32).astype(np.int64) * 4 + np.frombuffer(columns.flags, np.uint8)
+        mask = None
+        if user_id is not None:
+            mask = np.frombuffer(columns.user, dtype=np.uint32) == users.index(user_id)
+        if day_filter:
+            allowed = np.zeros(len(columns.dictionaries["days"]), dtype=bool)
+            allowed[list(days)] = True
+            in_range = allowed[np.frombuffer(columns.day, dtype=np.uint32)]
+            mask = in_range if mask is None else mask & in_range
+        counts = np.bincount(combined if mask is None else combined[mask])
+        return {(int(i) >> 2, int(i) & 3): int(counts[i]) for i in np.flatnonzero(counts)}
+
+    # Stdlib path: the loops run inside zip/map/compress/Counter, not Python bytecode
+    selectors = []
+    if user_id is not None:
+        selectors.append(map(users.index(user_id).__eq__, columns.user))
+    if day_filter:
+        selectors.append(map(days.__contains__, columns.day))
+    pairs = zip(keys, columns.flags)
+    if selectors:
+        pairs = compress(pairs, selectors[0] if len(selectors) == 1 else map(and_, *selectors))
+    return Counter(pairs)
+
+def analytics(column_sets, group_by: str = "day", since: str = None, until: str = None,
+              user_id: str = None, limit: int = None) -> list:
+    """
+    Question volume and quiz accuracy per day, topic or user over batches of columns.
+
+    Args:
+        column_sets: Iterable of Columns (archives and/or entries encoded with build_columns()).
+        group_by (str): "day", "topic" or "user".
+        since (str, optional): First day (ISO date or timestamp) to include.
+        until (str, optional): Last day (ISO date or timestamp) to include.
+        user_id (str, optional): Only this user's sessions.
+        limit (int, optional): Maximum number of groups.
+
+    Returns:
+        list: {"key", "questions", "attempts", "correct", "accuracy"} per group; days in
+              order, topics and users by volume.
+
+    Raises:
+        ValueError: If group_by is not supported.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f"Unsupported group_by: {group_by}")
+    since, until = since and since[:10], until and until[:10]
+    totals = {}
+    for columns in column_sets:
+        days = None
+        if since or until:
+            days = {i for i, day in enumerate(columns.dictionaries["days"])
+                    if (not since or day >= since) and (not until or day <= until)}
+            if not days:
+                continue
+        names = columns.dictionaries[group_by + "s"]
+        for (key, flags), count in _count(columns, group_by, days, user_id).items():
+            group = totals.setdefault(names[key], {"questions": 0, "attempts": 0, "correct": 0})
+            if flags & FLAG_QUIZ:
+                group["attempts"] += count
+                group["correct"] += count if flags & FLAG_CORRECT else 0
+            else:
+                group["questions"] += count
+
+    return summarize_groups(totals, group_by, limit)
+
+def summarize_groups(totals: dict, group_by: str, limit: int = None) -> list:
+    """
+    Orders per-group counts for the analytics response and adds each group's accuracy.
+
+    Args:
+        totals (dict): Group key -> {"questions", "attempts", "correct"}.
+        group_by (str): "day" (listed in order) or "topic"/"user" (listed by volume).
+        limit (int, optional): Maximum number of groups.
+
+    Returns:
+        list: {"key", "questions", "attempts", "correct", "accuracy"} per group.
+    """
+    if group_by == "day":
+        ordered = sorted(totals.items())
+    else:
+        ordered = sorted(totals.items(), key=lambda item: item[1]["questions"] + item[1]["attempts"], reverse=True)
+    return [dict(counts, key=key,
+                 accuracy=round(counts["correct"] / counts["attempts"], 4) if counts["attempts"] else None)
+            for key, counts in ordered[:limit]]
+
+if __name__ == '__main__':
+    # Compaction job and analytics report (run from the repository root):
+    #   python -m utils.history_archive compact
+    #   python -m utils.history_archive analytics --group-by topic --since 2025-01-01
+    import argparse
+
+    from utils import tracker
+    from utils.session_store import get_session_store
+
+    parser = argparse.ArgumentParser(description="Compact the session log and report history analytics.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("compact", help="Roll sealed log segments into columnar archives (file backend).")
+    report = subcommands.add_parser("analytics", help="Print question volume and accuracy.")
+    report.add_argument("--group-by", choices=GROUP_BY, default="day")
+    report.add_argument("--since")
+    report.add_argument("--until")
+    report.add_argument("--user-id")
+    report.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"Compacted {tracker.compact_segments()} segment(s) in {tracker.LOG_DIR}.")
+    else:
+        for group in get_session_store().analytics(args.group_by, args.since, args.until, args.user_id, args.limit):
+            print(json.dumps(group, ensure_ascii=False))
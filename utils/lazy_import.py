@@ -0,0 +1,43 @@
+# lazy_import.py
+import importlib
+import os
+import threading
+
+# Fast-startup mode (the default) defers heavy modules until the first call that needs them,
+# so a worker is ready to serve sooner. Set FAST_STARTUP=0 to import them up front instead,
+# e.g. under gunicorn --preload where they are loaded once and shared by every forked worker.
+FAST_STARTUP = os.environ.get("FAST_STARTUP", "1") != "0"
+
+# Imported on first use: the HTTP clients for upstream calls and the optional speech engines
+HEAVY_MODULES = ("requests", "pyttsx3", "faster_whisper")
+
+_missing = set()  # Optional modules that failed to import; not retried on every call
+_lock = threading.Lock()
+
+def optional_import(name: str):
+    """
+    Imports an optional module on first use.
+
+    Args:
+        name (str): Module name, e.g. "pyttsx3".
+
+    Returns:
+        The module, or None if it is not installed (remembered, so later calls are free).
+    """
+    if name in _missing:
+        return None
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        with _lock:
+            _missing.add(name)
+        return None
+
+def preload(names=HEAVY_MODULES) -> dict:
+    """
+    Imports modules ahead of their first use.
+
+    Returns:
+        dict: Module name -> True if it is available.
+    """
+    return {name: optional_import(name) is not None for name in names}
@@ -0,0 +1,261 @@
+# llm_client.py
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+from utils.llm_scheduler import PRIORITY_INTERACTIVE, llm_scheduler
+from utils.metrics import registry
+
+
+# Shared settings for every OpenAI-bound call, overridable from the environment
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 20))
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 32))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Instrumentation: children are created once here so each call only increments counters
+_UPSTREAM_LATENCY = registry.histogram("llm_upstream_duration_seconds",
+                                       "Latency of each upstream chat completion attempt.")
+_UPSTREAM_RETRIES = registry.counter("llm_upstream_retries_total", "Upstream attempts that were retried.")
+
+def _record_error(status) -> None:
+    """Counts a failed upstream attempt by HTTP status (or exception name)."""
+    registry.counter("llm_upstream_errors_total", "Failed upstream attempts.", status=str(status)).inc()
+
+def record_usage(response_data: dict) -> None:
+    """Accounts prompt/completion tokens from a completion's `usage` field."""
+    usage = (response_data or {}).get("usage")
+    if not usage:
+        return
+    model = response_data.get("model", "unknown")
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            registry.counter("llm_tokens_total", "Tokens used, from completion usage fields.",
+                             model=model, type=kind[:-len("_tokens")]).inc(usage[kind])
+
+class LLMError(Exception):
+    """Raised when an upstream call fails for good (non-retryable status or retries exhausted)."""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _parse_retry_after(value) -> float:
+    """Parses a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class LLMClient:
+    """
+    Pooled, keep-alive HTTP client for chat completion endpoints.
+
+    One client is shared by every module in the process so TCP+TLS connections are reused
+    across calls. Failed calls on 429/5xx, timeouts and connection errors are retried with
+    exponential backoff and full jitter, waiting at least as long as any Retry-After header.
+    Every attempt, retries included, is first admitted by utils/llm_scheduler.py against the
+    provider's RPM/TPM budget; a failed attempt refunds its reserved tokens.
+    """
+
+    def __init__(self, connect_timeout: float = LLM_CONNECT_TIMEOUT, read_timeout: float = LLM_READ_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, pool_size: int = LLM_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        """Returns this process's pooled requests.Session, rebuilding it after a fork."""
+        import requests  # Deferred: requests and its CA bundle are a large part of worker startup
+        from requests.adapters import HTTPAdapter
+        with self._lock:
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def _backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    @staticmethod
+    def _headers(api_key: str) -> dict:
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    @staticmethod
+    def _note_retry_after(response, payload: dict) -> float:
+        """Parses Retry-After and, on a 429, pauses the model's budget so other calls wait too."""
+        retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+        if response.status_code == 429:
+            llm_scheduler.backoff(payload.get("model", ""), retry_after)
+        return retry_after
+
+    def chat_completion(self, payload: dict, api_key: str, endpoint: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
+        """
+        Sends a chat completion request and returns the decoded JSON response.
+
+        Args:
+            payload (dict): The request body (model, messages, ...).
+            api_key (str): Bearer token for the endpoint.
+            endpoint (str): Full chat completions URL.
+            priority (int): llm_scheduler priority; background work yields to interactive calls.
+
+        Returns:
+            dict: The decoded response body.
+
+        Raises:
+            LLMError: On a non-retryable error status or once retries are exhausted.
+            Overloaded: If the rate-limit budget cannot admit the call in time.
+            json.JSONDecodeError: If a successful response is not valid JSON.
+        """
+        import requests  # Already loaded by _get_session(); needed for the exception types
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            payload, reservation = llm_scheduler.admit(payload, priority)  # Retries count against the budget too
+            try:
+                with _UPSTREAM_LATENCY.time():
+                    response = session.post(endpoint, headers=self._headers(api_key), json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                reservation.release()
+                _record_error(e.__class__.__name__)
+                if attempt == self.max_retries:
+                    raise LLMError(f"{e.__class__.__name__}: {e}")
+            else:
+                if response.status_code < 400:
+                    response_data = response.json()
+                    record_usage(response_data)
+                    reservation.settle(response_data.get("usage"))
+                    return response_data
+                reservation.release()
+                _record_error(response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise LLMError(f"HTTP {response.status_code}: {response.text[:500]}", response.status_code)
+                retry_after = self._note_retry_after(response, payload)
+            _UPSTREAM_RETRIES.inc()
+            time.sleep(self._backoff(attempt, retry_after))
+        raise LLMError("Retries exhausted")  # Not reached; keeps the return path explicit
+
+    def stream_chat_completion(self, payload: dict, api_key: str, endpoint: str, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Sends a streaming chat completion request and yields content deltas as they arrive.
+
+        Retries (same policy as chat_completion) only happen before the first byte of the
+        stream; once deltas have been yielded a failure is raised to the caller.
+
+        Args:
+            payload (dict): The request body; "stream": True is added.
+            api_key (str): Bearer token for the endpoint.
+            endpoint (str): Full chat completions URL.
+            priority (int): llm_scheduler priority.
+
+        Yields:
+            str: Each non-empty content delta.
+
+        Raises:
+            LLMError: On a non-retryable error status, exhausted retries, or a broken stream.
+            Overloaded: If the rate-limit budget cannot admit the call in time.
+        """
+        import requests  # Already loaded by _get_session(); needed for the exception types
+        session = self._get_session()
+        # include_usage adds a final chunk carrying the usage field for token accounting
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        response = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            payload, reservation = llm_scheduler.admit(payload, priority)
+            try:
+                with _UPSTREAM_LATENCY.time():  # Time to response headers
+                    response = session.post(endpoint, headers=self._headers(api_key), json=payload,
+                                            timeout=self.timeout, stream=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                reservation.release()
+                _record_error(e.__class__.__name__)
+                if attempt == self.max_retries:
+                    raise LLMError(f"{e.__class__.__name__}: {e}")
+            else:
+                if response.status_code < 400:
+                    break
+                reservation.release()
+                _record_error(response.status_code)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise LLMError(f"HTTP {response.status_code}: {response.text[:500]}", response.status_code)
+                retry_after = self._note_retry_after(response, payload)
+                response.close()
+            _UPSTREAM_RETRIES.inc()
+            time.sleep(self._backoff(attempt, retry_after))
+
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    chunk = json.loads(data)
+                    record_usage(chunk)
+                    reservation.settle(chunk.get("usage"))
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                _record_error("StreamInterrupted")
+                raise LLMError(f"Stream interrupted: {e}")
+
+    def close(self):
+        """Closes pooled connections."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    """Returns the process-wide LLMClient shared by ai_response.py and quiz_generator.py."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
+
+if __name__ == '__main__':
+    # Example usage against the local mock server (python -m utils.llm_client)
+    from utils.mock_llm_server import start_mock_server
+
+    server, url = start_mock_server(latency=0.05, fail_first=2)
+    client = get_llm_client()
+    body = {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "What is gravity?"}]}
+    print(client.chat_completion(body, "test-key", url)["choices"][0]["message"]["content"])
+    server.shutdown()
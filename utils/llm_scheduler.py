@@ -0,0 +1,317 @@
+# llm_scheduler.py
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from utils.concurrency import Overloaded
+from utils.metrics import registry
+
+try:
+    import fcntl  # Locks the shared budget state so every worker process draws on one budget
+except ImportError:
+    fcntl = None  # Windows: each process keeps its own budget
+
+# Provider budgets per model (requests and tokens per minute), overridable from the environment.
+# 0 disables a limit. The fallback model, if set, is used for interactive calls that would
+# otherwise wait longer than LLM_BUDGET_MAX_WAIT for the requested model.
+LLM_RPM = int(os.environ.get("LLM_RPM", 3500))
+LLM_TPM = int(os.environ.get("LLM_TPM", 200000))
+LLM_FALLBACK_MODEL = os.environ.get("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_RPM = int(os.environ.get("LLM_FALLBACK_RPM", LLM_RPM))
+LLM_FALLBACK_TPM = int(os.environ.get("LLM_FALLBACK_TPM", LLM_TPM))
+LLM_BUDGET_MAX_WAIT = float(os.environ.get("LLM_BUDGET_MAX_WAIT", 10))                 # Interactive calls
+LLM_BACKGROUND_MAX_WAIT = float(os.environ.get("LLM_BACKGROUND_MAX_WAIT", 120))        # Pre-generation
+LLM_BACKGROUND_RESERVE = float(os.environ.get("LLM_BACKGROUND_RESERVE", 0.2))  # Budget share kept for interactive
+# Bucket levels shared by the worker processes of one host. Empty keeps the budget per process.
+LLM_BUDGET_STATE = os.environ.get("LLM_BUDGET_STATE", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                   '..', 'data', 'llm-budget.json'))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+def estimate_tokens(payload: dict) -> int:
+    """
+    Estimates the tokens a chat completion will consume: prompt plus the max_tokens ceiling.
+
+    The prompt is approximated at 4 characters per token plus a small per-message overhead;
+    the reservation is corrected from the response's usage field once it arrives.
+    """
+    prompt = sum(len(str(message.get("content", ""))) // 4 + 4 for message in payload.get("messages", [])) + 3
+    return prompt + int(payload.get("max_tokens") or 500)
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to one minute of budget."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float, reserve: float = 0.0) -> float:
+        """Seconds until amount is available while keeping reserve (a fraction of capacity) untouched."""
+        self.refill(now)
+        needed = min(amount, self.capacity) + reserve * self.capacity - self.level
+        return max(0.0, needed / self.rate)
+
+class _ModelBudget:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.blocked_until = 0.0  # Set from a 429's Retry-After
+        self.waiting = []         # Heap of (priority, seq, tokens) waiting for this model
+
+    def wait_time(self, tokens: float, requests: int, now: float, reserve: float) -> float:
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(requests, now, reserve))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now, reserve))
+        return wait
+
+    def take(self, tokens: float):
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            self.tokens.level -= tokens
+
+class _SharedBudgets:
+    """
+    Bucket levels and Retry-After pauses kept in a state file that every worker process locks
+    (fcntl) around each read-modify-write, so the RPM/TPM limits hold for the host as a whole.
+
+    Levels are stored refilled to the wall-clock time of the write and loaded into the process's
+    own _ModelBudget, whose queue and priorities stay local. The file is not fsynced: after a
+    crash the buckets start full, as they do on a fresh start.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextlib.contextmanager
+    def synced(self, model: str, budget: _ModelBudget):
+        """Loads the model's shared levels into budget, and writes them back if the block completes."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {}  # Torn by a crash mid-write: start from full buckets
+                self._load(state.get(model), budget)
+                yield
+                state[model] = self._dump(budget)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _load(saved: dict, budget: _ModelBudget):
+        if not saved:
+            return
+        now, wall = time.monotonic(), time.time()
+        for name in ("requests", "tokens"):
+            bucket = getattr(budget, name)
+            if bucket is not None and saved.get(name) is not None:
+                elapsed = max(0.0, wall - saved["written"])
+                bucket.level = min(bucket.capacity, saved[name] + elapsed * bucket.rate)
+                bucket._updated = now
+        budget.blocked_until = max(budget.blocked_until, now + saved.get("blocked_until", 0) - wall)
+
+    @staticmethod
+    def _dump(budget: _ModelBudget) -> dict:
+        now, wall = time.monotonic(), time.time()
+        saved = {"written": wall, "blocked_until": wall + max(0.0, budget.blocked_until - now)}
+        for name in ("requests", "tokens"):
+            bucket = getattr(budget, name)
+            if bucket is not None:
+                bucket.refill(now)
+                saved[name] = bucket.level
+        return saved
+
+class Reservation:
+    """
+    Budget taken for one upstream attempt; settle() corrects it with the actual usage and
+    release() refunds the tokens of an attempt that returned no completion.
+    """
+
+    def __init__(self, scheduler, model: str, tokens: int):
+        self.scheduler = scheduler
+        self.model = model
+        self.tokens = tokens
+
+    def settle(self, usage: dict):
+        """Returns unused tokens to the bucket (or charges the overrun) given a completion's usage."""
+        if not usage or not usage.get("total_tokens"):
+            return
+        self.scheduler._adjust(self.model, self.tokens - usage["total_tokens"])
+        self.tokens = usage["total_tokens"]
+
+    def release(self):
+        """Returns all reserved tokens after a failed attempt. The request stays counted, as the provider counts it."""
+        if self.tokens:
+            self.scheduler._adjust(self.model, self.tokens)
+            self.tokens = 0
+
+class LLMScheduler:
+    """
+    Token-bucket admission control in front of every upstream chat completion.
+
+    Each model has a requests-per-minute and a tokens-per-minute bucket. Every attempt, retries
+    included, reserves one request and its estimated tokens before it is sent, waiting in a per-model priority queue
+    when the budget is exhausted: interactive calls are served before background ones, and
+    background calls may not dip into the last LLM_BACKGROUND_RESERVE of either bucket.
+    A call whose expected wait exceeds its limit is degraded to LLM_FALLBACK_MODEL
+    (interactive only) or shed with Overloaded, which the routes turn into a 503.
+
+    With a state_path the bucket levels are shared with every process using the same file
+    (see _SharedBudgets); without one, or where fcntl is unavailable, they are per process.
+    """
+
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM, fallback_model: str = LLM_FALLBACK_MODEL,
+                 fallback_rpm: int = LLM_FALLBACK_RPM, fallback_tpm: int = LLM_FALLBACK_TPM,
+                 max_wait: float = LLM_BUDGET_MAX_WAIT, background_max_wait: float = LLM_BACKGROUND_MAX_WAIT,
+                 background_reserve: float = LLM_BACKGROUND_RESERVE, state_path: str = None):
+        self.rpm, self.tpm = rpm, tpm
+        self.fallback_model = fallback_model
+        self.fallback_limits = (fallback_rpm, fallback_tpm)
+        self.max_wait = {PRIORITY_INTERACTIVE: max_wait, PRIORITY_BACKGROUND: background_max_wait}
+        self.background_reserve = background_reserve
+        self._budgets = {}
+        self._shared = _SharedBudgets(state_path) if state_path and fcntl is not None else None
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"interactive": 0, "background": 0, "degraded": 0, "shed": 0, "waited": 0}
+
+    def _budget_locked(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            limits = self.fallback_limits if model == self.fallback_model else (self.rpm, self.tpm)
+            budget = self._budgets[model] = _ModelBudget(*limits)
+        return budget
+
+    def _synced_locked(self, model: str, budget: _ModelBudget):
+        """Context in which budget holds the levels shared with the other processes."""
+        return self._shared.synced(model, budget) if self._shared is not None else contextlib.nullcontext()
+
+    def _expected_wait_locked(self, budget: _ModelBudget, entry: tuple, now: float) -> float:
+        # Everything queued ahead of this entry is served first
+        ahead = [e for e in budget.waiting if e < entry]
+        reserve = self.background_reserve if entry[0] == PRIORITY_BACKGROUND else 0.0
+        return budget.wait_time(sum(e[2] for e in ahead) + entry[2], len(ahead) + 1, now, reserve)
+
+    def admit(self, payload: dict, priority: int = PRIORITY_INTERACTIVE) -> tuple:
+        """
+        Waits until the budget allows the call, possibly switching it to the fallback model.
+
+        Args:
+            payload (dict): The chat completion request body.
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND.
+
+        Returns:
+            tuple: (payload to send, Reservation to settle with the response's usage).
+
+        Raises:
+            Overloaded: If the call cannot be admitted within its maximum wait.
+        """
+        tokens = estimate_tokens(payload)
+        deadline = time.monotonic() + self.max_wait[priority]
+        with self._cond:
+            model = payload.get("model", "")
+            budget = self._budget_locked(model)
+            entry = (priority, next(self._seq), tokens)
+            heapq.heappush(budget.waiting, entry)
+            waited = False
+            try:
+                while True:
+                    with self._synced_locked(model, budget):
+                        now = time.monotonic()
+                        wait = self._expected_wait_locked(budget, entry, now)
+                        admitted = wait == 0 and budget.waiting[0] == entry
+                        if admitted:
+                            budget.take(tokens)
+                    if admitted:
+                        heapq.heappop(budget.waiting)
+                        break
+                    if wait > deadline - now:
+                        if (priority == PRIORITY_INTERACTIVE and self.fallback_model
+                                and model != self.fallback_model):
+                            # Degrade: queue for the cheaper model instead
+                            budget.waiting.remove(entry)
+                            heapq.heapify(budget.waiting)
+                            model = self.fallback_model
+                            payload = dict(payload, model=model)
+                            budget = self._budget_locked(model)
+                            heapq.heappush(budget.waiting, entry)
+                            self.stats["degraded"] += 1
+                            continue
+                        self.stats["shed"] += 1
+                        raise Overloaded(f"Upstream {model} budget exhausted; retry in {wait:.0f}s.")
+                    waited = True
+                    if budget.waiting[0] == entry:
+                        self._cond.wait(min(max(wait, 0.001), deadline - now))  # Until the budget refills
+                    else:
+                        self._cond.wait(deadline - now)  # Woken when a call ahead leaves the queue
+            finally:
+                if entry in budget.waiting:
+                    budget.waiting.remove(entry)
+                    heapq.heapify(budget.waiting)
+                self._cond.notify_all()
+            self.stats[_PRIORITY_NAMES[priority]] += 1
+            self.stats["waited"] += waited
+        return payload, Reservation(self, model, tokens)
+
+    def _adjust(self, model: str, tokens: float):
+        with self._cond:
+            budget = self._budget_locked(model)
+            if budget.tokens is not None:
+                with self._synced_locked(model, budget):
+                    budget.tokens.refill(time.monotonic())
+                    budget.tokens.level = min(budget.tokens.capacity, budget.tokens.level + tokens)
+            self._cond.notify_all()
+
+    def backoff(self, model: str, retry_after: float):
+        """Pauses admissions for a model after the provider answered 429 with Retry-After."""
+        if not retry_after:
+            return
+        with self._cond:
+            budget = self._budget_locked(model)
+            with self._synced_locked(model, budget):
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + retry_after)
+
+    def get_stats(self) -> dict:
+        """Returns admission counters plus queued calls and available tokens per model."""
+        with self._cond:
+            available = {}
+            for model, budget in self._budgets.items():
+                if budget.tokens is not None:
+                    with self._synced_locked(model, budget):
+                        budget.tokens.refill(time.monotonic())
+                        available[model] = budget.tokens.level
+            return dict(self.stats, queued=sum(len(b.waiting) for b in self._budgets.values()),
+                        tokens_available=available)
+
+# Shared by every LLMClient call in the process, and through LLM_BUDGET_STATE with the other workers
+llm_scheduler = LLMScheduler(state_path=LLM_BUDGET_STATE or None)
+registry.register_collector("llm_budget_admissions_total", "counter",
+                            "Upstream calls admitted by priority, degraded to the fallback model, shed or delayed.",
+                            lambda: {(("outcome", key),): llm_scheduler.get_stats()[key]
+                                     for key in ("interactive", "background", "degraded", "shed", "waited")})
+registry.register_collector("llm_budget_queued", "gauge", "Upstream calls waiting for rate-limit budget.",
+                            lambda: {(): llm_scheduler.get_stats()["queued"]})
+registry.register_collector("llm_budget_tokens_available", "gauge", "Tokens left in each model's per-minute bucket.",
+                            lambda: {(("model", model),): round(level)
+                                     for model, level in llm_scheduler.get_stats()["tokens_available"].items()})
@@ -0,0 +1,191 @@
+# metrics.py
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond file I/O up to slow upstream completions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class _Timer:
+    """Context manager that observes the elapsed time into a histogram."""
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+class Histogram:
+    """
+    Fixed-bucket histogram; observe() only increments preallocated counters.
+
+    Quantiles are estimated by linear interpolation inside the bucket that holds them,
+    which is accurate to the bucket width and costs nothing on the hot path.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        """Times a with-block: `with histogram.time(): ...`."""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile (0 < q < 1) from the bucket counts."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # Beyond the last bound; report the bound
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+class MetricsRegistry:
+    """
+    Holds named, labelled metrics and renders them in the Prometheus text format.
+
+    Children are created once per label set and cached, so instrumented code paths only do a
+    dict lookup per observation. Modules with their own counters (caches, pools, limiters)
+    register a collector callback that is only invoked when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self._families = {}    # name -> (type, help, {labels: metric})
+        self._collectors = []  # (name, type, help, fn returning {labels tuple: value})
+        self._lock = threading.Lock()
+
+    def _child(self, kind: str, factory, name: str, help_text: str, labels: dict):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None:
+            child = family[2].get(key)
+            if child is not None:
+                return child
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            return family[2].setdefault(key, factory())
+
+    def histogram(self, name: str, help_text: str, **labels) -> Histogram:
+        """Returns the histogram for name + labels, creating it on first use."""
+        return self._child("histogram", Histogram, name, help_text, labels)
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        """Returns the counter for name + labels, creating it on first use."""
+        return self._child("counter", Counter, name, help_text, labels)
+
+    def register_collector(self, name: str, kind: str, help_text: str, fn):
+        """
+        Registers a callback evaluated at scrape time.
+
+        Args:
+            name (str): Metric name.
+            kind (str): "gauge" or "counter".
+            help_text (str): HELP text.
+            fn: Callable returning {labels tuple: value}, e.g. {(("tier", "exact"),): 12}.
+        """
+        with self._lock:
+            self._collectors.append((name, kind, help_text, fn))
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, dict(children))
+                        for name, (kind, help_text, children) in sorted(self._families.items())]
+            collectors = list(self._collectors)
+
+        for name, kind, help_text, children in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(children.items()):
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                with metric._lock:
+                    counts, total, sum_ = list(metric.counts), metric.count, metric.sum
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {sum_}")
+                lines.append(f"{name}_count{_format_labels(labels)} {total}")
+            if kind == "histogram":
+                # Pre-computed p50/p95/p99 for dashboards without histogram_quantile()
+                lines.append(f"# HELP {name}_quantile Estimated quantiles of {name}.")
+                lines.append(f"# TYPE {name}_quantile gauge")
+                for labels, metric in sorted(children.items()):
+                    for q in QUANTILES:
+                        lines.append(f"{name}_quantile{_format_labels(labels + (('quantile', str(q)),))} "
+                                     f"{metric.quantile(q)}")
+
+        for name, kind, help_text, fn in collectors:
+            try:
+                values = fn()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry rendered by the /metrics route
+registry = MetricsRegistry()
+
+def stage_timer(stage: str) -> Histogram:
+    """Histogram for one internal stage (tracker I/O, JSON serialization, ...)."""
+    return registry.histogram("stage_duration_seconds", "Time spent in internal processing stages.", stage=stage)
+
+def stats_collector(stats_fn, keys: tuple, label: str = "kind"):
+    """Adapts a get_stats() method into a collector returning the selected keys as labels."""
+    def collect():
+        stats = stats_fn()
+        return {((label, key),): stats.get(key, 0) for key in keys}
+    return collect
@@ -0,0 +1,178 @@
+# mock_llm_server.py
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions API, for tests and benchmarks.
+# It answers any POST with a canned completion after a configurable delay, streams it
+# as server-sent events when the request sets "stream": true, and can inject 429
+# responses (with Retry-After) to exercise client retry logic.
+
+MOCK_QUIZ = {
+    "question": "What is the main component of air?",
+    "options": ["Nitrogen", "Oxygen", "Carbon Dioxide", "Hydrogen"],
+    "answer": "Nitrogen"
+}
+
+class MockLLMConfig:
+    """Behaviour knobs shared by all handler threads."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_ratio: float = 0.0,
+                 fail_first: int = 0, retry_after: float = 0.0, token_latency: float = 0.0):
+        self.latency = latency                    # Seconds before each response (time to first token)
+        self.jitter = jitter                      # Extra uniform random delay in seconds
+        self.token_latency = token_latency        # Seconds between streamed tokens
+        self.rate_limit_ratio = rate_limit_ratio  # Fraction of requests answered with 429
+        self.fail_first = fail_first              # The first N requests are answered with 429
+        self.retry_after = retry_after            # Retry-After value sent with each 429
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def build_completion(payload: dict) -> dict:
+    """Builds a canned chat completion for the given request body."""
+    messages = payload.get("messages") or [{"content": ""}]
+    prompt = messages[-1].get("content", "")
+    if (payload.get("response_format") or {}).get("type") == "json_object":
+        batch = re.search(r"Generate (\d+) different multiple-choice", prompt)
+        if batch:
+            questions = [dict(MOCK_QUIZ, question=f"{MOCK_QUIZ['question']} (#{i + 1})")
+                         for i in range(int(batch.group(1)))]
+            content = json.dumps({"questions": questions})
+        else:
+            content = json.dumps(MOCK_QUIZ)
+    else:
+        content = f"Mock answer: {prompt.strip()[:200]}"
+    prompt_tokens = sum(_estimate_tokens(m.get("content", "")) for m in messages)
+    completion_tokens = _estimate_tokens(content)
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def _make_handler(config: MockLLMConfig):
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark and test output quiet
+
+        def _send_json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "Invalid JSON body."}})
+                return
+
+            with config.lock:
+                config.requests += 1
+                count = config.requests
+            if count <= config.fail_first or random.random() < config.rate_limit_ratio:
+                self._send_json(429, {"error": {"message": "Rate limit reached (mock)."}},
+                                {"Retry-After": str(config.retry_after)})
+                return
+
+            delay = config.latency + random.uniform(0, config.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            completion = build_completion(payload)
+            if payload.get("stream"):
+                self._send_stream(payload, completion)
+            else:
+                self._send_json(200, completion)
+
+        def _send_stream(self, payload: dict, completion: dict):
+            """Streams the completion word by word as chat.completion.chunk events."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_event(data: str):
+                body = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+                self.wfile.flush()
+
+            content = completion["choices"][0]["message"]["content"]
+            for i, token in enumerate(content.split(" ")):
+                delta = token if i == 0 else " " + token
+                chunk = {"object": "chat.completion.chunk", "model": completion["model"],
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                write_event(json.dumps(chunk))
+                if config.token_latency > 0:
+                    time.sleep(config.token_latency)
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                write_event(json.dumps({"object": "chat.completion.chunk", "model": completion["model"],
+                                        "choices": [], "usage": completion["usage"]}))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return MockLLMHandler
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **options):
+    """
+    Starts the mock server on a background thread.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free port.
+        **options: MockLLMConfig settings (latency, jitter, token_latency, rate_limit_ratio,
+                   fail_first, retry_after).
+
+    Returns:
+        tuple: (server, url) where url is the chat completions endpoint. Call server.shutdown() to stop.
+    """
+    config = MockLLMConfig(**options)
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}/v1/chat/completions"
+    return server, url
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay in seconds.")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Seconds between streamed tokens.")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s.")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                    token_latency=args.token_latency,
+                                    rate_limit_ratio=args.rate_limit_ratio, retry_after=args.retry_after)
+    print(f"Mock LLM server listening on {url}")
+    print(f"Point the app at it with: OPENAI_API_ENDPOINT={url} API_KEY=test")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
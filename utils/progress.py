@@ -0,0 +1,78 @@
+# progress.py
+from datetime import date, timedelta
+
+from utils.response_cache import normalize_prompt
+
+# Aggregates kept per user: totals plus one record per topic, updated as sessions are logged
+PROGRESS_MAX_TOPICS = 200   # Least recently seen topics beyond this are dropped from a user's record
+TOPIC_MAX_LENGTH = 80
+
+def topic_of(entry: dict) -> str:
+    """
+    Returns the topic a session counts towards.
+
+    Uses quiz_attempt["topic"] when the client sent one, otherwise the normalized question.
+    """
+    quiz_attempt = entry.get("quiz_attempt") or {}
+    return normalize_prompt(quiz_attempt.get("topic") or entry.get("question") or "")[:TOPIC_MAX_LENGTH]
+
+def _empty_counts() -> dict:
+    return {"questions": 0, "attempts": 0, "correct": 0, "streak": 0, "best_streak": 0, "last_seen": None}
+
+def empty_progress() -> dict:
+    """Returns the aggregate record of a user with no sessions."""
+    return {"totals": dict(_empty_counts(), active_days=0, day_streak=0, last_active_day=None), "topics": {}}
+
+def _count(counts: dict, entry: dict):
+    quiz_attempt = entry.get("quiz_attempt") or {}
+    if quiz_attempt:
+        counts["attempts"] += 1
+        if quiz_attempt.get("is_correct"):
+            counts["correct"] += 1
+            counts["streak"] += 1
+            counts["best_streak"] = max(counts["best_streak"], counts["streak"])
+        else:
+            counts["streak"] = 0
+    else:
+        counts["questions"] += 1
+    counts["last_seen"] = max(counts["last_seen"] or "", entry.get("timestamp") or "") or None
+
+def apply_session(progress: dict, entry: dict) -> dict:
+    """
+    Folds one session into a user's aggregate record (in place) and returns it.
+
+    Quiz attempts update attempts/correct and the run of consecutive correct answers;
+    other sessions count as questions. The totals also track days with activity and the
+    current run of consecutive active days.
+    """
+    totals = progress["totals"]
+    _count(totals, entry)
+    day = (entry.get("timestamp") or "")[:10]
+    last_day = totals["last_active_day"]
+    if day and day != last_day and (last_day is None or day > last_day):
+        following = last_day and (date.fromisoformat(last_day) + timedelta(days=1)).isoformat() == day
+        totals["day_streak"] = totals["day_streak"] + 1 if following else 1
+        totals["active_days"] += 1
+        totals["last_active_day"] = day
+
+    topic = topic_of(entry)
+    if topic:
+        topics = progress["topics"]
+        _count(topics.setdefault(topic, _empty_counts()), entry)
+        if len(topics) > PROGRESS_MAX_TOPICS:
+            stale = min(topics, key=lambda name: topics[name]["last_seen"] or "")
+            del topics[stale]
+    return progress
+
+def summarize_progress(user_id: str, progress: dict) -> dict:
+    """Formats a user's aggregate record for the /progress endpoint (accuracy added, topics most recent first)."""
+    def with_accuracy(counts):
+        accuracy = round(counts["correct"] / counts["attempts"], 4) if counts["attempts"] else None
+        return dict(counts, accuracy=accuracy)
+
+    topics = sorted(progress["topics"].items(), key=lambda item: item[1]["last_seen"] or "", reverse=True)
+    return {
+        "user_id": user_id,
+        "totals": with_accuracy(progress["totals"]),
+        "topics": [dict(with_accuracy(counts), topic=topic) for topic, counts in topics],
+    }
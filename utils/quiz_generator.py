@@ -1,37 +1,33 @@
 # quiz_generator.py
-import requests
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.concurrency import Overloaded
+from utils.llm_client import LLMError, get_llm_client
+from utils.llm_scheduler import PRIORITY_INTERACTIVE
+from utils.response_cache import normalize_prompt, response_cache
+from utils.single_flight import llm_flights
 
 # Placeholder for your OpenAI API Key for quiz generation
 OPENAI_API_KEY_QUIZ = os.environ.get("OPENAI_API_KEY_QUIZ", "***")
-OPENAI_QUIZ_ENDPOINT = "https://api.openai.com/v1/chat/completions"
+OPENAI_QUIZ_ENDPOINT = os.environ.get("OPENAI_QUIZ_ENDPOINT",
+                                      os.environ.get("OPENAI_API_ENDPOINT", "https://api.openai.com/v1/chat/completions"))
 
-def generate_quiz(topic_or_answer: str) -> dict:
-    """
-    Generates a multiple-choice quiz based on a given topic or answer using the OpenAI API.
+QUIZ_MODEL = "gpt-3.5-turbo" # Recommended for cost-efficiency and good performance
+QUIZ_TEMPERATURE = 0.7 # Can be adjusted for more creative/diverse options
 
-    Args:
-        topic_or_answer (str): The text or topic from which to generate a quiz.
+MAX_BATCH_SIZE = 20
+QUIZ_FANOUT_WORKERS = int(os.environ.get("QUIZ_FANOUT_WORKERS", 4)) # Bound on concurrent single-quiz top-ups
 
-    Returns:
-        dict: A dictionary containing the quiz question, options, and correct answer,
-              or an error dictionary.
-        Example structure:
-        {
-            "question": "What is the capital of France?",
-            "options": ["Berlin", "Madrid", "Paris", "Rome"],
-            "answer": "Paris"
-        }
-    """
-    if not OPENAI_API_KEY_QUIZ or OPENAI_API_KEY_QUIZ == "***":
-        return {"error": "OpenAI API Key for quiz generation is not set. Please set the OPENAI_API_KEY_QUIZ environment variable or update it in quiz_generator.py."}
+MISSING_KEY_ERROR = {"error": "OpenAI API Key for quiz generation is not set. Please set the OPENAI_API_KEY_QUIZ environment variable or update it in quiz_generator.py."}
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY_QUIZ}",
-        "Content-Type": "application/json"
-    }
+def is_configured() -> bool:
+    """Returns True if an OpenAI API key is available for quiz generation."""
+    return bool(OPENAI_API_KEY_QUIZ) and OPENAI_API_KEY_QUIZ != "***"
 
+def _build_payload(topic_or_answer: str) -> dict:
+    """Builds the chat completions request body for a single-question quiz."""
     # Craft a prompt that instructs the AI to generate a quiz in a specific JSON format
     prompt_template = f"""
     Generate a single multiple-choice question (MCQ) quiz based on the following text/topic.
@@ -48,47 +44,172 @@ def generate_quiz(topic_or_answer: str) -> dict:
     "{topic_or_answer}"
     """
 
-    payload = {
-        "model": "gpt-3.5-turbo", # Recommended for cost-efficiency and good performance
+    return {
+        "model": QUIZ_MODEL,
         "messages": [
             {"role": "system", "content": "You are a quiz master. Generate quizzes in strict JSON format."},
             {"role": "user", "content": prompt_template}
         ],
-        "temperature": 0.7, # Can be adjusted for more creative/diverse options
+        "temperature": QUIZ_TEMPERATURE,
         "max_tokens": 200,  # Max tokens for the quiz generation JSON (adjust if quizzes get longer)
         "response_format": {"type": "json_object"} # Crucial for getting JSON output
     }
 
-    raw_content = "" # Initialize raw_content to an empty string
+def is_valid_quiz(quiz_data) -> bool:
+    """Checks the quiz structure: a question, exactly 4 options, and an answer among them."""
+    return isinstance(quiz_data, dict) and \
+        all(k in quiz_data for k in ["question", "options", "answer"]) and \
+        isinstance(quiz_data["options"], list) and len(quiz_data["options"]) == 4 and \
+        quiz_data["answer"] in quiz_data["options"] # Ensure answer is one of the options
 
+def _parse_quiz(topic_or_answer: str, use_cache: bool, response_data: dict) -> dict:
+    """Parses and validates the quiz JSON from a completion response, caching valid quizzes."""
+    raw_content = "" # Initialize raw_content to an empty string
     try:
-        response = requests.post(OPENAI_QUIZ_ENDPOINT, headers=headers, data=json.dumps(payload))
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        
-        response_data = response.json()
-        
         if response_data and 'choices' in response_data and len(response_data['choices']) > 0:
             raw_content = response_data['choices'][0]['message']['content']
             # Attempt to parse the JSON content
             quiz_data = json.loads(raw_content)
-            
+
             # Basic validation of the quiz structure
-            if all(k in quiz_data for k in ["question", "options", "answer"]) and \
-               isinstance(quiz_data["options"], list) and len(quiz_data["options"]) == 4 and \
-               quiz_data["answer"] in quiz_data["options"]: # Ensure answer is one of the options
+            if is_valid_quiz(quiz_data):
+                if use_cache:
+                    response_cache.put(topic_or_answer, quiz_data, QUIZ_MODEL, QUIZ_TEMPERATURE, namespace="quiz")
                 return quiz_data
             else:
                 return {"error": "Generated quiz data has an invalid format or invalid answer.", "raw_response": raw_content}
         else:
             return {"error": "Unexpected response format from OpenAI quiz API.", "response_data": response_data}
+    except json.JSONDecodeError as e:
+        return {"error": f"Could not decode JSON quiz response: {e}. Raw content: {raw_content}"}
+
+def generate_quiz(topic_or_answer: str, use_cache: bool = True, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """
+    Generates a multiple-choice quiz based on a given topic or answer using the OpenAI API.
+
+    Args:
+        topic_or_answer (str): The text or topic from which to generate a quiz.
+        use_cache (bool): Reuse a quiz generated for the same text, or one with the same canonical words.
+                          Pass False to force a fresh quiz.
+        priority (int): llm_scheduler priority; prefetching passes PRIORITY_BACKGROUND.
+
+    Returns:
+        dict: A dictionary containing the quiz question, options, and correct answer,
+              or an error dictionary.
+        Example structure:
+        {
+            "question": "What is the capital of France?",
+            "options": ["Berlin", "Madrid", "Paris", "Rome"],
+            "answer": "Paris"
+        }
+    """
+    if use_cache:
+        cached = response_cache.get(topic_or_answer, QUIZ_MODEL, QUIZ_TEMPERATURE, namespace="quiz")
+        if cached is not None:
+            return dict(cached)
+
+    if not is_configured():
+        return dict(MISSING_KEY_ERROR)
 
-    except requests.exceptions.RequestException as e:
+    if not use_cache:
+        return _fetch_quiz(topic_or_answer, use_cache, priority)  # A fresh quiz of its own
+    # Concurrent requests for the same quiz share one upstream call; each caller gets its own copy
+    return dict(llm_flights.do(("quiz", normalize_prompt(topic_or_answer)), _fetch_quiz, topic_or_answer, use_cache,
+                               priority))
+
+def _fetch_quiz(topic_or_answer: str, use_cache: bool, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """Requests a quiz completion and returns the parsed quiz or an error dictionary."""
+    try:
+        # Pooled keep-alive client with timeouts and retries on 429/5xx
+        response_data = get_llm_client().chat_completion(
+            _build_payload(topic_or_answer), OPENAI_API_KEY_QUIZ, OPENAI_QUIZ_ENDPOINT, priority)
+        return _parse_quiz(topic_or_answer, use_cache, response_data)
+
+    except Overloaded:
+        raise  # Rate-limit budget exhausted; the route answers 503
+    except LLMError as e:
         return {"error": f"Error communicating with OpenAI API for quiz: {e}"}
     except json.JSONDecodeError as e:
-        return {"error": f"Could not decode JSON quiz response: {e}. Raw content: {raw_content}"}
+        return {"error": f"Could not decode JSON quiz response: {e}."}
     except Exception as e:
         return {"error": f"An unexpected error occurred during quiz generation: {e}"}
 
+def _build_batch_payload(topic_or_answer: str, count: int) -> dict:
+    """Builds the chat completions request body for several quiz questions in one call."""
+    prompt_template = f"""
+    Generate {count} different multiple-choice questions (MCQs) based on the following text/topic.
+    Respond ONLY with a JSON object of the form {{"questions": [...]}} where each question has:
+    1. A 'question' field (string).
+    2. An 'options' field (an array of 4 strings).
+    3. An 'answer' field (string) which is one of the options.
+    Ensure every answer is one of its provided options and no question is repeated.
+
+    Text/Topic for Quiz:
+    "{topic_or_answer}"
+    """
+
+    return {
+        "model": QUIZ_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a quiz master. Generate quizzes in strict JSON format."},
+            {"role": "user", "content": prompt_template}
+        ],
+        "temperature": QUIZ_TEMPERATURE,
+        "max_tokens": 200 * count, # Same per-question budget as generate_quiz()
+        "response_format": {"type": "json_object"}
+    }
+
+def generate_quiz_batch(topic_or_answer: str, count: int = 5, priority: int = PRIORITY_INTERACTIVE) -> dict:
+    """
+    Generates several validated multiple-choice questions with as few API calls as possible.
+
+    All questions are requested in a single completion. Invalid or missing questions are
+    topped up with single-question calls fanned out over a bounded thread pool.
+
+    Args:
+        topic_or_answer (str): The text or topic from which to generate the quiz.
+        count (int): Number of questions wanted (1 to MAX_BATCH_SIZE).
+        priority (int): llm_scheduler priority; pre-generation passes PRIORITY_BACKGROUND.
+
+    Returns:
+        dict: {"questions": [quiz, ...]} with up to `count` quizzes, or an error dictionary
+              if none could be generated.
+    """
+    count = max(1, min(count, MAX_BATCH_SIZE))
+    if not is_configured():
+        return dict(MISSING_KEY_ERROR)
+
+    questions, seen, last_error = [], set(), None
+
+    def add(quiz):
+        if is_valid_quiz(quiz) and quiz["question"] not in seen and len(questions) < count:
+            seen.add(quiz["question"])
+            questions.append(quiz)
+
+    try:
+        response_data = get_llm_client().chat_completion(
+            _build_batch_payload(topic_or_answer, count), OPENAI_API_KEY_QUIZ, OPENAI_QUIZ_ENDPOINT, priority)
+        raw_content = response_data['choices'][0]['message']['content']
+        for quiz in json.loads(raw_content).get("questions", []):
+            add(quiz)
+    except LLMError as e:
+        last_error = f"Error communicating with OpenAI API for quiz: {e}"
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError) as e:
+        last_error = f"Could not decode JSON quiz batch response: {e}"
+
+    missing = count - len(questions)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=min(missing, QUIZ_FANOUT_WORKERS)) as pool:
+            # Called directly rather than through generate_quiz(): these must not coalesce into one quiz
+            for quiz in pool.map(lambda _: _fetch_quiz(topic_or_answer, False, priority), range(missing)):
+                if "error" in quiz:
+                    last_error = quiz["error"]
+                add(quiz)
+
+    if not questions:
+        return {"error": last_error or "No valid quiz questions were generated."}
+    return {"questions": questions}
+
 if __name__ == '__main__':
     # Example usage:
     # To test this module, replace "YOUR_OPENAI_API_KEY_HERE" with your actual key
@@ -0,0 +1,218 @@
+# quiz_pool.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from utils import quiz_generator
+from utils.llm_scheduler import PRIORITY_BACKGROUND
+from utils.metrics import registry, stats_collector
+from utils.response_cache import normalize_prompt
+
+try:
+    import fcntl  # Lets one worker at a time run the refill pass
+except ImportError:
+    fcntl = None  # Windows: every process refills on its own schedule
+
+logger = logging.getLogger(__name__)
+
+# Pre-generation settings, overridable from the environment
+QUIZ_POOL_TOPICS = [t.strip() for t in os.environ.get("QUIZ_POOL_TOPICS", "").split(",") if t.strip()]
+QUIZ_POOL_TARGET = int(os.environ.get("QUIZ_POOL_TARGET", 10))          # Quizzes kept in stock per topic
+QUIZ_POOL_TOP_TOPICS = int(os.environ.get("QUIZ_POOL_TOP_TOPICS", 20))  # How many popular topics are warmed
+QUIZ_POOL_INTERVAL = float(os.environ.get("QUIZ_POOL_INTERVAL", 30))    # Seconds between refill passes
+QUIZ_POOL_MAX_TRACKED = 10000                                           # Bound on the popularity table
+# Stock and popularity shared by the worker processes
+QUIZ_POOL_DB = os.environ.get("QUIZ_POOL_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           '..', 'data', 'quiz_pool.db'))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS quiz_pool_topics (
+        key TEXT PRIMARY KEY,
+        topic TEXT NOT NULL,
+        requests INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_quiz_pool_topics_requests ON quiz_pool_topics (requests);
+    CREATE TABLE IF NOT EXISTS quiz_pool_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL,
+        quiz TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_quiz_pool_stock_key ON quiz_pool_stock (key, id);
+"""
+
+class QuizPool:
+    """
+    Stock of pre-generated quizzes for popular topics.
+
+    /generate_quiz records every topic it is asked for and takes a ready quiz from stock
+    when one exists. A background thread periodically refills the most requested topics
+    (plus any configured seed topics) with generate_quiz_batch() at background priority, so
+    popular requests are answered in milliseconds without an upstream call.
+
+    Stock and popularity live in SQLite so every worker serves from, and counts towards, the
+    same pool. Each worker buffers its request counts and adds them to the table at the start
+    of every refill pass; only one worker at a time runs the pass (under an fcntl lock next to
+    the database), so the stock is topped up once, not once per worker.
+    """
+
+    def __init__(self, target: int = QUIZ_POOL_TARGET, top_topics: int = QUIZ_POOL_TOP_TOPICS,
+                 interval: float = QUIZ_POOL_INTERVAL, seed_topics: list = None, db_path: str = QUIZ_POOL_DB):
+        self.target = target
+        self.top_topics = top_topics
+        self.interval = interval
+        self.db_path = db_path
+        self._topics = {}           # normalized topic -> original text, for requests not yet flushed
+        self._popularity = Counter()  # Requests counted since the last flush
+        self._local = threading.local()  # One connection per thread, reopened after a fork
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"hits": 0, "misses": 0, "generated": 0}
+        for topic in seed_topics if seed_topics is not None else QUIZ_POOL_TOPICS:
+            self.record_request(topic)
+
+    def record_request(self, topic: str):
+        """Counts a request for a topic towards its popularity (flushed at the next refill pass)."""
+        key = normalize_prompt(topic)
+        if not key:
+            return
+        with self._lock:
+            if key in self._popularity or len(self._popularity) < QUIZ_POOL_MAX_TRACKED:
+                self._popularity[key] += 1
+                self._topics.setdefault(key, topic)
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _flush_requests(self):
+        """Adds the buffered request counts to the shared popularity table."""
+        with self._lock:
+            counts, topics = self._popularity, self._topics
+            self._popularity, self._topics = Counter(), {}
+        if not counts:
+            return
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("INSERT INTO quiz_pool_topics (key, topic, requests) VALUES (?, ?, ?) "
+                           "ON CONFLICT (key) DO UPDATE SET requests = requests + excluded.requests",
+                           ((key, topics[key], count) for key, count in counts.items()))
+            tracked = db.execute("SELECT COUNT(*) FROM quiz_pool_topics").fetchone()[0]
+            if tracked > QUIZ_POOL_MAX_TRACKED:
+                # Keep the table bounded by dropping the least requested half of the topics without stock
+                db.execute("DELETE FROM quiz_pool_topics WHERE key IN (SELECT key FROM quiz_pool_topics "
+                           "WHERE key NOT IN (SELECT key FROM quiz_pool_stock) ORDER BY requests LIMIT ?)",
+                           (tracked - QUIZ_POOL_MAX_TRACKED // 2,))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def take(self, topic: str):
+        """
+        Returns a pre-generated quiz for the topic, or None if none is in stock.
+
+        Args:
+            topic (str): The topic or answer text sent to /generate_quiz.
+
+        Returns:
+            dict or None: A quiz with question, options and answer.
+        """
+        key = normalize_prompt(topic)
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute("SELECT id, quiz FROM quiz_pool_stock WHERE key = ? ORDER BY id LIMIT ?",
+                              (key, self.target // 2 + 1)).fetchall()
+            if rows:
+                db.execute("DELETE FROM quiz_pool_stock WHERE id = ?", (rows[0][0],))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.stats["hits" if rows else "misses"] += 1
+        if not rows:
+            return None
+        if len(rows) - 1 < self.target // 2:
+            self._wake.set()  # Running low; refill early
+        return json.loads(rows[0][1])
+
+    def refill(self):
+        """Tops up stock for the most popular topics (one batch call per topic), unless another worker is at it."""
+        self._flush_requests()
+        self._db()  # Creates the data directory on first use
+        lock = open(self.db_path + ".refill.lock", 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # Another worker is refilling the same stock
+            self._refill_locked()
+        finally:
+            lock.close()  # Also releases the flock
+
+    def _refill_locked(self):
+        wanted = self._db().execute(
+            "SELECT t.key, t.topic, ? - (SELECT COUNT(*) FROM quiz_pool_stock s WHERE s.key = t.key) AS missing "
+            "FROM quiz_pool_topics t ORDER BY t.requests DESC LIMIT ?", (self.target, self.top_topics)).fetchall()
+        for key, topic, missing in wanted:
+            if missing <= 0:
+                continue
+            if self._stop.is_set():
+                return
+            # Background priority: yields rate-limit budget to interactive requests
+            result = quiz_generator.generate_quiz_batch(topic, missing, PRIORITY_BACKGROUND)
+            questions = result.get("questions", [])
+            self._db().executemany("INSERT INTO quiz_pool_stock (key, quiz) VALUES (?, ?)",
+                                   ((key, json.dumps(quiz)) for quiz in questions))
+            with self._lock:
+                self.stats["generated"] += len(questions)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except Exception as e:
+                logger.warning("Quiz pre-generation failed: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        """Starts the background refill thread once per process (no-op without an API key)."""
+        with self._lock:
+            if self._thread is not None or not quiz_generator.is_configured():
+                return
+            self._thread = threading.Thread(target=self._run, name="quiz-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background refill thread."""
+        self._stop.set()
+        self._wake.set()
+
+    def get_stats(self) -> dict:
+        """Returns this worker's hit/miss/generated counters and the shared number of quizzes in stock."""
+        stocked, topics = self._db().execute("SELECT COUNT(*), COUNT(DISTINCT key) FROM quiz_pool_stock").fetchone()
+        with self._lock:
+            return dict(self.stats, stocked=stocked, topics=topics)
+
+# Shared by the /generate_quiz route, and through QUIZ_POOL_DB with the other workers
+quiz_pool = QuizPool()
+registry.register_collector("quiz_pool_events_total", "counter", "Quiz pool hits, misses and generated quizzes.",
+                            stats_collector(quiz_pool.get_stats, ("hits", "misses", "generated")))
+registry.register_collector("quiz_pool_stocked", "gauge", "Pre-generated quizzes in stock.",
+                            stats_collector(quiz_pool.get_stats, ("stocked", "topics")))
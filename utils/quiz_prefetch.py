@@ -0,0 +1,201 @@
+# quiz_prefetch.py
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import registry, stats_collector
+
+logger = logging.getLogger(__name__)
+
+# Prefetch settings, overridable from the environment
+QUIZ_PREFETCH_WORKERS = int(os.environ.get("QUIZ_PREFETCH_WORKERS", 4))
+QUIZ_TICKET_TTL = float(os.environ.get("QUIZ_TICKET_TTL", 300))       # Seconds a ticket stays redeemable
+QUIZ_TICKET_WAIT = float(os.environ.get("QUIZ_TICKET_WAIT", 30))      # Max seconds a redeem waits for the quiz
+QUIZ_MAX_TICKETS = int(os.environ.get("QUIZ_MAX_TICKETS", 1000))
+QUIZ_TICKET_POLL = float(os.environ.get("QUIZ_TICKET_POLL", 0.05))    # Seconds between checks for another worker's quiz
+# Tickets and finished quizzes shared by the worker processes. Empty keeps tickets in the process that issued them.
+QUIZ_TICKET_DB = os.environ.get("QUIZ_TICKET_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               '..', 'data', 'quiz_tickets.db'))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS quiz_tickets (
+        ticket TEXT PRIMARY KEY,
+        expires REAL NOT NULL,
+        claimed INTEGER NOT NULL DEFAULT 0,
+        result TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_quiz_tickets_expires ON quiz_tickets (expires);
+"""
+
+class QuizTickets:
+    """
+    Background quiz generation started as soon as an answer is ready.
+
+    /ask_ai submits the answer text and hands the client a ticket id; /generate_quiz
+    claims the ticket and gets the (usually already finished) quiz instead of starting a
+    second serialized round trip. Tickets that are never redeemed expire after ttl seconds,
+    and their work is cancelled if it has not started yet.
+
+    The quiz is generated by the worker that issued the ticket, but the follow-up request may
+    reach any worker. With a db_path every ticket is also a row in a SQLite table that the
+    issuing worker fills with the finished quiz (or an error), so another worker can claim the
+    ticket and wait for the row. Each row is claimed once, by whichever worker gets there first.
+    """
+
+    def __init__(self, max_workers: int = QUIZ_PREFETCH_WORKERS, ttl: float = QUIZ_TICKET_TTL,
+                 max_tickets: int = QUIZ_MAX_TICKETS, db_path: str = QUIZ_TICKET_DB,
+                 wait: float = QUIZ_TICKET_WAIT):
+        self.ttl = ttl
+        self.max_tickets = max_tickets
+        self.db_path = db_path or None
+        self.wait = wait
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz-prefetch")
+        self._waiters = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quiz-ticket-wait")
+        self._tickets = OrderedDict()  # ticket id -> (future, expires_at), oldest first
+        self._lock = threading.Lock()
+        self._local = threading.local()  # One connection per thread, reopened after a fork
+        self.stats = {"submitted": 0, "redeemed": 0, "expired": 0, "cancelled": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Tickets only matter for a few minutes
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _publish(self, ticket: str, future):
+        """Stores a finished prefetch in the ticket's row for whichever worker claims it."""
+        if future.cancelled():
+            result = {"error": "Quiz prefetch was cancelled."}
+        elif future.exception() is not None:
+            result = {"error": f"Quiz prefetch failed: {future.exception()}"}
+        else:
+            result = future.result()
+        try:
+            self._db().execute("UPDATE quiz_tickets SET result = ? WHERE ticket = ?", (json.dumps(result), ticket))
+        except sqlite3.Error as e:
+            logger.warning("Could not store prefetched quiz %s: %s", ticket, e)
+
+    def _await_shared(self, ticket: str) -> dict:
+        """Waits for another worker to store the quiz of a ticket claimed here, then deletes the row."""
+        deadline = time.monotonic() + self.wait
+        while True:
+            row = self._db().execute("SELECT result FROM quiz_tickets WHERE ticket = ?", (ticket,)).fetchone()
+            if row is None:
+                return {"error": "Quiz ticket expired."}
+            if row[0] is not None:
+                self._db().execute("DELETE FROM quiz_tickets WHERE ticket = ?", (ticket,))
+                return json.loads(row[0])
+            if time.monotonic() >= deadline:
+                return {"error": "Prefetched quiz is not ready."}
+            time.sleep(QUIZ_TICKET_POLL)
+
+    def _expire_locked(self, now: float):
+        # Every ticket has the same TTL, so insertion order is expiry order
+        while self._tickets:
+            ticket, (future, expires_at) = next(iter(self._tickets.items()))
+            if expires_at > now and len(self._tickets) <= self.max_tickets:
+                break
+            del self._tickets[ticket]
+            future.cancel()
+            self.stats["expired"] += 1
+
+    def submit(self, fn, *args) -> str:
+        """
+        Starts fn(*args) in the background and returns a ticket id for its result.
+
+        Args:
+            fn: Callable producing a quiz dict, e.g. quiz_generator.generate_quiz.
+            *args: Arguments for fn.
+
+        Returns:
+            str: An opaque ticket id.
+        """
+        ticket = secrets.token_urlsafe(16)
+        if self.db_path is not None:
+            now = time.time()
+            db = self._db()
+            db.execute("DELETE FROM quiz_tickets WHERE expires < ?", (now,))
+            db.execute("INSERT INTO quiz_tickets (ticket, expires) VALUES (?, ?)", (ticket, now + self.ttl))
+        future = self._executor.submit(fn, *args)
+        if self.db_path is not None:
+            future.add_done_callback(lambda done: self._publish(ticket, done))
+        with self._lock:
+            self._tickets[ticket] = (future, time.monotonic() + self.ttl)
+            self.stats["submitted"] += 1
+            self._expire_locked(time.monotonic())
+        return ticket
+
+    def claim(self, ticket: str):
+        """
+        Removes a ticket and returns its future, or None if it is unknown or expired.
+
+        The caller waits on the future (future.result(timeout)). For a ticket issued by another
+        worker the future waits for that worker's quiz, giving up after the wait passed to the
+        constructor.
+        """
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            entry = self._tickets.pop(ticket, None)
+        future = entry[0] if entry is not None else None
+        if self.db_path is not None:
+            db = self._db()
+            if future is not None:
+                # Issued here: drop the row so no other worker can claim it too
+                claimed = db.execute("DELETE FROM quiz_tickets WHERE ticket = ? AND claimed = 0",
+                                     (ticket,)).rowcount
+            else:
+                claimed = db.execute("UPDATE quiz_tickets SET claimed = 1 WHERE ticket = ? AND claimed = 0 "
+                                     "AND expires >= ?", (ticket, time.time())).rowcount
+            if not claimed:
+                if future is not None:
+                    future.cancel()
+                return None
+            if future is None:
+                future = self._waiters.submit(self._await_shared, ticket)
+        if future is None:
+            return None
+        with self._lock:
+            self.stats["redeemed"] += 1
+        return future
+
+    def cancel(self, ticket: str) -> bool:
+        """
+        Drops a ticket the client no longer needs. Returns True if it existed.
+
+        A ticket issued by another worker can no longer be claimed, but that worker still
+        finishes generating its quiz.
+        """
+        with self._lock:
+            entry = self._tickets.pop(ticket, None)
+            if entry is not None:
+                entry[0].cancel()
+        existed = entry is not None
+        if self.db_path is not None:
+            existed |= self._db().execute("DELETE FROM quiz_tickets WHERE ticket = ? AND claimed = 0",
+                                          (ticket,)).rowcount > 0
+        if not existed:
+            return False
+        with self._lock:
+            self.stats["cancelled"] += 1
+        return True
+
+    def get_stats(self) -> dict:
+        """Returns ticket counters and the number of outstanding tickets."""
+        with self._lock:
+            return dict(self.stats, outstanding=len(self._tickets))
+
+# Shared by /ask_ai (submit) and /generate_quiz (claim), and through QUIZ_TICKET_DB with the other workers
+quiz_tickets = QuizTickets()
+registry.register_collector("quiz_tickets_total", "counter", "Prefetched quiz tickets by outcome.",
+                            stats_collector(quiz_tickets.get_stats, ("submitted", "redeemed", "expired", "cancelled")))
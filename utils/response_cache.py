@@ -0,0 +1,196 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils.metrics import registry, stats_collector
+
+# Cache sizing, overridable from the environment
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+# Tier two answers prompts that differ from a cached one only in filler words, punctuation or plurals;
+# set RESPONSE_CACHE_CANONICAL=0 to serve exact (normalized) matches only
+RESPONSE_CACHE_CANONICAL = os.environ.get("RESPONSE_CACHE_CANONICAL", "1") == "1"
+
+# Words that never change what is asked; dropped from the canonical key
+FILLER_WORDS = frozenset({"a", "an", "the", "please", "kindly"})
+
+_WORD = re.compile(r"\w+")
+
+def normalize_prompt(text: str) -> str:
+    """
+    Normalizes a prompt so trivially different phrasings share a cache key.
+
+    Lowercases, collapses whitespace and drops surrounding punctuation, so
+    "What is photosynthesis?" and "what is  photosynthesis" map to the same key.
+    """
+    text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    return text.strip(" ?!.,;:\"'")
+
+def canonical_tokens(text: str) -> tuple:
+    """
+    Reduces normalized text to the words that carry its meaning, in order.
+
+    Filler words and punctuation are dropped and a plural "s" is stripped, so only prompts
+    that ask exactly the same thing compare equal: "mitosis and meiosis" and "meiosis and
+    mitosis" differ, as do prompts that differ in any other word.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        if word in FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tuple(tokens)
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses.
+
+    Tier one is an exact cache keyed on namespace + model + temperature + normalized prompt.
+    Tier two is keyed on the same scope + canonical_tokens(), so a prompt that asks exactly
+    what a cached one asked, in other filler words or with other plurals, is one dict lookup
+    away; prompts that differ in any meaningful word or in word order never share an entry.
+    Both tiers share one LRU order, a TTL and a total size bound in bytes.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: float = RESPONSE_CACHE_TTL,
+                 canonical: bool = RESPONSE_CACHE_CANONICAL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.canonical = canonical
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, canonical_key)
+        self._canonical = {}           # canonical_key -> key of the newest entry asking that
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "canonical_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def _scope(namespace: str, model: str, temperature: float) -> str:
+        return f"{namespace}\0{model}\0{temperature}"
+
+    @staticmethod
+    def _key(scope: str, normalized: str) -> str:
+        return hashlib.sha256(f"{scope}\0{normalized}".encode()).hexdigest()
+
+    def _canonical_key(self, scope: str, normalized: str):
+        if not self.canonical:
+            return None
+        tokens = canonical_tokens(normalized)
+        return (scope, tokens) if tokens else None
+
+    def _remove_locked(self, key: str):
+        _, size, _, canonical_key = self._entries.pop(key)
+        self._bytes -= size
+        if canonical_key is not None and self._canonical.get(canonical_key) == key:
+            del self._canonical[canonical_key]
+
+    def _live_locked(self, key: str, now: float):
+        """Returns the entry for key if present and not expired, dropping it otherwise."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            self._remove_locked(key)
+            self.stats["expirations"] += 1
+            return None
+        return entry
+
+    def get(self, prompt: str, model: str = "", temperature: float = 0.0, namespace: str = "default"):
+        """
+        Looks up a cached response.
+
+        Args:
+            prompt (str): The prompt as sent upstream.
+            model (str): Model name; part of the key.
+            temperature (float): Sampling temperature; part of the key.
+            namespace (str): Separates callers, e.g. "answer" and "quiz".
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        scope = self._scope(namespace, model, temperature)
+        normalized = normalize_prompt(prompt)
+        key = self._key(scope, normalized)
+        canonical_key = self._canonical_key(scope, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live_locked(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry[0]
+            if canonical_key is not None:
+                match = self._canonical.get(canonical_key)
+                if match is not None and self._live_locked(match, now) is not None:
+                    self._entries.move_to_end(match)
+                    self.stats["canonical_hits"] += 1
+                    return self._entries[match][0]
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, prompt: str, value, model: str = "", temperature: float = 0.0, namespace: str = "default"):
+        """
+        Stores a response, evicting least recently used entries to stay under max_bytes.
+
+        Args:
+            prompt (str): The prompt as sent upstream.
+            value: A JSON-serializable response (string or dict).
+            model (str): Model name; part of the key.
+            temperature (float): Sampling temperature; part of the key.
+            namespace (str): Separates callers, e.g. "answer" and "quiz".
+        """
+        scope = self._scope(namespace, model, temperature)
+        normalized = normalize_prompt(prompt)
+        key = self._key(scope, normalized)
+        size = len(json.dumps(value).encode()) + len(normalized.encode()) + 64
+        if size > self.max_bytes:
+            return
+        canonical_key = self._canonical_key(scope, normalized)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl, canonical_key)
+            self._bytes += size
+            if canonical_key is not None:
+                self._canonical[canonical_key] = key
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Drops every entry (statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._canonical.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        """Returns hit/miss counters plus current entry count and size in bytes."""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+# Shared by utils/ai_response.py and utils/quiz_generator.py (separated by namespace)
+response_cache = ResponseCache()
+registry.register_collector("response_cache_events_total", "counter", "Response cache lookups and evictions.",
+                            stats_collector(response_cache.get_stats,
+                                            ("exact_hits", "canonical_hits", "misses", "evictions", "expirations")))
+registry.register_collector("response_cache_size", "gauge", "Response cache entries and bytes.",
+                            stats_collector(response_cache.get_stats, ("entries", "bytes")))
+
+if __name__ == '__main__':
+    # Example usage:
+    cache = ResponseCache()
+    cache.put("Explain the process of photosynthesis in plants.", "Plants convert light into chemical energy.",
+              model="gpt-3.5-turbo")
+    print(cache.get("explain the process of photosynthesis in plants", model="gpt-3.5-turbo"))         # exact hit
+    print(cache.get("Please explain the process of photosynthesis in a plant", model="gpt-3.5-turbo"))  # canonical hit
+    print(cache.get("Explain the process of respiration in plants", model="gpt-3.5-turbo"))            # other question
+    print(cache.get("Explain the process of photosynthesis in plants.", model="gpt-4"))                # other model
+    print(cache.get_stats())
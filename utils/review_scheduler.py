@@ -0,0 +1,238 @@
+# review_scheduler.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from utils import tracker
+from utils.metrics import stage_timer
+from utils.response_cache import normalize_prompt
+
+# SM-2 spaced repetition over quiz questions. Every graded attempt replaces the item's state in a
+# SQLite table shared by all workers; due items are read through its (user_id, due) index.
+REVIEW_DIR = os.path.join(tracker.DATA_DIR, "reviews")
+REVIEW_DB = os.environ.get("REVIEW_DB", os.path.join(REVIEW_DIR, "reviews.db"))
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+CORRECT_QUALITY = 4     # SM-2 grade (0-5) given to a correct answer
+INCORRECT_QUALITY = 1   # SM-2 grade given to a wrong answer
+LAPSE_DELAY = float(os.environ.get("REVIEW_LAPSE_DELAY", 600))  # Seconds before a missed item is due again
+DAY_SECONDS = 86400
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS review_items (
+        user_id TEXT NOT NULL,
+        item TEXT NOT NULL,
+        due REAL NOT NULL,
+        state TEXT NOT NULL,
+        PRIMARY KEY (user_id, item)
+    );
+    CREATE INDEX IF NOT EXISTS idx_review_items_user_due ON review_items (user_id, due);
+    CREATE TABLE IF NOT EXISTS review_meta (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    );
+"""
+
+_UPDATE_TIMER = stage_timer("review_update")
+_DUE_TIMER = stage_timer("review_due")
+
+def item_key(quiz_attempt: dict) -> str:
+    """Identifies a review item by its normalized quiz question."""
+    return normalize_prompt(quiz_attempt.get("quiz_question") or "")
+
+def _parse_time(timestamp: str) -> float:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+def sm2(state: dict, quality: int, now: float) -> dict:
+    """
+    Applies one SM-2 review to an item state and returns the new state.
+
+    Args:
+        state (dict): Previous state (repetitions, interval_days, ease, lapses) or {} for a new item.
+        quality (int): Grade 0-5; below 3 counts as a lapse and restarts the item.
+        now (float): Review time as a UNIX timestamp.
+
+    Returns:
+        dict: New state including "due" (UNIX timestamp of the next review).
+    """
+    repetitions = state.get("repetitions", 0)
+    interval = state.get("interval_days", 0)
+    ease = state.get("ease", INITIAL_EASE)
+    lapses = state.get("lapses", 0)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        repetitions, interval, lapses = 0, 0, lapses + 1
+        due = now + LAPSE_DELAY
+    else:
+        repetitions += 1
+        interval = 1 if repetitions == 1 else 6 if repetitions == 2 else round(interval * ease)
+        due = now + interval * DAY_SECONDS
+    return {"repetitions": repetitions, "interval_days": interval, "ease": round(ease, 4),
+            "lapses": lapses, "due": due, "last_review": now}
+
+def _build_record(previous: dict, user_id: str, question: str, quiz_attempt: dict, timestamp: str):
+    quality = CORRECT_QUALITY if quiz_attempt.get("is_correct") else INCORRECT_QUALITY
+    record = sm2(previous, quality, _parse_time(timestamp))
+    record.update({
+        "user_id": user_id,
+        "item": item_key(quiz_attempt),
+        "quiz_question": quiz_attempt.get("quiz_question"),
+        "options": quiz_attempt.get("options") or previous.get("options") or [],
+        "correct_answer": quiz_attempt.get("correct_answer"),
+        "question": question or previous.get("question"),
+    })
+    return record
+
+class ReviewScheduler:
+    """
+    Keeps, per user, every quiz question's SM-2 state in a SQLite table shared by all workers.
+
+    Recording an attempt reads and replaces one row per item; due_reviews() is a range scan
+    of the (user_id, due) index that stops after limit rows. Nothing is held in memory, so
+    every worker sees every other worker's updates without replaying anything.
+    """
+
+    def __init__(self, db_path: str = REVIEW_DB):
+        self.db_path = db_path
+        self._local = threading.local()  # One connection per thread, reopened after a fork
+        self._bootstrapped = False
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _write_records(db: sqlite3.Connection, sessions) -> int:
+        """Applies graded attempts in order inside the caller's transaction."""
+        batch = {}  # Later attempts in the same batch build on earlier ones
+        for entry in sessions:
+            user_id, quiz_attempt = entry.get("user_id"), entry.get("quiz_attempt") or {}
+            key = item_key(quiz_attempt)
+            if not user_id or not key or "is_correct" not in quiz_attempt:
+                continue
+            previous = batch.get((user_id, key))
+            if previous is None:
+                row = db.execute("SELECT state FROM review_items WHERE user_id = ? AND item = ?",
+                                 (user_id, key)).fetchone()
+                previous = json.loads(row[0]) if row else {}
+            batch[user_id, key] = _build_record(previous, user_id, entry.get("question"), quiz_attempt,
+                                                entry.get("timestamp"))
+        db.executemany("INSERT OR REPLACE INTO review_items (user_id, item, due, state) VALUES (?, ?, ?, ?)",
+                       [(user_id, key, record["due"], json.dumps(record, ensure_ascii=False))
+                        for (user_id, key), record in batch.items()])
+        return len(batch)
+
+    def record_attempts(self, sessions) -> int:
+        """
+        Updates the schedule from logged sessions that carry a graded quiz attempt.
+
+        Args:
+            sessions: Iterable of session entries (see session_store.build_session_entry).
+
+        Returns:
+            int: Number of review items updated.
+        """
+        with _UPDATE_TIMER.time():
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")  # Serializes read-modify-write of an item across workers
+            try:
+                updated = self._write_records(db, sessions)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return updated
+
+    def bootstrap(self, sessions_fn):
+        """
+        Seeds the table from existing history the first time the scheduler is used.
+
+        The replay and the marker recording it are committed together, so an interrupted
+        bootstrap is simply redone, and only one worker performs it.
+
+        Args:
+            sessions_fn: Callable returning the logged sessions with quiz attempts, oldest first.
+        """
+        if self._bootstrapped:
+            return
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("SELECT 1 FROM review_meta WHERE name = 'bootstrapped'").fetchone() is None:
+                self._write_records(db, sessions_fn())
+                db.execute("INSERT INTO review_meta (name, value) VALUES ('bootstrapped', ?)",
+                           (datetime.now().isoformat(),))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._bootstrapped = True
+
+    def due_reviews(self, user_id: str, limit: int = 10, now: float = None) -> list:
+        """
+        Returns up to limit items whose next review is due, most overdue first.
+
+        Reads at most limit rows of the (user_id, due) index, whatever the user's item count.
+
+        Args:
+            user_id (str): Firebase uid of the user.
+            limit (int): Maximum number of items.
+            now (float, optional): UNIX timestamp to compare due times against.
+
+        Returns:
+            list: Item states with "due" as an ISO timestamp.
+        """
+        now = time.time() if now is None else now
+        with _DUE_TIMER.time():
+            rows = self._db().execute(
+                "SELECT state FROM review_items WHERE user_id = ? AND due <= ? ORDER BY due, item LIMIT ?",
+                (user_id, now, limit)).fetchall()
+        items = [json.loads(row[0]) for row in rows]
+        return [dict(item, due=datetime.fromtimestamp(item["due"]).isoformat(),
+                     last_review=datetime.fromtimestamp(item["last_review"]).isoformat())
+                for item in items]
+
+    def clear(self):
+        """Removes every review item; the next bootstrap() replays history again."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM review_items")
+            db.execute("DELETE FROM review_meta")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._bootstrapped = False
+
+# Shared by /log_quiz_attempt (updates) and /due_reviews (reads), and through REVIEW_DB with the other workers
+review_scheduler = ReviewScheduler()
+
+if __name__ == '__main__':
+    # Example usage (run from the repository root: python -m utils.review_scheduler)
+    scheduler = ReviewScheduler(os.path.join(REVIEW_DIR, "demo-reviews.db"))
+    scheduler.clear()
+    start = datetime(2025, 1, 1, 9, 0)
+    scheduler.record_attempts([
+        {"user_id": "demo", "question": "Photosynthesis", "timestamp": start.isoformat(),
+         "quiz_attempt": {"quiz_question": "What do plants release?", "correct_answer": "Oxygen", "is_correct": True}},
+        {"user_id": "demo", "question": "WW1", "timestamp": start.isoformat(),
+         "quiz_attempt": {"quiz_question": "When did WW1 start?", "correct_answer": "1914", "is_correct": False}},
+    ])
+    for days in (0, 1, 2):
+        now = start.timestamp() + days * DAY_SECONDS + 3600
+        print(f"Due after {days} day(s): {[item['quiz_question'] for item in scheduler.due_reviews('demo', now=now)]}")
+    scheduler.clear()
@@ -0,0 +1,199 @@
+# search_index.py
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from utils import tracker
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over session questions and answers, ranked with BM25 by SQLite FTS5.
+# The SQLite session store keeps its index inside sessions.db; the file backend uses a
+# SegmentSearchIndex stored next to the segment log.
+SEARCH_DB_PATH = os.environ.get("SEARCH_DB_PATH")  # Default: <LOG_DIR>/search.db
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_TERMS = 16
+# Only the newest matches (of the user, when searching one user's history) are ranked, which bounds
+# the cost of very common words. Older matches are not returned at all; 0 ranks every match.
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 5000))
+FTS_TOKENIZER = "porter unicode61 remove_diacritics 2"
+FTS_PREFIX = "2 3"                # Prefix indexes for the word being typed
+FTS_RANK = "bm25(2.0, 1.0, 0.0)"  # Question matches weigh double; user_id is stored, not indexed
+
+_TERM = re.compile(r"\w+")
+
+# Rowids and ranks of one result page: the newest SEARCH_MAX_CANDIDATES matches are ranked and the
+# page is cut before any row text is read. {join} and {user_filter} restrict the candidates to one
+# user, so that user's older matches are not crowded out by other users' newer ones.
+# Parameters: match, [user_id,] candidates, limit, offset.
+RANKED_PAGE_SQL = (
+    "SELECT rowid, rank FROM ("
+    "SELECT sessions_fts.rowid AS rowid, sessions_fts.rank AS rank FROM sessions_fts{join} "
+    "WHERE sessions_fts MATCH ?{user_filter} ORDER BY sessions_fts.rowid DESC LIMIT ?"
+    ") ORDER BY rank LIMIT ? OFFSET ?"
+)
+
+def _fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(text)")
+        return True
+    except sqlite3.OperationalError:
+        logger.warning("This SQLite build has no FTS5; history search falls back to a full scan.")
+        return False
+
+FTS5_AVAILABLE = _fts5_available()
+
+def search_terms(query: str) -> list:
+    """Splits a search query into lowercase word terms (at most SEARCH_MAX_TERMS)."""
+    return _TERM.findall((query or "").lower())[:SEARCH_MAX_TERMS]
+
+def build_match_query(query: str):
+    """
+    Turns free text into an FTS5 MATCH expression, or None if it has no words.
+
+    Every word must appear in the question or the answer; the last word also matches as a
+    prefix unless the query ends with a space. Words are quoted, so operators and
+    punctuation typed by the user are never interpreted as FTS5 syntax. Results are
+    restricted to a user by comparing user_id exactly in SQL, not through the index.
+
+    Args:
+        query (str): Text typed by the user.
+
+    Returns:
+        str: The MATCH expression, or None.
+    """
+    terms = [f'"{term}"' for term in search_terms(query)]
+    if not terms:
+        return None
+    if not query[-1].isspace():
+        terms[-1] += "*"
+    return "{question answer} : (" + " ".join(terms) + ")"
+
+class SegmentSearchIndex:
+    """
+    FTS5 index over the file backend's segment log, kept in its own SQLite database.
+
+    The index stores how far into the log it has read (segment number and byte offset).
+    catch_up() indexes only the lines appended since then and saves the new position in the
+    same transaction, so several worker processes can share the index without indexing a
+    line twice. If the log is now shorter than the saved position, it was cleared, and the
+    index is rebuilt from the start. An index built when user_id was still a tokenized column
+    is dropped and rebuilt the same way.
+    """
+
+    _SCHEMA = f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+            question, answer, user_id UNINDEXED, timestamp UNINDEXED, quiz_attempt UNINDEXED,
+            tokenize = '{FTS_TOKENIZER}', prefix = '{FTS_PREFIX}'
+        );
+        CREATE TABLE IF NOT EXISTS log_position (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            segment INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO log_position (id, segment, offset) VALUES (0, 0, 0);
+        INSERT INTO sessions_fts (sessions_fts, rank) VALUES ('rank', '{FTS_RANK}');
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or SEARCH_DB_PATH or os.path.join(tracker.LOG_DIR, "search.db")
+        self._local = threading.local()  # One connection per thread (and per process after a fork)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'sessions_fts'").fetchone()
+            if existing is not None and "user_id UNINDEXED" not in existing[0]:
+                conn.execute("DROP TABLE sessions_fts")
+                conn.execute("DROP TABLE log_position")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.executescript(self._SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _position(conn: sqlite3.Connection) -> tuple:
+        return tuple(conn.execute("SELECT segment, offset FROM log_position WHERE id = 0").fetchone())
+
+    def catch_up(self) -> int:
+        """
+        Indexes sessions appended to the log since the last call (by any process).
+
+        Returns:
+            int: Number of sessions indexed.
+        """
+        conn = self._connection()
+        end = tracker.log_end()
+        if self._position(conn) == end:
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            position = self._position(conn)
+            if position > end:
+                conn.execute("DELETE FROM sessions_fts")
+                position = None
+            sessions, position = tracker.read_appended(position)
+            conn.executemany(
+                "INSERT INTO sessions_fts (question, answer, user_id, timestamp, quiz_attempt) VALUES (?, ?, ?, ?, ?)",
+                [(entry.get("question"), entry.get("answer"), entry.get("user_id"), entry.get("timestamp"),
+                  json.dumps(entry.get("quiz_attempt") or {}, ensure_ascii=False)) for entry in sessions]
+            )
+            conn.execute("UPDATE log_position SET segment = ?, offset = ? WHERE id = 0", position)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(sessions)
+
+    def search(self, match: str, limit: int, offset: int, user_id: str = None) -> list:
+        """
+        Returns one page of sessions matching an FTS5 expression, best match first.
+
+        Ranking covers the newest SEARCH_MAX_CANDIDATES matches.
+
+        Args:
+            match (str): Expression from build_match_query().
+            limit (int): Page size.
+            offset (int): Number of better matches to skip.
+            user_id (str, optional): Only this user's sessions (compared exactly).
+
+        Returns:
+            list: Session entries, each with its BM25 "score" (higher is better).
+        """
+        self.catch_up()
+        page_sql = RANKED_PAGE_SQL.format(join="", user_filter=" AND user_id = ?" if user_id else "")
+        user_params = (user_id,) if user_id else ()
+        rows = self._connection().execute(
+            f"SELECT timestamp, question, answer, quiz_attempt, user_id, page.rank FROM ({page_sql}) AS page "
+            "JOIN sessions_fts ON sessions_fts.rowid = page.rowid ORDER BY page.rank",
+            (match, *user_params, SEARCH_MAX_CANDIDATES or -1, limit, offset)
+        ).fetchall()
+        return [{"timestamp": timestamp, "question": question, "answer": answer,
+                 "quiz_attempt": json.loads(quiz_attempt), "user_id": user_id, "score": round(-rank, 4)}
+                for timestamp, question, answer, quiz_attempt, user_id, rank in rows]
+
+    def clear(self):
+        """Empties the index; the next catch_up() starts from the current end of the log."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM sessions_fts")
+            conn.execute("UPDATE log_position SET segment = ?, offset = ? WHERE id = 0", tracker.log_end())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
@@ -0,0 +1,657 @@
+# session_store.py
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from utils import history_archive, tracker
+from utils.metrics import stage_timer
+from utils.progress import apply_session, empty_progress, topic_of
+from utils.search_index import (FTS_PREFIX, FTS_RANK, FTS_TOKENIZER, FTS5_AVAILABLE, RANKED_PAGE_SQL,
+                                SEARCH_MAX_CANDIDATES, SEARCH_MAX_PAGE_SIZE, SEARCH_PAGE_SIZE, SegmentSearchIndex,
+                                build_match_query, search_terms)
+from utils.write_behind import WRITE_BEHIND, WriteBehindQueue
+
+# Which backend get_session_store() builds: "sqlite" (default) or "file" (utils/tracker.py segment log)
+SESSION_STORE_BACKEND = os.environ.get("SESSION_STORE_BACKEND", "sqlite")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", os.path.join(tracker.DATA_DIR, "sessions.db"))
+SESSION_DB_POOL_SIZE = int(os.environ.get("SESSION_DB_POOL_SIZE", 4))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 500
+# Page cursors are "<timestamp>~<position>". The position breaks ties between sessions logged with
+# the same timestamp: the row id in SQLite, (segment number, index in segment) in the segment log.
+CURSOR_SEPARATOR = "~"
+
+_APPEND_TIMER = stage_timer("store_append")
+_QUERY_TIMER = stage_timer("store_query")
+_SEARCH_TIMER = stage_timer("store_search")
+_ANALYTICS_TIMER = stage_timer("store_analytics")
+
+def build_session_entry(question: str, answer: str, quiz_attempt: dict = None, user_id: str = None) -> dict:
+    """
+    Builds a session entry in the shape shared by every backend.
+
+    Args:
+        question (str): The user's question.
+        answer (str): The AI's answer.
+        quiz_attempt (dict, optional): Details of the quiz attempt, if any.
+        user_id (str, optional): Firebase uid of the user, if known.
+
+    Returns:
+        dict: The session entry.
+    """
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "question": question,
+        "answer": answer,
+        "quiz_attempt": quiz_attempt if quiz_attempt else {},
+        "user_id": user_id
+    }
+
+def encode_cursor(timestamp: str, position: tuple) -> str:
+    """Builds the page cursor of the session at (timestamp, position)."""
+    return f"{timestamp}{CURSOR_SEPARATOR}{'.'.join(str(part) for part in position)}"
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Splits a page cursor into (timestamp, position).
+
+    A bare timestamp is accepted too; its position is None, so it is compared on the timestamp alone.
+
+    Raises:
+        ValueError: If the position is not made of integers.
+    """
+    timestamp, separator, position = cursor.partition(CURSOR_SEPARATOR)
+    if not separator:
+        return cursor, None
+    try:
+        return timestamp, tuple(int(part) for part in position.split("."))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+def _past_cursor(timestamp: str, position: tuple, cursor: tuple, newer: bool) -> bool:
+    """Tells whether a session comes strictly after (newer=True) or before a decoded cursor."""
+    if cursor[1] is None:
+        key, bound = timestamp, cursor[0]
+    else:
+        key, bound = (timestamp, position), cursor
+    return key > bound if newer else key < bound
+
+class SessionStore:
+    """
+    Storage interface used by the Flask routes for Q&A and quiz session history.
+
+    Entries are written through to the backend (get_session_store() puts a bounded
+    write-behind queue in front of it), so memory use does not grow with the number of
+    logged sessions.
+    """
+
+    def log_session(self, question: str, answer: str, quiz_attempt: dict = None, user_id: str = None) -> dict:
+        """Builds, stores and returns a session entry."""
+        entry = build_session_entry(question, answer, quiz_attempt, user_id)
+        with _APPEND_TIMER.time():
+            self.append_sessions([entry])
+        return entry
+
+    def append_sessions(self, entries: list) -> None:
+        """Stores already-built session entries."""
+        raise NotImplementedError
+
+    def get_all_sessions(self) -> list:
+        """Returns every stored session, oldest first."""
+        raise NotImplementedError
+
+    def iter_sessions(self, after: str = None, before: str = None, since: str = None, until: str = None,
+                      has_quiz: bool = None, user_id: str = None, newest_first: bool = False, limit: int = None):
+        """
+        Streams sessions matching the filters without materialising the whole history.
+
+        Args:
+            after (str, optional): Cursor (a next_cursor or a bare timestamp); only sessions after it.
+            before (str, optional): Cursor (a next_cursor or a bare timestamp); only sessions before it.
+            since (str, optional): Only sessions with a timestamp >= since.
+            until (str, optional): Only sessions with a timestamp <= until.
+            has_quiz (bool, optional): Only sessions with (True) or without (False) a quiz attempt.
+            user_id (str, optional): Only sessions of this user.
+            newest_first (bool): Order by timestamp descending instead of ascending.
+            limit (int, optional): Stop after this many sessions.
+
+        Yields:
+            dict: One session per iteration.
+        """
+        return (entry for _, entry in self._iter_positioned(after, before, since, until, has_quiz, user_id,
+                                                            newest_first, limit))
+
+    def _iter_positioned(self, after: str = None, before: str = None, since: str = None, until: str = None,
+                         has_quiz: bool = None, user_id: str = None, newest_first: bool = False,
+                         limit: int = None):
+        # iter_sessions() as (position, entry) pairs, so query_sessions() can build cursors
+        raise NotImplementedError
+
+    def query_sessions(self, limit: int = HISTORY_PAGE_SIZE, **filters) -> dict:
+        """
+        Returns one page of sessions plus the cursor for the next page.
+
+        Args:
+            limit (int): Page size, clamped to HISTORY_MAX_PAGE_SIZE.
+            **filters: Any iter_sessions() filter.
+
+        Returns:
+            dict: {"sessions": [...], "next_cursor": cursor of the last entry or None}.
+                  Pass next_cursor back as `before` (newest first) or `after` (oldest first).
+        """
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        with _QUERY_TIMER.time():
+            rows = list(self._iter_positioned(limit=limit, **filters))
+        next_cursor = encode_cursor(rows[-1][1]["timestamp"], rows[-1][0]) if len(rows) == limit else None
+        return {"sessions": [entry for _, entry in rows], "next_cursor": next_cursor}
+
+    def search_sessions(self, query: str, user_id: str = None, limit: int = SEARCH_PAGE_SIZE, offset: int = 0) -> dict:
+        """
+        Full-text search over questions and answers, best match first.
+
+        Args:
+            query (str): Words to look for; all must match, the last one also as a prefix.
+            user_id (str, optional): Only this user's sessions.
+            limit (int): Page size, clamped to SEARCH_MAX_PAGE_SIZE.
+            offset (int): Number of results to skip (from a previous page's next_offset).
+
+        Returns:
+            dict: {"results": [...], "next_offset": offset of the next page or None}.
+        """
+        limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        if not search_terms(query):
+            return {"results": [], "next_offset": None}
+        with _SEARCH_TIMER.time():
+            results = self._search(query, user_id, limit, offset)
+        next_offset = offset + limit if len(results) == limit else None
+        return {"results": results, "next_offset": next_offset}
+
+    def _search(self, query: str, user_id: str, limit: int, offset: int) -> list:
+        # Without FTS5: newest-first scan for sessions containing every term, unranked
+        terms = search_terms(query)
+
+        def matches(entry):
+            text = f"{entry.get('question') or ''}\n{entry.get('answer') or ''}".lower()
+            return all(term in text for term in terms)
+
+        sessions = filter(matches, self.iter_sessions(user_id=user_id, newest_first=True))
+        return list(itertools.islice(sessions, offset, offset + limit))
+
+    def analytics(self, group_by: str = "day", since: str = None, until: str = None,
+                  user_id: str = None, limit: int = None) -> list:
+        """
+        Question volume and quiz accuracy grouped by day, topic or user.
+
+        Args:
+            group_by (str): "day", "topic" or "user".
+            since (str, optional): First day to include (ISO date or timestamp).
+            until (str, optional): Last day to include (ISO date or timestamp).
+            user_id (str, optional): Only this user's sessions.
+            limit (int, optional): Maximum number of groups.
+
+        Returns:
+            list: One dict per group, see history_archive.analytics().
+        """
+        if group_by not in history_archive.GROUP_BY:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        with _ANALYTICS_TIMER.time():
+            return self._analytics(group_by, since, until, user_id, limit)
+
+    def _analytics(self, group_by: str, since: str, until: str, user_id: str, limit: int) -> list:
+        return history_archive.analytics(self._iter_columns(since, until, user_id), group_by,
+                                         since, until, user_id, limit)
+
+    def _iter_columns(self, since: str, until: str, user_id: str):
+        # Matching sessions are streamed into compact columns; no entry is kept once encoded
+        before = (date.fromisoformat(until[:10]) + timedelta(days=1)).isoformat() if until else None
+        yield history_archive.build_columns(self.iter_sessions(since=since and since[:10], before=before,
+                                                               user_id=user_id))
+
+    def get_progress(self, user_id: str) -> dict:
+        """
+        Returns a user's aggregates, maintained incrementally as sessions are appended.
+
+        Args:
+            user_id (str): Firebase uid of the user.
+
+        Returns:
+            dict: {"totals": {...}, "topics": {topic: {...}}} as built by utils/progress.py.
+        """
+        raise NotImplementedError
+
+    def clear_all_sessions(self) -> None:
+        """Removes every stored session."""
+        raise NotImplementedError
+
+class TrackerSessionStore(SessionStore):
+    """
+    Session store backed by the append-only segment log in utils/tracker.py.
+
+    Queries for one user read only that user's shard; aggregates live in the shard's progress file.
+    Searches go through a SegmentSearchIndex that tails the log, and analytics scan the
+    columnar archives written by tracker.compact_segments() in place.
+    """
+
+    def __init__(self):
+        self._index = SegmentSearchIndex() if FTS5_AVAILABLE else None
+
+    def append_sessions(self, entries: list) -> None:
+        tracker.append_sessions(entries)
+        if self._index is not None:
+            self._index.catch_up()
+
+    def get_all_sessions(self) -> list:
+        return tracker.get_all_sessions()
+
+    def _iter_positioned(self, after: str = None, before: str = None, since: str = None, until: str = None,
+                         has_quiz: bool = None, user_id: str = None, newest_first: bool = False,
+                         limit: int = None):
+        # The segment time index skips whole segments outside the range; entries are filtered here
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        start = max(filter(None, (after and after[0], since)), default=None)
+        end = min(filter(None, (before and before[0], until)), default=None)
+
+        def matches(item):
+            position, entry = item
+            ts = entry.get("timestamp", "")
+            if after and not _past_cursor(ts, position, after, newer=True):
+                return False
+            if before and not _past_cursor(ts, position, before, newer=False):
+                return False
+            if (since and ts < since) or (until and ts > until):
+                return False
+            if has_quiz is not None and bool(entry.get("quiz_attempt")) != has_quiz:
+                return False
+            return user_id is None or entry.get("user_id") == user_id
+
+        if user_id is not None:
+            source = tracker.iter_user_sessions(user_id, reverse=newest_first, with_position=True)
+        else:
+            source = tracker.iter_sessions(start, end, reverse=newest_first, with_position=True)
+        return itertools.islice(filter(matches, source), limit)
+
+    def _search(self, query: str, user_id: str, limit: int, offset: int) -> list:
+        if self._index is None:
+            return super()._search(query, user_id, limit, offset)
+        return self._index.search(build_match_query(query), limit, offset, user_id)
+
+    def _iter_columns(self, since: str, until: str, user_id: str):
+        # Archives are scanned in place; the user filter is applied to the user column
+        end = until[:10] + "T\uffff" if until else None
+        return tracker.iter_columns(since and since[:10], end)
+
+    def get_progress(self, user_id: str) -> dict:
+        return tracker.get_user_progress(user_id)
+
+    def clear_all_sessions(self) -> None:
+        tracker.clear_all_sessions()
+        if self._index is not None:
+            self._index.clear()
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store backed by SQLite in WAL mode.
+
+    WAL lets every gunicorn worker read while another writes, so all workers see the same
+    history. Each worker process keeps its own small pool of connections; the pool is
+    rebuilt after a fork because SQLite connections must not cross process boundaries.
+    Per-user reads go through idx_sessions_user_timestamp, and each user's aggregates are
+    kept in user_progress, updated in the same transaction as the insert. Question and
+    answer text is indexed in sessions_fts, an FTS5 table over the sessions rows that a
+    trigger keeps up to date on every insert.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            user_id TEXT,
+            question TEXT,
+            answer TEXT,
+            quiz_attempt TEXT NOT NULL DEFAULT '{}',
+            has_quiz INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_timestamp ON sessions (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_timestamp ON sessions (user_id, timestamp);
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id TEXT PRIMARY KEY,
+            progress TEXT NOT NULL
+        );
+    """
+
+    _FTS_SCHEMA = (
+        f"CREATE VIRTUAL TABLE sessions_fts USING fts5(question, answer, user_id UNINDEXED, content = 'sessions', "
+        f"content_rowid = 'id', tokenize = '{FTS_TOKENIZER}', prefix = '{FTS_PREFIX}')",
+        "CREATE TRIGGER sessions_fts_insert AFTER INSERT ON sessions BEGIN "
+        "INSERT INTO sessions_fts (rowid, question, answer, user_id) "
+        "VALUES (new.id, new.question, new.answer, new.user_id); END",
+        f"INSERT INTO sessions_fts (sessions_fts, rank) VALUES ('rank', '{FTS_RANK}')",
+        "INSERT INTO sessions_fts (sessions_fts) VALUES ('rebuild')",  # Index rows logged before search existed
+    )
+
+    def __init__(self, db_path: str = SESSION_DB_PATH, pool_size: int = SESSION_DB_POOL_SIZE):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(self._SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Databases created before user_progress existed: aggregate their history once
+                if (conn.execute("SELECT 1 FROM user_progress LIMIT 1").fetchone() is None
+                        and conn.execute("SELECT 1 FROM sessions WHERE user_id IS NOT NULL LIMIT 1").fetchone()):
+                    rows = conn.execute("SELECT * FROM sessions WHERE user_id IS NOT NULL ORDER BY timestamp, id")
+                    self._update_progress(conn, (self._row_to_entry(row) for row in rows))
+                self._fts = FTS5_AVAILABLE
+                existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'sessions_fts'").fetchone()
+                if self._fts and existing is not None and "user_id UNINDEXED" not in existing["sql"]:
+                    # Built when user_id was a tokenized column: rebuilt with it stored but unindexed
+                    conn.execute("DROP TRIGGER IF EXISTS sessions_fts_insert")
+                    conn.execute("DROP TABLE sessions_fts")
+                    existing = None
+                if self._fts and existing is None:
+                    for statement in self._FTS_SCHEMA:
+                        conn.execute(statement)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; safe with WAL
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """Borrows a pooled connection for this worker process."""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = queue.LifoQueue(maxsize=self.pool_size)
+                self._pool_pid = os.getpid()
+            pool = self._pool
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @staticmethod
+    def _row_to_entry(row) -> dict:
+        return {
+            "timestamp": row["timestamp"],
+            "question": row["question"],
+            "answer": row["answer"],
+            "quiz_attempt": json.loads(row["quiz_attempt"]),
+            "user_id": row["user_id"]
+        }
+
+    @staticmethod
+    def _update_progress(conn: sqlite3.Connection, entries) -> None:
+        """Folds entries into their users' user_progress rows. Caller holds a write transaction."""
+        by_user = {}
+        for entry in entries:
+            if entry.get("user_id"):
+                by_user.setdefault(entry["user_id"], []).append(entry)
+        for user_id, user_entries in by_user.items():
+            row = conn.execute("SELECT progress FROM user_progress WHERE user_id = ?", (user_id,)).fetchone()
+            progress = json.loads(row["progress"]) if row else empty_progress()
+            for entry in user_entries:
+                apply_session(progress, entry)
+            conn.execute("INSERT OR REPLACE INTO user_progress (user_id, progress) VALUES (?, ?)",
+                         (user_id, json.dumps(progress)))
+
+    def append_sessions(self, entries: list) -> None:
+        rows = [
+            (
+                entry["timestamp"],
+                entry.get("user_id"),
+                entry.get("question"),
+                entry.get("answer"),
+                json.dumps(entry.get("quiz_attempt") or {}),
+                1 if entry.get("quiz_attempt") else 0
+            )
+            for entry in entries
+        ]
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO sessions (timestamp, user_id, question, answer, quiz_attempt, has_quiz) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._update_progress(conn, entries)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_all_sessions(self) -> list:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT * FROM sessions ORDER BY timestamp, id").fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def _iter_positioned(self, after: str = None, before: str = None, since: str = None, until: str = None,
+                         has_quiz: bool = None, user_id: str = None, newest_first: bool = False,
+                         limit: int = None):
+        # Every filter maps onto idx_sessions_timestamp or idx_sessions_user_timestamp
+        clauses, params = [], []
+        for cursor, op in ((after, ">"), (before, "<")):
+            if cursor is None:
+                continue
+            timestamp, position = decode_cursor(cursor)
+            if position is None:
+                clauses.append(f"timestamp {op} ?")
+                params.append(timestamp)
+            else:
+                # (timestamp, id) compared as a pair; the first term keeps it a range scan on the index
+                clauses.append(f"timestamp {op}= ? AND (timestamp {op} ? OR id {op} ?)")
+                params.extend((timestamp, timestamp, position[0]))
+        for column_op, value in (("timestamp >= ?", since), ("timestamp <= ?", until),
+                                 ("user_id = ?", user_id)):
+            if value is not None:
+                clauses.append(column_op)
+                params.append(value)
+        if has_quiz is not None:
+            clauses.append("has_quiz = ?")
+            params.append(1 if has_quiz else 0)
+        sql = "SELECT * FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC, id DESC" if newest_first else " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(256)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield (row["id"],), self._row_to_entry(row)
+            finally:
+                # Ends the read snapshot even if the consumer stops early
+                cursor.close()
+
+    def _search(self, query: str, user_id: str, limit: int, offset: int) -> list:
+        if not self._fts:
+            return super()._search(query, user_id, limit, offset)
+        if user_id:
+            page_sql = RANKED_PAGE_SQL.format(join=" JOIN sessions ON sessions.id = sessions_fts.rowid",
+                                              user_filter=" AND sessions.user_id = ?")
+        else:
+            page_sql = RANKED_PAGE_SQL.format(join="", user_filter="")
+        user_params = (user_id,) if user_id else ()
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT sessions.*, page.rank FROM ({page_sql}) AS page "
+                "JOIN sessions ON sessions.id = page.rowid ORDER BY page.rank",
+                (build_match_query(query), *user_params, SEARCH_MAX_CANDIDATES or -1, limit, offset)
+            ).fetchall()
+        return [dict(self._row_to_entry(row), score=round(-row["rank"], 4)) for row in rows]
+
+    # Group key of each analytics grouping. Topics are grouped by their raw text here and
+    # normalized in Python, so topic_of() runs once per distinct question, not once per row.
+    _ANALYTICS_KEYS = {
+        "day": "substr(timestamp, 1, 10)",
+        "user": "user_id",
+        "topic": "coalesce(nullif(json_extract(quiz_attempt, '$.topic'), ''), question, '')",
+    }
+
+    def _analytics(self, group_by: str, since: str, until: str, user_id: str, limit: int) -> list:
+        # Counted by SQLite over the timestamp or (user_id, timestamp) index; no row reaches Python
+        where, params = [], []
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since[:10])
+        if until:
+            where.append("timestamp < ?")
+            params.append((date.fromisoformat(until[:10]) + timedelta(days=1)).isoformat())
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        sql = (f"SELECT {self._ANALYTICS_KEYS[group_by]} AS key, SUM(has_quiz = 0) AS questions, "
+               "SUM(has_quiz) AS attempts, "
+               "SUM(has_quiz AND coalesce(json_extract(quiz_attempt, '$.is_correct'), 0)) AS correct "
+               f"FROM sessions {'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY key "
+               "ORDER BY min(timestamp), min(id)")  # Ties keep first-seen order, as in the column path
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        totals = {}
+        for row in rows:
+            key = topic_of({"question": row["key"]}) if group_by == "topic" else row["key"]
+            group = totals.setdefault(key, {"questions": 0, "attempts": 0, "correct": 0})
+            for name in group:
+                group[name] += row[name]
+        return history_archive.summarize_groups(totals, group_by, limit)
+
+    def get_progress(self, user_id: str) -> dict:
+        with self._connection() as conn:
+            row = conn.execute("SELECT progress FROM user_progress WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row["progress"]) if row else empty_progress()
+
+    def clear_all_sessions(self) -> None:
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._fts:
+                    conn.execute("INSERT INTO sessions_fts (sessions_fts) VALUES ('delete-all')")
+                conn.execute("DELETE FROM sessions")
+                conn.execute("DELETE FROM user_progress")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+class WriteBehindSessionStore(SessionStore):
+    """
+    Puts a WriteBehindQueue in front of another store, so logging a session only queues it.
+
+    Sessions are committed to the wrapped store in groups by a background thread; the
+    queue's spool file covers worker crashes and is replayed on the next start. Reads first
+    wait for this process's queued sessions, so a user always sees what they just logged;
+    other workers see them within WRITE_BEHIND_DELAY.
+    """
+
+    def __init__(self, store: SessionStore, spool_dir: str):
+        self.store = store
+        self.queue = WriteBehindQueue(store.append_sessions, spool_dir, contains=self._contains)
+        self.queue.replay()
+
+    def _contains(self, entry: dict) -> bool:
+        key = (entry.get("question"), entry.get("answer"))
+        return any((stored.get("question"), stored.get("answer")) == key for stored in self.store.iter_sessions(
+            since=entry["timestamp"], until=entry["timestamp"], user_id=entry.get("user_id")))
+
+    def append_sessions(self, entries: list) -> None:
+        self.queue.submit(entries)
+
+    def get_all_sessions(self) -> list:
+        self.queue.flush()
+        return self.store.get_all_sessions()
+
+    def _iter_positioned(self, after: str = None, before: str = None, since: str = None, until: str = None,
+                         has_quiz: bool = None, user_id: str = None, newest_first: bool = False,
+                         limit: int = None):
+        self.queue.flush()
+        return self.store._iter_positioned(after, before, since, until, has_quiz, user_id, newest_first, limit)
+
+    def _search(self, query: str, user_id: str, limit: int, offset: int) -> list:
+        self.queue.flush()
+        return self.store._search(query, user_id, limit, offset)
+
+    def _analytics(self, group_by: str, since: str, until: str, user_id: str, limit: int) -> list:
+        self.queue.flush()
+        return self.store._analytics(group_by, since, until, user_id, limit)
+
+    def get_progress(self, user_id: str) -> dict:
+        self.queue.flush()
+        return self.store.get_progress(user_id)
+
+    def clear_all_sessions(self) -> None:
+        self.queue.flush()
+        self.store.clear_all_sessions()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """
+    Returns the process-wide session store selected by SESSION_STORE_BACKEND.
+
+    Unless WRITE_BEHIND=0, the store is wrapped in a WriteBehindSessionStore.
+
+    Returns:
+        SessionStore: A SQLiteSessionStore ("sqlite") or TrackerSessionStore ("file").
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE_BACKEND == "file":
+                _store, spool_dir = TrackerSessionStore(), os.path.join(tracker.LOG_DIR, "spool")
+            elif SESSION_STORE_BACKEND == "sqlite":
+                _store, spool_dir = SQLiteSessionStore(), SESSION_DB_PATH + "-spool"
+            else:
+                raise ValueError(f"Unknown SESSION_STORE_BACKEND: {SESSION_STORE_BACKEND!r}")
+            if WRITE_BEHIND:
+                _store = WriteBehindSessionStore(_store, spool_dir)
+        return _store
+
+if __name__ == '__main__':
+    # Example usage (run from the repository root: python -m utils.session_store)
+    store = get_session_store()
+    store.clear_all_sessions()
+    store.log_session("What is photosynthesis?", "Plants turning light into chemical energy.", user_id="demo")
+    store.log_session(
+        "What is photosynthesis?",
+        "Plants turning light into chemical energy.",
+        quiz_attempt={"quiz_question": "What do plants convert?", "selected_option": "Light",
+                      "correct_answer": "Light", "is_correct": True},
+        user_id="demo"
+    )
+    print(json.dumps(store.get_all_sessions(), indent=2))
+    print(json.dumps(store.get_progress("demo"), indent=2))
+    print(json.dumps(store.search_sessions("photosynth"), indent=2))
+    store.clear_all_sessions()
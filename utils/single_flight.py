@@ -0,0 +1,119 @@
+# single_flight.py
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from utils.metrics import registry
+
+class _LeaderCancelled(Exception):
+    """Set on a flight whose leading caller was cancelled; waiting callers retry."""
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one in-flight execution.
+
+    The first caller for a key (the leader) runs the function; callers arriving while it is
+    running wait for the same result instead of starting their own. Results are shared
+    through a concurrent.futures.Future, so sync callers in worker threads and async
+    callers on any thread's event loop can join the same flight. Nothing is cached: the key
+    is released as soon as the leader finishes.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key -> Future of the running call
+        self._lock = threading.Lock()
+        self.stats = {}     # namespace -> {"leaders": n, "coalesced": n}
+
+    def _join(self, key: tuple):
+        """Returns (future, is_leader) for key; key[0] names the caller for the metrics."""
+        with self._lock:
+            counts = self.stats.setdefault(key[0], {"leaders": 0, "coalesced": 0})
+            future = self._flights.get(key)
+            if future is not None:
+                counts["coalesced"] += 1
+                return future, False
+            future = Future()
+            future.set_running_or_notify_cancel()  # A waiter giving up must not cancel the shared call
+            self._flights[key] = future
+            counts["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: tuple, future: Future):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def do(self, key: tuple, fn, *args):
+        """
+        Runs fn(*args), or waits for the identical call already in flight under key.
+
+        Args:
+            key (tuple): Hashable call identity; the first element is a namespace used in metrics.
+            fn: Callable to run if no identical call is in flight.
+            *args: Arguments for fn.
+
+        Returns:
+            The result of fn (exceptions are re-raised in every caller).
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    self._finish(key, future)
+                    future.set_exception(e)
+                    raise
+                self._finish(key, future)
+                future.set_result(result)
+                return result
+            try:
+                return future.result()
+            except _LeaderCancelled:
+                continue  # Run (or join) a fresh flight
+
+    async def ado(self, key: tuple, coro_fn, *args):
+        """
+        asyncio version of do(): awaits coro_fn(*args) or the identical call already in flight.
+
+        A cancelled leader does not fail its waiters; they start or join a new flight.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await coro_fn(*args)
+                except asyncio.CancelledError:
+                    self._finish(key, future)
+                    future.set_exception(_LeaderCancelled())
+                    raise
+                except BaseException as e:
+                    self._finish(key, future)
+                    future.set_exception(e)
+                    raise
+                self._finish(key, future)
+                future.set_result(result)
+                return result
+            try:
+                return await asyncio.wrap_future(future)
+            except _LeaderCancelled:
+                continue
+
+    def get_stats(self) -> dict:
+        """Returns leader and coalesced call counts per namespace, and the number of calls in flight."""
+        with self._lock:
+            return {"namespaces": {ns: dict(counts) for ns, counts in self.stats.items()},
+                    "in_flight": len(self._flights)}
+
+# Shared by ai_response and quiz_generator
+llm_flights = SingleFlight()
+
+def _collect():
+    return {(("namespace", ns), ("kind", kind)): value
+            for ns, counts in llm_flights.get_stats()["namespaces"].items() for kind, value in counts.items()}
+
+registry.register_collector("llm_single_flight_total", "counter",
+                            "Upstream-bound calls that ran (leaders) or joined an identical in-flight call (coalesced).",
+                            _collect)
+registry.register_collector("llm_single_flight_in_flight", "gauge", "Distinct upstream calls currently in flight.",
+                            lambda: {(): llm_flights.get_stats()["in_flight"]})
@@ -0,0 +1,91 @@
+# static_assets.py
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Response
+
+from utils.lazy_import import optional_import
+from utils.metrics import registry
+
+# Pages served from memory, rendered and compressed once per process. Clients revalidate with
+# the ETag (a 304 costs no body); STATIC_MAX_AGE lets them skip revalidation for that many seconds.
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 0))
+STATIC_MIN_COMPRESS_BYTES = 1024  # Smaller pages are sent as is
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+class PrecompressedAsset:
+    """
+    A page rendered once and kept in memory as identity, gzip and (if the optional brotli
+    module is installed) brotli bodies, each with a strong ETag.
+
+    The page is built on first use, and rebuilt if its source file changes, so it must not
+    depend on the request. respond() picks the encoding from Accept-Encoding and answers
+    a matching If-None-Match with 304 Not Modified.
+    """
+
+    def __init__(self, name: str, render, source_path: str = None, mimetype: str = "text/html"):
+        """
+        Args:
+            name (str): Label used in metrics.
+            render: Callable returning the page as str or bytes (called with an app context).
+            source_path (str, optional): File whose modification time triggers a rebuild.
+            mimetype (str): Content type of the page.
+        """
+        self.name = name
+        self.render = render
+        self.source_path = source_path
+        self.mimetype = mimetype
+        self._variants = None  # encoding -> (body, etag); "identity" is always present
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _source_mtime(self):
+        try:
+            return os.stat(self.source_path).st_mtime_ns if self.source_path else None
+        except OSError:
+            return None
+
+    def build(self) -> dict:
+        """Renders and compresses the page if it is not built yet or its source changed."""
+        mtime = self._source_mtime()
+        if self._variants is not None and mtime == self._mtime:
+            return self._variants
+        with self._lock:
+            if self._variants is None or mtime != self._mtime:
+                body = self.render()
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                digest = hashlib.sha256(body).hexdigest()[:20]
+                bodies = {"identity": body}
+                if len(body) >= STATIC_MIN_COMPRESS_BYTES:
+                    bodies["gzip"] = gzip.compress(body, GZIP_LEVEL, mtime=0)  # mtime=0: same bytes in every worker
+                    brotli = optional_import("brotli")
+                    if brotli is not None:
+                        bodies["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+                # Each encoding is a different representation, so each gets its own strong ETag
+                self._variants = {encoding: (data, digest if encoding == "identity" else f"{digest}-{encoding}")
+                                  for encoding, data in bodies.items()}
+                self._mtime = mtime
+        return self._variants
+
+    def respond(self, request) -> Response:
+        """Returns the best encoded variant for the request, or 304 if the client's copy is current."""
+        variants = self.build()
+        encoding = request.accept_encodings.best_match([e for e in ("br", "gzip") if e in variants]) or "identity"
+        body, etag = variants[encoding]
+        registry.counter("static_responses_total", "Precompressed pages served, by page and encoding.",
+                         page=self.name, encoding=encoding).inc()
+        response = Response(body, mimetype=self.mimetype)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        response.vary.add("Accept-Encoding")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        return response.make_conditional(request)
+
+    def get_stats(self) -> dict:
+        """Returns the size of each built variant, in bytes."""
+        return {encoding: len(body) for encoding, (body, _) in (self._variants or {}).items()}
@@ -1,40 +1,746 @@
 # tracker.py
+import atexit
+import glob
 import json
+import hashlib
+import logging
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+from utils import history_archive
+from utils.history_archive import ARCHIVE_SUFFIX
+from utils.metrics import stage_timer
+from utils.progress import apply_session, empty_progress
+
+try:
+    import fcntl  # POSIX advisory locks so several worker processes can share the log
+except ImportError:
+    fcntl = None  # Windows: fall back to the in-process lock only
+
+logger = logging.getLogger(__name__)
+
 # Define the path for the history file relative to where the script is executed
 # This ensures it creates 'data' in the same directory as app.py
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
-HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
+HISTORY_FILE = os.path.join(DATA_DIR, "history.json")  # Legacy single-file history, migrated on first use
+
+# Sessions are stored as an append-only JSON Lines log split into numbered segments.
+# Logging a session appends one line, so its cost no longer grows with the history size.
+LOG_DIR = os.path.join(DATA_DIR, "history")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+SEGMENT_MAX_BYTES = int(os.environ.get("TRACKER_SEGMENT_MAX_BYTES", 8 * 1024 * 1024))
+# compact_segments() rewrites sealed segments as compressed columnar archives (segment-NNNNNN.col,
+# see utils/history_archive.py); readers treat an archive exactly like the segment it replaced.
+
+# Sessions with a user id are also appended to that user's shard (users/<hash prefix>/<hash>.jsonl),
+# next to a small progress file with the user's aggregates, so per-user reads never scan the global log.
+# Shards are derived from the log and not fsynced on every append: each progress file records the log
+# position it covers, and users/checkpoint.json the position up to which every shard has been fsynced.
+# On startup each process replays the log past the checkpoint into any shard that is behind.
+USER_DIR_NAME = "users"
+SHARD_CHECKPOINT = "checkpoint.json"
+SHARD_DIRTY_LIST = "dirty.list"  # Shard files written since the last checkpoint, by any process
+
+# fsync batching: flush to disk after this many appends or this many seconds, whichever comes first
+FSYNC_EVERY = int(os.environ.get("TRACKER_FSYNC_EVERY", 32))
+FSYNC_INTERVAL = float(os.environ.get("TRACKER_FSYNC_INTERVAL", 1.0))
+
+_lock = threading.Lock()
+_writer = {
+    "file": None,          # Open handle of the active segment
+    "segment": 0,          # Number of the active segment
+    "pending": 0,          # Appends not yet fsync'ed
+    "last_sync": 0.0,      # time.monotonic() of the last fsync
+    "timer": None,         # Deadline fsync for appends not followed by another one
+}
+_migrated = False
+_sharded = False
+
+_APPEND_TIMER = stage_timer("tracker_append")
+_READ_TIMER = stage_timer("tracker_read_segment")
 
 def _ensure_data_dir_exists():
     """Ensures that the data directory exists."""
     os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+def _segment_path(number: int) -> str:
+    """Returns the path of the segment with the given number."""
+    return os.path.join(LOG_DIR, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
 
-def _read_history() -> list:
-    """Reads the session history from the JSON file."""
-    _ensure_data_dir_exists() # Ensure directory exists before trying to read
-    if not os.path.exists(HISTORY_FILE):
-        return []
+def _list_segments() -> list:
+    """Returns the paths of all segments, oldest first."""
+    return sorted(glob.glob(os.path.join(LOG_DIR, f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")))
+
+def _segment_number(path: str) -> int:
+    """Extracts the segment number from a segment or archive path."""
+    name = os.path.basename(path)
+    return int(name[len(SEGMENT_PREFIX):].split(".")[0])
+
+def _archive_path(number: int) -> str:
+    return os.path.join(LOG_DIR, f"{SEGMENT_PREFIX}{number:06d}{ARCHIVE_SUFFIX}")
+
+def _list_stored_segments() -> list:
+    """
+    Returns the paths of all segments and archives, oldest first.
+
+    A segment whose archive already exists (compaction was interrupted before deleting it)
+    is left out, so no session is listed twice.
+    """
+    stored = {_segment_number(path): path for path in _list_segments()}
+    for path in glob.glob(os.path.join(LOG_DIR, f"{SEGMENT_PREFIX}*{ARCHIVE_SUFFIX}")):
+        stored[_segment_number(path)] = path
+    return [stored[number] for number in sorted(stored)]
+
+def _load_segment(path: str) -> list:
+    """Reads the sessions of a segment or archive."""
+    if not path.endswith(ARCHIVE_SUFFIX):
+        sessions = _read_segment(path)
+        if sessions or not os.path.exists(_archive_path(_segment_number(path))):
+            return sessions
+        path = _archive_path(_segment_number(path))  # Compacted after it was listed
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+        with _READ_TIMER.time():
+            return history_archive.read_entries(path)
+    except FileNotFoundError:
+        return []  # Removed by a concurrent clear_all_sessions()
+
+def _user_dir() -> str:
+    return os.path.join(LOG_DIR, USER_DIR_NAME)
+
+def _user_shard_base(user_id: str, root: str = None) -> str:
+    """Returns the shard path of a user without extension (the uid is hashed to a safe file name)."""
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    return os.path.join(root or _user_dir(), digest[:2], digest)
+
+class _FileLock:
+    """Cross-process lock on LOG_DIR/.lock (a no-op where fcntl is unavailable)."""
+
+    def __enter__(self):
+        self._fh = None
+        if fcntl is not None:
+            self._fh = open(os.path.join(LOG_DIR, ".lock"), 'a')
+            fcntl.flock(self._fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fh is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+            self._fh.close()
+
+def _migrate_legacy_history():
+    """
+    One-time migration of the old pretty-printed history.json into the segment log.
+
+    The converted segment is written to a temporary file and renamed into place, and the
+    legacy file is kept as history.json.migrated, so an interrupted migration can be re-run.
+    """
+    global _migrated
+    if _migrated:
+        return
+    _ensure_data_dir_exists()
+    with _FileLock():
+        if os.path.exists(HISTORY_FILE) and not _list_stored_segments():
+            try:
+                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning("%s is corrupted or empty. Skipping migration.", HISTORY_FILE)
+                legacy = []
+            target = _segment_path(1)
+            tmp_path = target + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in legacy:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+            os.replace(HISTORY_FILE, HISTORY_FILE + ".migrated")
+            logger.info("Migrated %d sessions from %s to %s.", len(legacy), HISTORY_FILE, LOG_DIR)
+    _migrated = True
+
+def _read_progress(base: str) -> dict:
+    try:
+        with open(base + ".progress.json", 'r', encoding='utf-8') as f:
             return json.load(f)
-    except json.JSONDecodeError:
-        print(f"Warning: {HISTORY_FILE} is corrupted or empty. Starting with an empty history.")
-        # Optionally, you might want to back up or clear the corrupted file
-        return []
+    except (FileNotFoundError, json.JSONDecodeError):
+        return empty_progress()
+
+class _ShardsBehind(Exception):
+    """A shard lost lines its progress file already counts; the shards must be rebuilt from the log."""
+
+def _append_to_user_shards_locked(entries: list, ends: list, root: str = None, replay: bool = False):
+    """
+    Appends entries to their users' shards and folds them into the users' progress files.
+    Caller holds _lock and the cross-process file lock.
+
+    ends holds the log position (segment number, byte offset) just past each entry. Each
+    progress file records the position of the last entry it includes and the shard's size at
+    that point; with replay, entries a shard already includes are skipped and lines appended
+    after its progress was last written are cut off before the rest is appended.
+    """
+    by_user = {}
+    for entry, end in zip(entries, ends):
+        if entry.get("user_id"):
+            by_user.setdefault(entry["user_id"], []).append((entry, end))
+    written = []
+    for user_id, user_entries in by_user.items():
+        base = _user_shard_base(user_id, root)
+        shard_path = base + SEGMENT_SUFFIX
+        progress = _read_progress(base)
+        covered = progress.pop("log", None)
+        if replay and covered is not None:
+            try:
+                size = os.path.getsize(shard_path)
+            except FileNotFoundError:
+                size = 0
+            if size < covered["shard_bytes"]:
+                raise _ShardsBehind(shard_path)
+            if size > covered["shard_bytes"]:
+                os.truncate(shard_path, covered["shard_bytes"])
+            user_entries = [(entry, end) for entry, end in user_entries if tuple(end) > tuple(covered["through"])]
+            if not user_entries:
+                continue
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        with open(shard_path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry, _ in user_entries))
+            f.flush()
+            shard_bytes = os.fstat(f.fileno()).st_size
+        for entry, _ in user_entries:
+            apply_session(progress, entry)
+        progress["log"] = {"through": list(user_entries[-1][1]), "shard_bytes": shard_bytes}
+        tmp_path = base + ".progress.json.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(progress, f, ensure_ascii=False)
+        os.replace(tmp_path, base + ".progress.json")
+        written += [shard_path, base + ".progress.json"]
+    if written and root is None:
+        with open(os.path.join(_user_dir(), SHARD_DIRTY_LIST), 'a', encoding='utf-8') as f:
+            f.write("".join(path + "\n" for path in written))
+
+def _fsync_path(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return  # Removed by a concurrent clear_all_sessions()
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_checkpoint(position: tuple, root: str = None):
+    path = os.path.join(root or _user_dir(), SHARD_CHECKPOINT)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(list(position), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def _read_checkpoint():
+    try:
+        with open(os.path.join(_user_dir(), SHARD_CHECKPOINT), 'r', encoding='utf-8') as f:
+            return tuple(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError, TypeError):
+        return None
+
+def _checkpoint_shards_locked():
+    """
+    fsyncs the shard files written since the last checkpoint and records the log end as covered.
+    Caller holds _lock and the cross-process file lock, so every logged session is in its shard.
+    """
+    dirty_path = os.path.join(_user_dir(), SHARD_DIRTY_LIST)
+    try:
+        with open(dirty_path, 'r', encoding='utf-8') as f:
+            dirty = set(f.read().split("\n")) - {""}
+    except FileNotFoundError:
+        return  # Nothing written since the last checkpoint
+    for path in dirty:
+        _fsync_path(path)
+    _write_checkpoint(log_end())
+    os.remove(dirty_path)
+
+def _rebuild_user_shards_locked():
+    """Splits the whole log into fresh shards and progress files. Caller holds _lock and the file lock."""
+    # Built under a temporary name and renamed, so an interrupted split is redone from scratch
+    tmp_dir = _user_dir() + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    positioned, end = _read_positioned()
+    _append_to_user_shards_locked([entry for _, entry in positioned], [pos for pos, _ in positioned], root=tmp_dir)
+    for directory, _, names in os.walk(tmp_dir):
+        for name in names:
+            _fsync_path(os.path.join(directory, name))
+    _write_checkpoint(end, root=tmp_dir)
+    shutil.rmtree(_user_dir(), ignore_errors=True)
+    os.replace(tmp_dir, _user_dir())
+
+def _build_user_shards():
+    """
+    Brings the per-user shards up to date with the log, once per process.
+
+    Without a users directory (a pre-sharding log) or a checkpoint (shards written before
+    checkpoints existed), the shards are rebuilt from the whole log. Otherwise the sessions
+    logged after the checkpoint are replayed into any shard that does not include them yet,
+    which repairs shards whose unsynced writes were lost in a crash.
+    """
+    global _sharded
+    if _sharded:
+        return
+    _migrate_legacy_history()
+    with _lock, _FileLock():
+        checkpoint = _read_checkpoint() if os.path.isdir(_user_dir()) else None
+        if checkpoint is None:
+            _rebuild_user_shards_locked()
+        else:
+            positioned, _ = _read_positioned(checkpoint)
+            try:
+                _append_to_user_shards_locked([entry for _, entry in positioned], [pos for pos, _ in positioned],
+                                              replay=True)
+            except _ShardsBehind as e:
+                logger.warning("User shard %s is missing sessions; rebuilding all shards from the log.", e)
+                _rebuild_user_shards_locked()
+    _sharded = True
+
+def _sync_locked(force: bool = False) -> bool:
+    """fsyncs the active segment if the batch is full or the interval elapsed; returns True if it did. Caller holds _lock."""
+    fh = _writer["file"]
+    if fh is None or _writer["pending"] == 0:
+        return False
+    now = time.monotonic()
+    if force or _writer["pending"] >= FSYNC_EVERY or now - _writer["last_sync"] >= FSYNC_INTERVAL:
+        fh.flush()
+        os.fsync(fh.fileno())
+        _writer["pending"] = 0
+        _writer["last_sync"] = now
+        return True
+    return False
+
+def _schedule_sync_locked():
+    """Makes sure pending appends are fsync'ed within FSYNC_INTERVAL even if no append follows. Caller holds _lock."""
+    timer = _writer["timer"]
+    if _writer["pending"] and (timer is None or not timer.is_alive()):
+        timer = threading.Timer(FSYNC_INTERVAL, flush)
+        timer.daemon = True
+        timer.start()
+        _writer["timer"] = timer
+
+def _close_writer_locked():
+    """Syncs and closes the active segment. Caller holds _lock."""
+    if _writer["file"] is not None:
+        _sync_locked(force=True)
+        _writer["file"].close()
+        _writer["file"] = None
+        _writer["segment"] = 0
+
+def _active_segment_locked():
+    """
+    Returns an append handle on the newest segment, rotating when it is full.
+    Caller holds _lock and the cross-process file lock.
+
+    The handle is kept between appends. The directory is only listed again when the file
+    was removed (cleared or compacted by another process) or another process started the
+    next segment, which is checked with one fstat and one stat.
+    """
+    if _writer["file"] is not None:
+        if (os.fstat(_writer["file"].fileno()).st_nlink == 0
+                or os.path.exists(_segment_path(_writer["segment"] + 1))):
+            _close_writer_locked()
+    if _writer["file"] is None:
+        segments = _list_stored_segments()
+        newest = _segment_number(segments[-1]) if segments else 1
+        if segments and segments[-1].endswith(ARCHIVE_SUFFIX):
+            newest += 1  # Never append to a number that already has an archive
+        _writer["file"] = open(_segment_path(newest), 'a', encoding='utf-8')
+        _writer["segment"] = newest
+    if os.fstat(_writer["file"].fileno()).st_size >= SEGMENT_MAX_BYTES:
+        newest = _writer["segment"] + 1
+        _close_writer_locked()
+        _writer["file"] = open(_segment_path(newest), 'a', encoding='utf-8')
+        _writer["segment"] = newest
+    return _writer["file"]
+
+def _append_entries(entries: list):
+    """Appends session entries to the log as JSON lines, then to the per-user shards."""
+    _build_user_shards()
+    lines = [(json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8") for entry in entries]
+    with _APPEND_TIMER.time(), _lock, _FileLock():
+        fh = _active_segment_locked()
+        ends, offset = [], os.fstat(fh.fileno()).st_size
+        for line in lines:
+            offset += len(line)
+            ends.append((_writer["segment"], offset))
+        fh.write(b"".join(lines).decode("utf-8"))
+        fh.flush()  # Hand the bytes to the OS so other processes see them; fsync is batched
+        _writer["pending"] += len(entries)
+        # The global log is the source of truth; shards are derived from it and checkpointed at the next fsync
+        _append_to_user_shards_locked(entries, ends)
+        if _sync_locked():
+            _checkpoint_shards_locked()
+        _schedule_sync_locked()
+
+def _read_segment(path: str) -> list:
+    """Parses one segment into a list of sessions, skipping a torn trailing line."""
+    sessions = []
+    try:
+        with _READ_TIMER.time(), open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    sessions.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; everything before it is intact
+                    logger.warning("Skipping corrupted line in %s.", path)
+    except FileNotFoundError:
+        # Segment removed by a concurrent clear_all_sessions()
+        pass
+    return sessions
+
+# Sparse time index: segment path -> (size, first timestamp, last timestamp).
+# Entries are cached by file size, so sealed segments are indexed once and the active
+# segment is re-indexed only after it grows.
+_segment_index = {}
+
+def _segment_bounds(path: str):
+    """Returns (first_timestamp, last_timestamp) of a segment, or None if it is empty."""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        archive = _archive_path(_segment_number(path))
+        return None if path == archive or not os.path.exists(archive) else _segment_bounds(archive)
+    cached = _segment_index.get(path)
+    if cached and cached[0] == size:
+        return cached[1:]
+    if path.endswith(ARCHIVE_SUFFIX):
+        header = history_archive.read_header(path)
+        if header["first_timestamp"] is None:
+            return None
+        _segment_index[path] = (size, header["first_timestamp"], header["last_timestamp"])
+        return _segment_index[path][1:]
+    first = last = None
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    first = json.loads(line)["timestamp"]
+                    break
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        # Only the tail is needed for the last timestamp
+        f.seek(max(0, size - 64 * 1024))
+        for line in f.read().splitlines():
+            try:
+                last = json.loads(line)["timestamp"]
+            except (json.JSONDecodeError, KeyError, UnicodeDecodeError):
+                continue
+    if first is None:
+        return None
+    _segment_index[path] = (size, first, last or first)
+    return first, last or first
+
+def _iter_sessions(start: str = None, end: str = None, reverse: bool = False, with_position: bool = False):
+    """
+    Yields logged sessions, streaming one segment at a time.
+
+    Args:
+        start (str, optional): Only segments that may hold timestamps >= start are read.
+        end (str, optional): Only segments that may hold timestamps <= end are read.
+        reverse (bool): Yield newest first instead of oldest first.
+        with_position (bool): Yield ((segment number, index in segment), session) pairs.
+    """
+    _migrate_legacy_history()
+    segments = _list_stored_segments()
+    if reverse:
+        segments.reverse()
+    for path in segments:
+        if start is not None or end is not None:
+            bounds = _segment_bounds(path)
+            if bounds is None:
+                continue
+            if (start is not None and bounds[1] < start) or (end is not None and bounds[0] > end):
+                continue
+        sessions = _load_segment(path)
+        # Archives keep the segment's row order, so an index stays valid after compaction
+        order = range(len(sessions) - 1, -1, -1) if reverse else range(len(sessions))
+        if with_position:
+            number = _segment_number(path)
+            yield from (((number, i), sessions[i]) for i in order)
+        else:
+            yield from (sessions[i] for i in order)
+
+def iter_sessions(start: str = None, end: str = None, reverse: bool = False, with_position: bool = False):
+    """
+    Streams logged sessions without loading the whole history.
+
+    Segments entirely outside [start, end] are skipped using the segment time index,
+    so callers still need to filter individual entries against the range.
+
+    Args:
+        start (str, optional): ISO timestamp lower bound used to skip old segments.
+        end (str, optional): ISO timestamp upper bound used to skip new segments.
+        reverse (bool): Yield newest first instead of oldest first.
+        with_position (bool): Yield (position, session) pairs, where position is
+                              (segment number, index in segment) and orders sessions like the log.
+
+    Yields:
+        dict: One session per iteration.
+    """
+    return _iter_sessions(start, end, reverse, with_position)
+
+def iter_user_sessions(user_id: str, reverse: bool = False, with_position: bool = False):
+    """
+    Streams one user's sessions from their shard, without touching the global log.
+
+    Args:
+        user_id (str): Firebase uid of the user.
+        reverse (bool): Yield newest first instead of oldest first.
+        with_position (bool): Yield ((index in shard,), session) pairs.
+
+    Yields:
+        dict: One session per iteration.
+    """
+    _build_user_shards()
+    sessions = _read_segment(_user_shard_base(user_id) + SEGMENT_SUFFIX)
+    order = range(len(sessions) - 1, -1, -1) if reverse else range(len(sessions))
+    if with_position:
+        yield from (((i,), sessions[i]) for i in order)
+    else:
+        yield from (sessions[i] for i in order)
+
+def log_end() -> tuple:
+    """Returns the current end of the log as (segment number, byte offset); (0, 0) when it is empty."""
+    _migrate_legacy_history()
+    segments = _list_stored_segments()
+    if not segments:
+        return 0, 0
+    try:
+        if segments[-1].endswith(ARCHIVE_SUFFIX):
+            return _segment_number(segments[-1]), history_archive.read_header(segments[-1])["source_bytes"]
+        return _segment_number(segments[-1]), os.path.getsize(segments[-1])
     except FileNotFoundError:
-        # This case should ideally be caught by os.path.exists, but included for robustness
-        return []
+        return 0, 0
+
+def _read_positioned(position: tuple = None) -> tuple:
+    """
+    Returns the sessions appended after a log position, each with the position just past it.
+
+    Returns:
+        tuple: (list of ((segment number, byte offset), session), position after them).
+    """
+    _migrate_legacy_history()
+    segment, offset = position or (0, 0)
+    positioned = []
+    for path in _list_stored_segments():
+        number = _segment_number(path)
+        if number < segment:
+            continue
+        start = offset if number == segment else 0
+        data = None
+        if not path.endswith(ARCHIVE_SUFFIX):
+            try:
+                with _READ_TIMER.time(), open(path, 'rb') as f:
+                    f.seek(start)
+                    data = f.read()
+            except FileNotFoundError:
+                path = _archive_path(number)  # Compacted after it was listed
+        if data is None:
+            try:
+                reader = history_archive.ArchiveReader(path)
+            except FileNotFoundError:
+                continue  # Removed by a concurrent clear_all_sessions()
+            ends = reader.column("line_end")
+            positioned.extend(((number, line_end), entry)
+                              for entry, line_end in zip(reader.entries(), ends) if line_end > start)
+            segment, offset = number, reader.header["source_bytes"]
+            continue
+        end = data.rfind(b"\n") + 1
+        line_end = start
+        for line in data[:end].splitlines(keepends=True):
+            line_end += len(line)
+            if not line.strip():
+                continue
+            try:
+                positioned.append(((number, line_end), json.loads(line)))
+            except json.JSONDecodeError:
+                logger.warning("Skipping corrupted line in %s.", path)
+        segment, offset = number, start + end
+    return positioned, (segment, offset)
+
+def read_appended(position: tuple = None) -> tuple:
+    """
+    Returns the sessions appended after a log position, for indexes that tail the log.
+
+    A partially written last line is left for the next call.
 
-def _write_history(history_data: list):
-    """Writes the session history to the JSON file."""
-    _ensure_data_dir_exists() # Ensure directory exists before trying to write
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history_data, f, indent=4)
+    Args:
+        position (tuple, optional): (segment number, byte offset) returned by an earlier call
+                                    or by log_end(); None reads from the beginning.
 
-def log_session(question: str, answer: str, quiz_attempt: dict = None) -> None:
+    Returns:
+        tuple: (list of sessions, position after them).
+    """
+    positioned, position = _read_positioned(position)
+    return [entry for _, entry in positioned], position
+
+# Segment path -> (bytes encoded, ColumnBuilder) for segments not yet compacted, least recently used
+# first. The active segment is then only encoded for the lines appended since the previous call; each
+# builder holds a topic dictionary, so only the last COLUMN_CACHE_SEGMENTS are kept in each process
+# and older sealed segments (normally already compacted into archives) are encoded on demand.
+COLUMN_CACHE_SEGMENTS = int(os.environ.get("TRACKER_COLUMN_CACHE_SEGMENTS", 1))
+_column_cache = OrderedDict()
+_column_lock = threading.Lock()
+
+def _segment_columns(path: str):
+    """Returns the analytics columns of a JSON Lines segment, or None if it is gone."""
+    with _column_lock:
+        size, builder = _column_cache.get(path) or (0, None)
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < size:
+                    size, builder = 0, None  # Cleared and started again
+                f.seek(size)
+                data = f.read()
+        except FileNotFoundError:
+            _column_cache.pop(path, None)
+            return None
+        builder = builder or history_archive.ColumnBuilder()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                builder.add(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping corrupted line in %s.", path)
+        _column_cache[path] = (size + end, builder)
+        _column_cache.move_to_end(path)
+        while len(_column_cache) > COLUMN_CACHE_SEGMENTS:
+            _column_cache.popitem(last=False)
+        return builder.columns()
+
+def iter_columns(start: str = None, end: str = None):
+    """
+    Yields analytics columns (utils/history_archive.Columns) for every segment that may hold
+    timestamps in [start, end]. Archives are memory-mapped; segments not yet compacted are
+    encoded incrementally and cached.
+
+    Args:
+        start (str, optional): ISO timestamp lower bound used to skip old segments.
+        end (str, optional): ISO timestamp upper bound used to skip new segments.
+    """
+    _migrate_legacy_history()
+    for path in _list_stored_segments():
+        if start is not None or end is not None:
+            bounds = _segment_bounds(path)
+            if bounds is None:
+                continue
+            if (start is not None and bounds[1] < start) or (end is not None and bounds[0] > end):
+                continue
+        if not path.endswith(ARCHIVE_SUFFIX):
+            columns = _segment_columns(path)
+            if columns is not None:
+                yield columns
+                continue
+            path = _archive_path(_segment_number(path))  # Compacted after it was listed
+        try:
+            yield history_archive.ArchiveReader(path).columns()
+        except FileNotFoundError:
+            continue  # Removed by a concurrent clear_all_sessions()
+
+def _read_segment_lines(path: str) -> tuple:
+    """Parses a sealed segment into (sessions, byte offset where each one ends)."""
+    sessions, ends, position = [], [], 0
+    with open(path, 'rb') as f:
+        for line in f:
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                sessions.append(json.loads(line))
+                ends.append(position)
+            except json.JSONDecodeError:
+                logger.warning("Skipping corrupted line in %s.", path)
+    return sessions, ends
+
+def compact_segments() -> int:
+    """
+    Rolls every sealed segment (all but the newest) into a compressed columnar archive.
+
+    Sealed segments are never written again, so each archive is built without holding the
+    log lock; only swapping it in for the segment is done under the lock. An archive left
+    behind by an interrupted run takes precedence over its segment, which is then removed.
+
+    Returns:
+        int: Number of segments compacted.
+    """
+    _migrate_legacy_history()
+    compacted = 0
+    for path in _list_segments()[:-1]:
+        number = _segment_number(path)
+        tmp_archive = _archive_path(number) + ".build"
+        if not os.path.exists(_archive_path(number)):
+            try:
+                sessions, ends = _read_segment_lines(path)
+            except FileNotFoundError:
+                continue
+            history_archive.write_archive(tmp_archive, sessions, ends, source_bytes=os.path.getsize(path))
+        with _lock, _FileLock():
+            if not os.path.exists(path):
+                # Cleared meanwhile: drop the archive instead of resurrecting its sessions
+                if os.path.exists(tmp_archive):
+                    os.remove(tmp_archive)
+                continue
+            if os.path.exists(tmp_archive):
+                os.replace(tmp_archive, _archive_path(number))
+            os.remove(path)
+            _segment_index.pop(path, None)
+        with _column_lock:
+            _column_cache.pop(path, None)
+        compacted += 1
+    return compacted
+
+def get_user_progress(user_id: str) -> dict:
+    """
+    Returns a user's precomputed aggregates (see utils/progress.py); reads one small file.
+
+    Args:
+        user_id (str): Firebase uid of the user.
+
+    Returns:
+        dict: {"totals": {...}, "topics": {topic: {...}}}.
+    """
+    _build_user_shards()
+    progress = _read_progress(_user_shard_base(user_id))
+    progress.pop("log", None)  # The log position the file covers
+    return progress
+
+def flush():
+    """Forces any batched appends, and the shards written with them, to be fsync'ed to disk."""
+    with _lock:
+        if _writer["file"] is None or _writer["pending"] == 0:
+            return
+        with _FileLock():
+            _sync_locked(force=True)
+            _checkpoint_shards_locked()
+
+atexit.register(flush)
+
+def append_sessions(entries: list) -> None:
+    """
+    Appends already-built session entries to the log in a single write.
+
+    Args:
+        entries (list): Session dictionaries as produced by log_session().
+    """
+    if entries:
+        _append_entries(entries)
+
+def log_session(question: str, answer: str, quiz_attempt: dict = None, user_id: str = None) -> dict:
     """
     Logs a Q&A session and optionally a quiz attempt.
 
@@ -44,18 +750,21 @@ def log_session(question: str, answer: str, quiz_attempt: dict = None) -> None:
         quiz_attempt (dict, optional): Details of the quiz attempt.
                                       Should include 'quiz_question', 'selected_option', 'correct_answer', 'is_correct'.
                                       Defaults to None.
+        user_id (str, optional): Firebase uid of the user, if known.
+
+    Returns:
+        dict: The logged session entry.
     """
     session_entry = {
         "timestamp": datetime.now().isoformat(),
         "question": question,
         "answer": answer,
-        "quiz_attempt": quiz_attempt if quiz_attempt else {} # Store an empty dict if no quiz attempt
+        "quiz_attempt": quiz_attempt if quiz_attempt else {}, # Store an empty dict if no quiz attempt
+        "user_id": user_id
     }
-    
-    history = _read_history()
-    history.append(session_entry)
-    _write_history(history)
-    print("Session logged successfully.")
+
+    _append_entries([session_entry])
+    return session_entry
 
 def get_all_sessions() -> list:
     """
@@ -64,16 +773,29 @@ def get_all_sessions() -> list:
     Returns:
         list: A list of dictionaries, each representing a session.
     """
-    return _read_history()
+    return list(_iter_sessions())
 
 def clear_all_sessions():
     """Clears all logged session history."""
     _ensure_data_dir_exists() # Ensure directory exists
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
-        print(f"All sessions cleared from {HISTORY_FILE}.")
+    with _lock, _FileLock():
+        _close_writer_locked()
+        segments = _list_segments() + glob.glob(os.path.join(LOG_DIR, f"{SEGMENT_PREFIX}*{ARCHIVE_SUFFIX}"))
+        for path in segments:
+            os.remove(path)
+        _segment_index.clear()
+        with _column_lock:
+            _column_cache.clear()
+        shutil.rmtree(_user_dir(), ignore_errors=True)
+        os.makedirs(_user_dir())
+        _write_checkpoint((0, 0))
+        if os.path.exists(HISTORY_FILE):
+            os.remove(HISTORY_FILE)
+            segments.append(HISTORY_FILE)
+    if segments:
+        logger.info("All sessions cleared from %s.", LOG_DIR)
     else:
-        print("No history file found to clear.")
+        logger.info("No history file found to clear.")
 
 if __name__ == '__main__':
     # Example Usage:
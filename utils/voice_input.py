@@ -1,8 +1,36 @@
 # voice_input.py
+import math
+import logging
 import os
+import struct
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.lazy_import import optional_import
+from utils.metrics import registry, stage_timer, stats_collector
+
+logger = logging.getLogger(__name__)
 # Note: For actual Omnidimension SDK integration, you would need to install it
 # and potentially handle audio recording/streaming here.
 
+# Streaming ASR settings, overridable from the environment.
+# Audio is 16-bit little-endian mono PCM, either raw or with a WAV header.
+VOICE_SAMPLE_RATE = int(os.environ.get("VOICE_SAMPLE_RATE", 16000))        # Default rate for raw PCM
+VAD_FRAME_MS = 30                                                          # Analysis frame length
+VAD_ENERGY_THRESHOLD = float(os.environ.get("VAD_ENERGY_THRESHOLD", 500))  # RMS level counted as speech
+VAD_HANGOVER_MS = int(os.environ.get("VAD_HANGOVER_MS", 600))              # Silence that ends an utterance
+VAD_MAX_SEGMENT_SECONDS = float(os.environ.get("VAD_MAX_SEGMENT_SECONDS", 15))
+VOICE_MAX_SECONDS = float(os.environ.get("VOICE_MAX_SECONDS", 120))        # Longest accepted recording
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "placeholder")
+ASR_WORKERS = int(os.environ.get("ASR_WORKERS", 2))
+WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "base.en")
+
+PLACEHOLDER_TRANSCRIPT = "This is a transcribed placeholder text from your audio input."
+
+_TRANSCRIBE_TIMER = stage_timer("asr_transcribe")
+
 def convert_audio_to_text(audio_file_path: str) -> str:
     """
     Simulates accepting audio input from a file and converting it to text.
@@ -39,7 +67,227 @@ def convert_audio_to_text(audio_file_path: str) -> str:
     elif "history" in audio_file_path.lower() or "ww1" in audio_file_path.lower():
         return "Can you explain the main causes of World War One?"
     else:
-        return "This is a transcribed placeholder text from your audio input."
+        return PLACEHOLDER_TRANSCRIPT
+
+class AudioFormatError(ValueError):
+    """Raised for audio the streaming transcriber cannot accept."""
+
+class PlaceholderBackend:
+    """
+    Local stand-in for a speech recognizer, used for tests and when no ASR engine is installed.
+
+    Returns the same placeholder sentence as convert_audio_to_text() for every speech segment.
+    """
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        return PLACEHOLDER_TRANSCRIPT
+
+class WhisperBackend:
+    """Transcribes with a local faster-whisper model (pip install faster-whisper)."""
+
+    def __init__(self, model_size: str = WHISPER_MODEL_SIZE):
+        faster_whisper = optional_import("faster_whisper")  # Optional; only loaded when this backend is chosen
+        if faster_whisper is None:
+            raise RuntimeError("faster-whisper is not installed.")
+        self.model = faster_whisper.WhisperModel(model_size, device="cpu", compute_type="int8")
+
+    def transcribe(self, pcm: bytes, sample_rate: int) -> str:
+        import numpy as np  # Installed with faster-whisper
+        if sample_rate != 16000:
+            raise AudioFormatError("The whisper backend needs 16 kHz audio.")
+        audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        segments, _ = self.model.transcribe(audio, language="en")
+        return " ".join(segment.text.strip() for segment in segments)
+
+# Backend factories selectable with ASR_BACKEND; register_backend() adds more
+_BACKENDS = {"placeholder": PlaceholderBackend, "whisper": WhisperBackend}
+_backend = None
+_backend_lock = threading.Lock()
+
+def register_backend(name: str, factory):
+    """
+    Makes an ASR backend selectable by name.
+
+    Args:
+        name (str): Value of ASR_BACKEND that selects it.
+        factory: Callable returning an object with transcribe(pcm: bytes, sample_rate: int) -> str.
+    """
+    _BACKENDS[name] = factory
+
+def get_backend():
+    """Returns the process-wide ASR backend chosen by ASR_BACKEND (falls back to the placeholder)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = _BACKENDS[ASR_BACKEND]()
+                except (KeyError, RuntimeError) as e:
+                    logger.warning("ASR backend '%s' unavailable (%s); using the placeholder.", ASR_BACKEND, e)
+                    _backend = PlaceholderBackend()
+    return _backend
+
+# Shared by every stream so transcription of finished utterances overlaps with the upload
+_executor = ThreadPoolExecutor(max_workers=ASR_WORKERS, thread_name_prefix="asr")
+_stats = {"streams": 0, "segments": 0, "audio_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def _parse_wav_header(header: bytes) -> tuple:
+    """Returns (sample_rate, data_offset) for a PCM WAV header, or raises AudioFormatError."""
+    if header[8:12] != b"WAVE":
+        raise AudioFormatError("Not a WAV file.")
+    offset = 12
+    sample_rate = None
+    while offset + 8 <= len(header):
+        chunk_id, size = struct.unpack_from("<4sI", header, offset)
+        if chunk_id == b"fmt ":
+            if offset + 24 > len(header):
+                break  # The rest of the fmt chunk has not arrived yet
+            audio_format, channels, sample_rate = struct.unpack_from("<HHI", header, offset + 8)
+            bits = struct.unpack_from("<H", header, offset + 22)[0]
+            if audio_format != 1 or channels != 1 or bits != 16:
+                raise AudioFormatError("Only 16-bit mono PCM audio is supported.")
+        elif chunk_id == b"data":
+            if sample_rate is None:
+                raise AudioFormatError("WAV data chunk before fmt chunk.")
+            return sample_rate, offset + 8
+        offset += 8 + size + (size & 1)
+    raise AudioFormatError("Incomplete WAV header.")
+
+class StreamingTranscriber:
+    """
+    Incremental speech-to-text for audio that arrives in chunks.
+
+    feed() splits the incoming PCM into frames and runs an energy-based voice activity
+    detector over them. Silent frames are dropped; when an utterance ends (VAD_HANGOVER_MS of
+    silence, or VAD_MAX_SEGMENT_SECONDS of speech) it is handed to the ASR worker pool, so
+    earlier utterances are transcribed while later audio is still uploading. finish() waits
+    for the outstanding segments and returns the joined transcript. Nothing touches disk.
+    """
+
+    def __init__(self, backend=None, sample_rate: int = None, executor: ThreadPoolExecutor = None):
+        self.backend = backend or get_backend()
+        self.sample_rate = sample_rate            # None: read it from a WAV header, else VOICE_SAMPLE_RATE
+        self.executor = executor or _executor
+        self._pending = b""                       # Bytes not yet forming a whole frame (or the WAV header)
+        self._header_done = False
+        self._speech = bytearray()                # Current utterance, including its trailing silence
+        self._silent_frames = 0
+        self._futures = []
+        self.audio_seconds = 0.0
+        with _stats_lock:
+            _stats["streams"] += 1
+
+    def _start(self, data: bytes) -> bytes:
+        # Decides between WAV and raw PCM on the first bytes; returns the audio that follows
+        if len(data) < 12:
+            return None
+        if data[:4] != b"RIFF":
+            self.sample_rate = self.sample_rate or VOICE_SAMPLE_RATE
+            self._header_done = True
+            return data
+        try:
+            sample_rate, offset = _parse_wav_header(data)
+        except AudioFormatError:
+            if len(data) < 4096:
+                return None  # Header not complete yet; wait for more bytes
+            raise
+        self.sample_rate = sample_rate
+        self._header_done = True
+        return data[offset:]
+
+    def _frame_bytes(self) -> int:
+        return self.sample_rate * VAD_FRAME_MS // 1000 * 2
+
+    def _is_speech(self, frame: bytes) -> bool:
+        samples = array("h", frame)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        rms = math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+        return rms >= VAD_ENERGY_THRESHOLD
+
+    def _submit_segment(self):
+        # Trailing hangover silence is kept; it is short and helps the recognizer end words cleanly
+        if self._speech:
+            segment = bytes(self._speech)
+            self._futures.append(self.executor.submit(self._transcribe, segment))
+            with _stats_lock:
+                _stats["segments"] += 1
+        self._speech = bytearray()
+        self._silent_frames = 0
+
+    def _transcribe(self, segment: bytes) -> str:
+        with _TRANSCRIBE_TIMER.time():
+            return self.backend.transcribe(segment, self.sample_rate).strip()
+
+    def feed(self, chunk: bytes):
+        """
+        Adds the next chunk of audio (any size; frames may span chunks).
+
+        Raises:
+            AudioFormatError: If the audio is not 16-bit mono PCM or exceeds VOICE_MAX_SECONDS.
+        """
+        data = self._pending + chunk
+        if not self._header_done:
+            data = self._start(data)
+            if data is None:
+                self._pending = self._pending + chunk
+                return
+        frame_bytes = self._frame_bytes()
+        hangover = max(1, VAD_HANGOVER_MS // VAD_FRAME_MS)
+        max_frames = int(VAD_MAX_SEGMENT_SECONDS * 1000 / VAD_FRAME_MS)
+        usable = len(data) - len(data) % frame_bytes
+        for offset in range(0, usable, frame_bytes):
+            frame = data[offset:offset + frame_bytes]
+            if self._is_speech(frame):
+                self._speech += frame
+                self._silent_frames = 0
+            elif self._speech:
+                self._speech += frame
+                self._silent_frames += 1
+                if self._silent_frames >= hangover:
+                    self._submit_segment()
+            if len(self._speech) >= max_frames * frame_bytes:
+                self._submit_segment()
+        self._pending = data[usable:]
+        self.audio_seconds += usable / 2 / self.sample_rate
+        if self.audio_seconds > VOICE_MAX_SECONDS:
+            raise AudioFormatError(f"Recording is longer than {VOICE_MAX_SECONDS:g} seconds.")
+
+    def finish(self) -> str:
+        """Flushes the last utterance and returns the full transcript (empty if no speech was heard)."""
+        self._submit_segment()
+        texts = [future.result() for future in self._futures]
+        with _stats_lock:
+            _stats["audio_seconds"] += self.audio_seconds
+        return " ".join(text for text in texts if text)
+
+def transcribe_stream(chunks, backend=None, sample_rate: int = None) -> str:
+    """
+    Transcribes audio delivered as an iterable of byte chunks (e.g. a request body stream).
+
+    Args:
+        chunks: Iterable of bytes, raw 16-bit mono PCM or a WAV file.
+        backend: Object with transcribe(pcm, sample_rate); defaults to the ASR_BACKEND backend.
+        sample_rate (int, optional): Rate of raw PCM input; ignored for WAV input.
+
+    Returns:
+        str: The transcript, empty if no speech was detected.
+    """
+    transcriber = StreamingTranscriber(backend=backend, sample_rate=sample_rate)
+    for chunk in chunks:
+        transcriber.feed(chunk)
+    return transcriber.finish()
+
+def get_stats() -> dict:
+    """Returns stream, segment and audio-duration counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+registry.register_collector("asr_events_total", "counter", "Voice streams and transcribed utterances.",
+                            stats_collector(get_stats, ("streams", "segments")))
+registry.register_collector("asr_audio_seconds_total", "counter", "Seconds of audio received for transcription.",
+                            lambda: {(): get_stats()["audio_seconds"]})
 
 if __name__ == '__main__':
     # Example usage:
@@ -67,3 +315,14 @@ if __name__ == '__main__':
             os.remove(path)
     if os.path.exists("random_audio.ogg"): # In case it was created by the dummy logic
         os.remove("random_audio.ogg")
+
+    # Streaming transcription of a synthetic recording: a tone burst, a pause, another burst
+    rate = VOICE_SAMPLE_RATE
+    tone = array("h", (int(8000 * math.sin(2 * math.pi * 440 * i / rate)) for i in range(rate))).tobytes()
+    silence = bytes(rate)  # 0.5 seconds
+    audio = silence + tone + silence + tone + silence
+    transcriber = StreamingTranscriber(sample_rate=rate)
+    for start in range(0, len(audio), 4096):
+        transcriber.feed(audio[start:start + 4096])
+    print(f"Streaming transcript: {transcriber.finish()}")
+    print(f"ASR stats: {get_stats()}")
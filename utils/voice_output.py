@@ -1,69 +1,270 @@
 # voice_output.py
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from utils.lazy_import import optional_import
+from utils.metrics import registry, stage_timer, stats_collector
+
+try:
+    import fcntl  # Cross-process lock so several workers can evict from one cache directory
+except ImportError:
+    fcntl = None
+
 # Note: pyttsx3 might require system-level installations (e.g., espeak, nss) and may not run
 # directly in all sandboxed environments. This code provides the structure for its use.
+# It is imported on the first synthesis (see utils/lazy_import.py); without it, synthesis is simulated.
+
+# Synthesis settings, overridable from the environment
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             '..', 'data', 'tts_cache'))
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", 2))
+TTS_ENGINE = os.environ.get("TTS_ENGINE", "pyttsx3")
+AUDIO_SUFFIX = ".wav"
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SYNTH_TIMER = stage_timer("tts_synthesize")
+_pyttsx3_lock = threading.Lock()  # The pyttsx3 engine is a process-wide singleton and not thread-safe
 
-# try:
-#     import pyttsx3
-# except ImportError:
-#     print("pyttsx3 not installed. Please install it using 'pip install pyttsx3'")
-#     pyttsx3 = None # Set to None if import fails
+def split_sentences(text: str) -> list:
+    """Splits text into sentences, the unit that is synthesized, cached and streamed."""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+def _synthesize_pyttsx3(text: str, voice: str = None) -> bytes:
+    pyttsx3 = optional_import("pyttsx3")
+    if pyttsx3 is None:
+        # Simulation for environments without pyttsx3
+        return f"Simulated audio content for: '{text}' (pyttsx3)".encode("utf-8")
+    with _pyttsx3_lock:
+        engine = pyttsx3.init()
+        if voice:
+            engine.setProperty("voice", voice)
+        fd, path = tempfile.mkstemp(suffix=AUDIO_SUFFIX)
+        os.close(fd)
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+def _synthesize_omnidimension(text: str, voice: str = None) -> bytes:
+    # Placeholder for Omnidimension SDK integration
+    # In a real scenario, you would use Omnidimension's TTS API here:
+    # from omnidimension_sdk import TTS
+    # tts_client = TTS(api_key="YOUR_OMNIDIMENSION_API_KEY") # You'd get this key
+    # return tts_client.synthesize_speech(text, voice=voice)
+    return f"Simulated audio content for: '{text}' (Omnidimension)".encode("utf-8") # Simulation without the SDK
+
+_ENGINES = {"pyttsx3": _synthesize_pyttsx3, "omnidimension": _synthesize_omnidimension}
+SUPPORTED_ENGINES = tuple(_ENGINES)
+
+class AudioCache:
+    """
+    Content-addressed on-disk cache of synthesized audio with size-bounded LRU eviction.
 
-def convert_text_to_audio(text: str, engine_type: str = "pyttsx3", output_file: str = None):
+    Files are named by the SHA-256 of engine + voice + text, so identical sentences are
+    only synthesized once across answers, restarts and workers. The directory itself is
+    the index: a hit refreshes the file's modification time, and every store rescans the
+    directory under an fcntl lock and deletes the least recently used files once it has
+    grown past max_bytes, counting what every worker has written.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = None  # File count and bytes seen by the last scan; None before the first one
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(text: str, engine_type: str, voice: str = None) -> str:
+        return hashlib.sha256(f"{engine_type}\0{voice or ''}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + AUDIO_SUFFIX)
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serializes eviction between workers (a no-op where fcntl is unavailable)."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _scan(self) -> list:
+        """Returns (mtime, path, size) of every cached file, least recently used first."""
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(AUDIO_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # Evicted by another worker meanwhile
+                        continue
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        return files
+
+    def get(self, key: str):
+        """Returns the cached audio for key, or None."""
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key))  # Marks it recently used for every worker's eviction scan
+        except FileNotFoundError:
+            audio = None
+        with self._lock:
+            self.stats["hits" if audio is not None else "misses"] += 1
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        """Stores audio under key (atomically) and evicts least recently used files over the size bound."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        path = self._path(key)
+        os.replace(tmp_path, path)
+        evicted = 0
+        with self._directory_lock():
+            files = self._scan()
+            total = sum(size for _, _, size in files)
+            for _, old_path, size in files:
+                if total <= self.max_bytes or len(files) - evicted <= 1:
+                    break
+                if old_path == path:
+                    continue  # Never evict what was just stored
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+        with self._lock:
+            self.stats["evictions"] += evicted
+            self._files, self._bytes = len(files) - evicted, total
+
+    def get_stats(self) -> dict:
+        """Returns hit/miss/eviction counters and the file count and size at the last store."""
+        with self._lock:
+            if self._files is None and os.path.isdir(self.directory):
+                files = self._scan()
+                self._files, self._bytes = len(files), sum(size for _, _, size in files)
+            return dict(self.stats, entries=self._files or 0, bytes=self._bytes)
+
+# Shared by every synthesis call
+audio_cache = AudioCache()
+_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+registry.register_collector("tts_cache_events_total", "counter", "TTS audio cache hits, misses and evictions.",
+                            stats_collector(audio_cache.get_stats, ("hits", "misses", "evictions")))
+registry.register_collector("tts_cache_size", "gauge", "Cached TTS audio files and bytes.",
+                            stats_collector(audio_cache.get_stats, ("entries", "bytes")))
+
+def synthesize_sentence(text: str, engine_type: str = TTS_ENGINE, voice: str = None) -> bytes:
+    """
+    Returns the audio for one sentence, from the cache when it was synthesized before.
+
+    Raises:
+        ValueError: If engine_type is not supported.
+    """
+    if engine_type not in _ENGINES:
+        raise ValueError(f"Unsupported engine type: {engine_type}")
+    key = AudioCache.key(text, engine_type, voice)
+    audio = audio_cache.get(key)
+    if audio is None:
+        with _SYNTH_TIMER.time():
+            audio = _ENGINES[engine_type](text, voice)
+        audio_cache.put(key, audio)
+    return audio
+
+def stream_text_to_audio(text: str, engine_type: str = TTS_ENGINE, voice: str = None):
+    """
+    Synthesizes text sentence by sentence in the TTS thread pool and yields audio in order.
+
+    Every sentence is submitted up front, so later sentences render while earlier ones are
+    being played; the first segment is yielded as soon as it is ready.
+
+    Yields:
+        tuple: (sentence, audio bytes) for each sentence of text.
+    """
+    sentences = split_sentences(text)
+    futures = [_executor.submit(synthesize_sentence, sentence, engine_type, voice) for sentence in sentences]
+    try:
+        for sentence, future in zip(sentences, futures):
+            yield sentence, future.result()
+    finally:
+        for future in futures:
+            future.cancel()  # Consumer stopped early; skip sentences that have not started
+
+def join_wav(segments: list) -> bytes:
+    """
+    Joins per-sentence WAV segments into one WAV file: the frames of every segment under a
+    single header, so players do not stop at the first segment's end.
+
+    Segments that are not WAV (the simulated engines' output) are concatenated as is.
+
+    Raises:
+        ValueError: If the segments differ in channels, sample width or sample rate.
+    """
+    if not segments or not all(segment[:4] == b"RIFF" for segment in segments):
+        return b"".join(segments)
+    out = io.BytesIO()
+    params = None
+    with wave.open(out, "wb") as writer:
+        for segment in segments:
+            with wave.open(io.BytesIO(segment), "rb") as reader:
+                layout = reader.getparams()[:3]  # Channels, sample width, sample rate
+                if params is None:
+                    params = layout
+                    writer.setparams(reader.getparams())
+                elif layout != params:
+                    raise ValueError(f"Cannot join WAV segments with different formats: {params} and {layout}")
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+def convert_text_to_audio(text: str, engine_type: str = "pyttsx3", output_file: str = None, voice: str = None):
     """
     Converts text to speech using the specified engine.
-    
+
     Args:
         text (str): The text to convert to speech.
         engine_type (str): 'omnidimension' or 'pyttsx3'. Defaults to 'pyttsx3'.
         output_file (str, optional): Path to save the audio file. If None, audio might be played directly.
+        voice (str, optional): Engine-specific voice id.
     """
-    if engine_type == "pyttsx3":
-        # if pyttsx3 is None:
-        #     print("pyttsx3 is not available. Cannot generate audio via pyttsx3.")
-        #     return
-        # engine = pyttsx3.init()
-        # if output_file:
-        #     engine.save_to_file(text, output_file)
-        #     engine.runAndWait()
-        #     print(f"Text converted to audio and saved to {output_file}")
-        # else:
-        #     engine.say(text)
-        #     engine.runAndWait()
-        #     print(f"Text '{text}' spoken using pyttsx3.")
-        print(f"Simulating pyttsx3 speaking: '{text}'") # Simulation for environments without pyttsx3
-        if output_file:
-            print(f"Simulated saving to: {output_file}")
-            # Create a dummy file to simulate output
-            with open(output_file, 'w') as f:
-                f.write(f"Simulated audio content for: '{text}' (pyttsx3)")
-
-    elif engine_type == "omnidimension":
-        # Placeholder for Omnidimension SDK integration
-        # In a real scenario, you would use Omnidimension's TTS API here:
-        # try:
-        #     from omnidimension_sdk import TTS
-        #     tts_client = TTS(api_key="YOUR_OMNIDIMENSION_API_KEY") # You'd get this key
-        #     audio_data = tts_client.synthesize_speech(text)
-        #     if output_file:
-        #         with open(output_file, 'wb') as f:
-        #             f.write(audio_data)
-        #         print(f"Text converted to audio and saved to {output_file}")
-        #     else:
-        #         # Play audio_data (requires a playback library like simpleaudio or pyaudio)
-        #         print("Playing audio data (requires an audio playback library).")
-        # except ImportError:
-        #     print("Omnidimension SDK not installed. Cannot generate audio with Omnidimension.")
-        # except Exception as e:
-        #     print(f"Error using Omnidimension TTS: {e}")
-        print(f"Simulating Omnidimension speaking: '{text}'") # Simulation for environments without Omnidimension SDK
-        if output_file:
-            print(f"Simulated saving to: {output_file}")
-            # Create a dummy file to simulate output
-            with open(output_file, 'w') as f:
-                f.write(f"Simulated audio content for: '{text}' (Omnidimension)")
+    if engine_type not in _ENGINES:
+        print(f"Unsupported engine type: {engine_type}")
+        return
 
+    if output_file:
+        # Sentences are synthesized in parallel (and cached), then merged into one file
+        audio = join_wav([audio for _, audio in stream_text_to_audio(text, engine_type, voice)])
+        with open(output_file, 'wb') as f:
+            f.write(audio)
+        print(f"Text converted to audio and saved to {output_file}")
+    elif engine_type == "pyttsx3" and optional_import("pyttsx3") is not None:
+        with _pyttsx3_lock:
+            engine = optional_import("pyttsx3").init()
+            engine.say(text)
+            engine.runAndWait()
+        print(f"Text '{text}' spoken using pyttsx3.")
     else:
-        print(f"Unsupported engine type: {engine_type}")
+        print(f"Simulating {engine_type} speaking: '{text}'")
 
 if __name__ == '__main__':
     # Example usage:
@@ -71,6 +272,13 @@ if __name__ == '__main__':
     convert_text_to_audio("Here is your detailed answer.", output_file="answer.mp3")
     convert_text_to_audio("Let's begin the quiz!", engine_type="omnidimension", output_file="quiz_intro.wav")
 
+    # Sentence-level streaming; the second pass is served from the audio cache
+    answer = "Photosynthesis turns light into chemical energy. It happens in chloroplasts! Plants release oxygen."
+    for _ in range(2):
+        for sentence, audio in stream_text_to_audio(answer):
+            print(f"{len(audio):5d} bytes for: {sentence}")
+    print(f"TTS cache stats: {audio_cache.get_stats()}")
+
     # Clean up dummy files
     if os.path.exists("answer.mp3"):
         os.remove("answer.mp3")
@@ -0,0 +1,293 @@
+# write_behind.py
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+from utils.metrics import registry, stage_timer
+
+try:
+    import fcntl  # Spool files are locked by their owner so a restarting worker can find orphaned ones
+except ImportError:
+    fcntl = None  # Windows: entries wait in memory only (still drained on shutdown)
+
+logger = logging.getLogger(__name__)
+
+# Session logging settings, overridable from the environment. Entries are committed in one group
+# as soon as WRITE_BEHIND_BATCH are pending or the oldest has waited WRITE_BEHIND_DELAY seconds.
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "1") == "1"
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", 256))
+WRITE_BEHIND_DELAY = float(os.environ.get("WRITE_BEHIND_DELAY", 0.05))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", 10000))  # Producers wait beyond this
+WRITE_BEHIND_MAX_WAIT = float(os.environ.get("WRITE_BEHIND_MAX_WAIT", 5))  # ... then write through themselves
+WRITE_BEHIND_RETRY_MAX = 5.0  # Longest pause between attempts when a commit keeps failing
+SPOOL_SUFFIX = ".spool"
+
+_COMMIT_TIMER = stage_timer("write_behind_commit")
+_queues = weakref.WeakSet()
+
+class WriteBehindQueue:
+    """
+    Bounded queue that takes writes off the request path and commits them in groups.
+
+    submit() appends the entries to this process's spool file (a plain write, no fsync) and
+    returns; a background thread hands everything pending to the sink in one call, so a
+    burst of requests costs one transaction or one fsync. The spool is rotated at every
+    commit and deleted once the sink returns, so it only ever holds uncommitted entries.
+    Each spool file stays locked while its owner is alive; replay() commits the files of
+    processes that died before committing, which makes a worker crash lose nothing.
+    Durability is per process: the spool is never fsynced, so an OS crash or power loss can
+    drop the entries of the last delay seconds, as the stores' own batched syncs already can.
+
+    When max_pending entries are waiting, producers block for up to max_wait seconds and
+    then commit their own entries synchronously. A failed commit is retried with backoff
+    and its entries stay spooled. close() (run at exit) drains the queue.
+    """
+
+    def __init__(self, sink, spool_dir: str = None, contains=None, batch: int = WRITE_BEHIND_BATCH,
+                 delay: float = WRITE_BEHIND_DELAY, max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 max_wait: float = WRITE_BEHIND_MAX_WAIT):
+        """
+        Args:
+            sink: Callable committing a list of entries durably (e.g. a store's append_sessions).
+            spool_dir (str, optional): Directory for spool files; None keeps entries in memory only.
+            contains: Callable(entry) -> bool telling whether an entry is already committed, used by
+                      replay() to skip entries whose commit finished just before their owner died.
+            batch (int): Pending entries that trigger a commit without waiting for delay.
+            delay (float): Longest time, in seconds, an entry waits before its group is committed.
+            max_pending (int): Bound on queued entries.
+            max_wait (float): Seconds a producer waits for room before writing through.
+        """
+        self.sink = sink
+        self.spool_dir = spool_dir if fcntl is not None else None
+        self.contains = contains
+        self.batch = batch
+        self.delay = delay
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.stats = {"entries": 0, "commits": 0, "errors": 0, "write_through": 0, "replayed": 0}
+        self._reset()
+        _queues.add(self)
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        self._pending = []
+        self._oldest = None   # time.monotonic() when the oldest pending entry was queued
+        self._spool = None    # (path, file) receiving new entries
+        self._spooled = []    # Rotated spools whose entries are being committed
+        self._submitted = 0
+        self._committed = 0
+        self._flush_waiters = 0
+        self._closed = False
+        self._thread = None
+
+    def _ensure_started_locked(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _spool_locked(self, entries: list):
+        if self.spool_dir is None:
+            return
+        if self._spool is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = os.path.join(self.spool_dir, f"{os.getpid()}-{time.time_ns()}{SPOOL_SUFFIX}")
+            # Locked under a temporary name, so replay() never sees an unlocked live spool
+            f = open(path + ".tmp", "w", encoding="utf-8")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            os.replace(path + ".tmp", path)
+            self._spool = (path, f)
+        f = self._spool[1]
+        f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        f.flush()  # In the kernel: survives a crash of this process, not of the OS (no fsync)
+
+    def submit(self, entries: list) -> None:
+        """
+        Queues entries for the next group commit.
+
+        Blocks while the queue is full; after max_wait seconds (or once the queue is closed)
+        the entries are committed synchronously instead.
+        """
+        if not entries:
+            return
+        with self._cond:
+            self._ensure_started_locked()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) >= self.max_pending and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.stats["write_through"] += 1
+            else:
+                self._spool_locked(entries)
+                self._pending.extend(entries)
+                self._submitted += len(entries)
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                if len(self._pending) >= self.batch:
+                    self._cond.notify_all()
+                return
+        self.sink(entries)
+
+    def _due_locked(self) -> bool:
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.batch or self._flush_waiters > 0 or self._closed
+                or time.monotonic() - self._oldest >= self.delay)
+
+    def _run(self):
+        backoff = max(self.delay, 0.05)
+        while True:
+            with self._cond:
+                while not self._due_locked():
+                    if self._closed and not self._pending:
+                        return
+                    timeout = None if self._oldest is None else self._oldest + self.delay - time.monotonic()
+                    self._cond.wait(None if timeout is None else max(timeout, 0.001))
+                batch, self._pending, self._oldest = self._pending, [], None
+                if self._spool is not None:
+                    self._spooled.append(self._spool)
+                    self._spool = None
+                self._cond.notify_all()  # Room for blocked producers
+            try:
+                with _COMMIT_TIMER.time():
+                    self.sink(batch)
+            except Exception as e:
+                with self._cond:
+                    self._pending[:0] = batch  # Retried first; the spool still holds them
+                    self._oldest = time.monotonic()
+                    self.stats["errors"] += 1
+                logger.warning("Committing %d queued sessions failed (%s); retrying in %.1fs.", len(batch), e, backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, WRITE_BEHIND_RETRY_MAX)
+                continue
+            backoff = max(self.delay, 0.05)
+            with self._cond:
+                spooled, self._spooled = self._spooled, []
+            for path, f in spooled:
+                os.remove(path)
+                f.close()  # Releases the lock only once the file is gone
+            with self._cond:
+                self._committed += len(batch)
+                self.stats["entries"] += len(batch)
+                self.stats["commits"] += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until everything submitted so far by this process is committed.
+
+        Args:
+            timeout (float, optional): Seconds to wait; defaults to max_wait.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self._cond:
+            target = self._submitted
+            if self._committed >= target:
+                return True
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._committed >= target,
+                                           self.max_wait if timeout is None else timeout)
+            finally:
+                self._flush_waiters -= 1
+
+    def replay(self) -> int:
+        """
+        Commits the spool files left behind by processes that exited before committing them.
+
+        Returns:
+            int: Number of entries replayed.
+        """
+        if self.spool_dir is None:
+            return 0
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f"*{SPOOL_SUFFIX}"))):
+            try:
+                f = open(path, "r", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # Its owner is alive
+                try:
+                    if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue  # Replayed by another worker while we waited for the lock
+                entries = []
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Torn last line: that submit() never returned
+                if self.contains:
+                    # Checked one by one: a sink that is not transactional (e.g. the file log)
+                    # may have committed only part of the group before its owner died
+                    entries = [entry for entry in entries if not self.contains(entry)]
+                if entries:
+                    self.sink(entries)
+                    replayed += len(entries)
+                os.remove(path)
+        if replayed:
+            logger.info("Replayed %d uncommitted sessions from %s.", replayed, self.spool_dir)
+        with self._cond:
+            self.stats["replayed"] += replayed
+        return replayed
+
+    def close(self, timeout: float = 30.0):
+        """Stops accepting entries (later submits write through) and drains the queue."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            left = len(self._pending)
+        if left:
+            logger.warning("%d sessions were not committed; they are replayed from the spool on the next start.", left)
+
+    def get_stats(self) -> dict:
+        """Returns commit counters and the number of entries waiting."""
+        with self._cond:
+            return dict(self.stats, pending=len(self._pending))
+
+def _reset_after_fork():
+    # The child gets none of the parent's threads; its pending entries and spools stay the parent's
+    for write_queue in list(_queues):
+        write_queue._reset()
+
+def _drain_all():
+    for write_queue in list(_queues):
+        write_queue.close()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(_drain_all)
+
+def _collect():
+    totals = {}
+    for write_queue in list(_queues):
+        for name, value in write_queue.get_stats().items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+registry.register_collector("write_behind_events_total", "counter",
+                            "Sessions committed by the write-behind queue, commits, failed commits, "
+                            "write-throughs under backpressure and sessions replayed from spools.",
+                            lambda: {(("kind", key),): value for key, value in _collect().items() if key != "pending"})
+registry.register_collector("write_behind_pending", "gauge", "Sessions waiting for the next group commit.",
+                            lambda: {(): _collect().get("pending", 0)})